@@ -0,0 +1,241 @@
+# alert_rules.py
+
+import json
+import os
+import threading
+import time
+import numpy as np
+from frames import Frame
+
+# 规则可用的指标列：行情快照字段 + 多周期涨跌幅 + 持仓量变化 + 资金费率
+METRICS = (
+    "price", "change", "volume", "fundingRate",
+    "ema_7", "ema_25", "ema_99",
+    "change_1m", "change_2m", "change_5m", "change_20m", "change_40m", "change_1h",
+    "oi_change_5m", "oi_change_15m", "oi_change_1h",
+)
+
+ALERT_RULES_FILE = os.environ.get("ALERT_RULES_FILE", "")
+
+# 默认规则，对应 alerts.py 里原来写死的三个检查
+DEFAULT_RULES = [
+    {"id": "ema25_break", "when": [{"metric": "price", "op": ">", "ref": "ema_25"}],
+     "message": "{symbol} 突破 EMA25"},
+    {"id": "price_change_3pct", "when": [{"metric": "change", "op": "abs>=", "value": 3.0}],
+     "message": "{symbol} 涨跌幅超过 3.0%"},
+    {"id": "oi_surge_5m", "when": [{"metric": "oi_change_5m", "op": ">=", "value": 15.0}],
+     "message": "{symbol} 5分钟持仓量增加超过 15%"},
+]
+
+_OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "abs>": lambda a, b: np.greater(np.abs(a), b),
+    "abs>=": lambda a, b: np.greater_equal(np.abs(a), b),
+}
+_CROSS_OPS = ("cross_above", "cross_below")
+
+
+class RuleError(ValueError):
+    pass
+
+
+# ✅ 把行情快照转换成 指标×币种 的矩阵，缺失值为 NaN；列式快照直接按列堆叠
+def build_metric_frame(rows, metrics=METRICS):
+    if isinstance(rows, Frame):
+        if not len(rows):
+            return [], np.full((len(metrics), 0), np.nan)
+        return rows.symbols, np.vstack([rows.get(name) for name in metrics])
+    symbols = [row["symbol"] for row in rows]
+    matrix = np.full((len(metrics), len(rows)), np.nan)
+    for j, row in enumerate(rows):
+        for i, name in enumerate(metrics):
+            value = row.get(name)
+            if value is not None:
+                matrix[i, j] = value
+    return symbols, matrix
+
+
+# ✅ 规则编译结果：条件去重后分组，同一 (指标, 运算符) 的所有阈值一次广播比较
+class CompiledRules:
+    def __init__(self, rules, metrics=METRICS):
+        self.rules = rules
+        self.metric_index = {name: i for i, name in enumerate(metrics)}
+        conditions = []
+        cond_ids = {}
+        incidence = []
+        for rule in rules:
+            if not rule.get("id") or not rule.get("when"):
+                raise RuleError(f"规则缺少 id 或 when: {rule}")
+            row = []
+            for cond in rule["when"]:
+                key = self._condition_key(cond)
+                if key not in cond_ids:
+                    cond_ids[key] = len(conditions)
+                    conditions.append(key)
+                row.append(cond_ids[key])
+            incidence.append(row)
+
+        self.conditions = conditions
+        self.incidence = np.zeros((len(rules), len(conditions)), dtype=np.int32)
+        for r, row in enumerate(incidence):
+            self.incidence[r, row] = 1
+        self.required = np.array([
+            1 if rule.get("mode", "all") == "any" else self.incidence[r].sum()
+            for r, rule in enumerate(rules)
+        ])
+
+        # 常量阈值条件按 (指标, 运算符) 分组，穿越类与引用另一指标的条件单独处理
+        groups = {}
+        self.cross_conditions = []
+        for c, (metric, op, kind, rhs) in enumerate(conditions):
+            if op in _CROSS_OPS:
+                self.cross_conditions.append((c, self.metric_index[metric], op, kind, rhs))
+            elif kind == "value":
+                idx, values = groups.setdefault((metric, op), ([], []))
+                idx.append(c)
+                values.append(rhs)
+        self.value_groups = [
+            (self.metric_index[metric], _OPS[op], np.array(idx), np.array(values, dtype=float)[:, None])
+            for (metric, op), (idx, values) in groups.items()
+        ]
+        self.ref_conditions = [
+            (c, self.metric_index[metric], _OPS[op], self.metric_index[rhs])
+            for c, (metric, op, kind, rhs) in enumerate(conditions)
+            if kind == "ref" and op not in _CROSS_OPS
+        ]
+
+    def _condition_key(self, cond):
+        metric, op = cond.get("metric"), cond.get("op")
+        if metric not in self.metric_index:
+            raise RuleError(f"未知指标: {metric}")
+        if op not in _OPS and op not in _CROSS_OPS:
+            raise RuleError(f"未知运算符: {op}")
+        if "ref" in cond:
+            if cond["ref"] not in self.metric_index:
+                raise RuleError(f"未知指标: {cond['ref']}")
+            return metric, op, "ref", cond["ref"]
+        if "value" not in cond:
+            raise RuleError(f"条件缺少 value 或 ref: {cond}")
+        return metric, op, "value", float(cond["value"])
+
+    def evaluate_conditions(self, matrix, prev_matrix=None):
+        """
+        返回 条件×币种 的布尔矩阵；NaN 比较结果为 False
+        """
+        result = np.zeros((len(self.conditions), matrix.shape[1]), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for metric, fn, idx, values in self.value_groups:
+                result[idx] = fn(matrix[metric][None, :], values)
+            for c, metric, fn, ref in self.ref_conditions:
+                result[c] = fn(matrix[metric], matrix[ref])
+            if prev_matrix is not None:
+                # 穿越需要上一轮的数据：上一轮在下方/上方，本轮在上方/下方
+                for c, metric, op, kind, rhs in self.cross_conditions:
+                    if kind == "ref":
+                        ref = self.metric_index[rhs]
+                        now_diff = matrix[metric] - matrix[ref]
+                        prev_diff = prev_matrix[metric] - prev_matrix[ref]
+                    else:
+                        now_diff = matrix[metric] - rhs
+                        prev_diff = prev_matrix[metric] - rhs
+                    if op == "cross_above":
+                        result[c] = (prev_diff <= 0) & (now_diff > 0)
+                    else:
+                        result[c] = (prev_diff >= 0) & (now_diff < 0)
+        return result
+
+    def evaluate(self, matrix, prev_matrix=None):
+        """
+        返回 规则×币种 的命中矩阵
+        """
+        conditions = self.evaluate_conditions(matrix, prev_matrix)
+        counts = self.incidence @ conditions.astype(np.int32)
+        return counts >= self.required[:, None]
+
+
+# ✅ 告警规则引擎：一次遍历评估所有规则，维护每条规则每个币种的冷却和去重状态
+class AlertEngine:
+    def __init__(self, rules=None, metrics=METRICS):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self.load_rules(rules if rules is not None else DEFAULT_RULES)
+
+    def load_rules(self, rules):
+        compiled = CompiledRules(rules, self.metrics)
+        with self._lock:
+            self.compiled = compiled
+            self.cooldowns = np.array([float(r.get("cooldown", 0)) for r in rules])
+            self.edge_only = np.array([not r.get("repeat", True) for r in rules])
+            self.symbols = []
+            self.prev_matrix = None
+            self.prev_hits = None
+            self.last_fired = None
+
+    def _align(self, symbols):
+        """
+        币种列表变化时，把上一轮的状态按 symbol 对齐到新的列顺序
+        """
+        if symbols == self.symbols and self.last_fired is not None:
+            return
+        n_rules = len(self.compiled.rules)
+        old = {s: j for j, s in enumerate(self.symbols)}
+        cols = np.array([old.get(s, -1) for s in symbols], dtype=int)
+        known = cols >= 0
+
+        def remap(arr, fill, rows, dtype):
+            out = np.full((rows, len(symbols)), fill, dtype=dtype)
+            if arr is not None and known.any():
+                out[:, known] = arr[:, cols[known]]
+            return out
+
+        self.last_fired = remap(self.last_fired, -np.inf, n_rules, float)
+        self.prev_hits = remap(self.prev_hits, False, n_rules, bool)
+        if self.prev_matrix is not None:
+            self.prev_matrix = remap(self.prev_matrix, np.nan, len(self.metrics), float)
+        self.symbols = list(symbols)
+
+    def evaluate(self, rows, now=None):
+        """
+        rows: 指标快照（Frame 或每个币种一条的指标字典列表）；返回本轮新触发的告警
+        """
+        now = now or time.time()
+        symbols, matrix = build_metric_frame(rows, self.metrics)
+        with self._lock:
+            self._align(symbols)
+            hits = self.compiled.evaluate(matrix, self.prev_matrix)
+            fire = hits & (now - self.last_fired >= self.cooldowns[:, None])
+            fire &= ~(self.edge_only[:, None] & self.prev_hits)
+            self.last_fired = np.where(fire, now, self.last_fired)
+            self.prev_hits = hits
+            self.prev_matrix = matrix
+
+        alerts = []
+        rule_idx, sym_idx = np.nonzero(fire)
+        for r, j in zip(rule_idx.tolist(), sym_idx.tolist()):
+            rule = self.compiled.rules[r]
+            row = rows.row(j) if isinstance(rows, Frame) else rows[j]
+            alerts.append({
+                "rule": rule["id"],
+                "symbol": symbols[j],
+                "message": rule.get("message", "{symbol} 触发 " + rule["id"]).format_map(_MessageFields(row)),
+            })
+        return alerts
+
+
+class _MessageFields(dict):
+    # 告警文案里引用了不存在的字段时保留原样，不抛异常
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def load_rules_file(path=ALERT_RULES_FILE):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+alert_engine = AlertEngine(load_rules_file())
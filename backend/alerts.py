@@ -1,25 +1,26 @@
+from frames import as_frame
+
+
 def check_ema_alerts(data):
-    alerts = []
-    for item in data:
-        if item["price"] > item["ema25"]:
-            alerts.append(f"{item['symbol']} 突破 EMA25")
-    return alerts
+    frame = as_frame(data, ("price", "ema25"))
+    mask = frame.get("price") > frame.get("ema25")
+    symbols = frame.symbols
+    return [f"{symbols[j]} 突破 EMA25" for j in mask.nonzero()[0]]
 
 def check_price_change_alerts(data, threshold=3.0):
-    alerts = []
-    for item in data:
-        if abs(item["change"]) >= threshold:
-            alerts.append(f"{item['symbol']} 涨跌幅超过 {threshold}%")
-    return alerts
+    frame = as_frame(data, ("change",))
+    mask = abs(frame.get("change")) >= threshold
+    symbols = frame.symbols
+    return [f"{symbols[j]} 涨跌幅超过 {threshold}%" for j in mask.nonzero()[0]]
 
 def check_open_interest_alerts(data, threshold=15.0):
-    alerts = []
-    for item in data:
-        change_5m = item.get("openInterestChange", {}).get("5m", 0)
-        if change_5m >= threshold:
-            alerts.append({
-                "symbol": item["symbol"],
-                "change_5m": change_5m,
-                "openInterest": item["openInterest"]
-            })
-    return alerts
+    frame = as_frame(data, ("openInterest", "openInterestChange.5m"))
+    change_5m = frame.get("openInterestChange.5m")
+    mask = change_5m >= threshold
+    open_interest = frame.get("openInterest")
+    symbols = frame.symbols
+    return [{
+        "symbol": symbols[j],
+        "change_5m": float(change_5m[j]),
+        "openInterest": float(open_interest[j])
+    } for j in mask.nonzero()[0]]
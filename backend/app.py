@@ -1,154 +1,215 @@
-from flask import Flask, jsonify
-from flask_cors import CORS
-from binance_api import fetch_all_data, get_open_interest_data
-from indicators import append_ema
-from alerts import check_ema_alerts, check_price_change_alerts, check_open_interest_alerts
-from database import save_data, get_latest_data, get_price_change
-from db import save_price_bulk, create_tables, SessionLocal, OpenInterest
-import asyncio
+# app.py
+# Flask 部署模式。导入本模块没有副作用：应用由 create_app() 创建，抓取模块、数据库和定时任务
+# 都在后台预热线程里首次导入 / 启动，端口在进程启动后几百毫秒内即可响应。启动方式：
+#   python app.py                       （开发 / 单进程）
+#   gunicorn "app:create_app()"         （生产）
+
+import atexit
+import functools
 import os
-import time
+from flask import Blueprint, Flask, Response, current_app, jsonify, request
+from flask_cors import CORS
+from startup import profile, warmup, load_config
 
-from apscheduler.schedulers.background import BackgroundScheduler
+api = Blueprint("api", __name__)
 
-app = Flask(__name__)
-CORS(app)
 
-# ✅ 定时任务：更新价格数据
-def update_price_data():
-    try:
-        print("📈 正在抓取价格数据...")
-        start = time.time()
-        price_data = fetch_all_data()
-        db_data = [{
-            "symbol": item["symbol"],
-            "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
-            "price": item["price"]
-        } for item in price_data]
-        save_price_bulk(db_data)
-        print(f"✅ 价格数据已保存，用时 {time.time() - start:.2f}s")
-    except Exception as e:
-        print("❌ 价格数据保存失败:", e)
+# ✅ 预热：首次导入抓取相关模块（SQLAlchemy / numpy / APScheduler 等）、建表、回填缓存，最后启动定时任务。
+#    只在后台线程里执行一次，请求线程不会被阻塞
+def _warm(config):
+    with profile.phase("imports"):
+        import ingestion
+    if not config["START_INGESTION"]:
+        return
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from db import create_tables
+    with profile.phase("create_tables"):
+        create_tables()
+    with profile.phase("hydrate"):
+        ingestion.hydrate()
+    with profile.phase("scheduler"):
+        scheduler = BackgroundScheduler()
+        if ingestion.start(scheduler):
+            atexit.register(ingestion.stop, scheduler)
 
-# ✅ 定时任务：更新持仓量数据（自动保存）
-open_interest_lock = asyncio.Lock()
-async def safe_get_open_interest():
-    async with open_interest_lock:
-        await get_open_interest_data()
 
-def update_open_interest_data():
-    try:
-        print("📊 正在抓取持仓量数据...")
-        start = time.time()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(safe_get_open_interest())
-        loop.close()
-        print(f"✅ 持仓量数据已抓取并保存，用时 {time.time() - start:.2f}s")
-    except Exception as e:
-        print("❌ 持仓量数据保存失败:", e)
+def create_app(config=None):
+    """
+    config: 覆盖 load_config() 读取的环境变量配置
+    """
+    config = load_config(config)
+    with profile.phase("create_app"):
+        app = Flask(__name__)
+        app.config.update(config)
+        CORS(app)
+        app.register_blueprint(api)
+
+        @app.after_request
+        def record_first_response(response):
+            if response.status_code == 200:
+                profile.mark("first_200")
+            return response
+
+    # ✅ 抓取 / 定时任务见 ingestion.py；多 worker 部署时只有选出的 leader 进程抓取和写库
+    warmup.start(lambda: _warm(config), background=config["BACKGROUND_WARMUP"] and config["START_INGESTION"])
+    profile.mark("app_created")
+    return app
 
-# ✅ 定时器启动
-scheduler = BackgroundScheduler()
-scheduler.add_job(update_price_data, 'interval', minutes=1, id='update_price_data', max_instances=1, coalesce=True)
-scheduler.add_job(update_open_interest_data, 'interval', minutes=1, id='update_open_interest_data', max_instances=1, coalesce=True)
-scheduler.start()
+
+def __getattr__(name):
+    # 兼容 `from app import app` / `app.app`：第一次访问时才创建应用
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(name)
+
+
+# ✅ 预热完成前数据接口返回 503 + Retry-After，不触发同步抓取
+def requires_warmup(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not warmup.ready:
+            response = jsonify(warmup.payload())
+            response.status_code = 503
+            response.headers["Retry-After"] = str(current_app.config["WARMUP_RETRY_AFTER"])
+            return response
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ✅ 带排序 / top-K / 过滤参数时只返回当前页（例如 ?sort=change.5m&limit=20），参数不合法返回 400；
+#    没有参数时返回 None，接口保持原来的完整响应
+def ranked(name, message="成功获取"):
+    from ingestion import ranked_response
+    from ranking import parse_query, cache_key
+    from response_cache import response_cache
+    try:
+        query = parse_query(name, request.args)
+    except ValueError as e:
+        return jsonify({"message": "参数错误", "error": str(e), "data": []}), 400
+    if query is None:
+        return None
+    version, build = ranked_response(name, query, message)
+    return response_cache.respond(cache_key(name, query), version, build)
 
 # ✅ 实时数据接口
-@app.route("/api/data", methods=["GET"])
+@api.route("/api/data", methods=["GET"])
+@requires_warmup
 def get_data():
+    from ingestion import market_snapshot
+    from response_cache import response_cache
     try:
-        raw_data = fetch_all_data()
-        data = append_ema(raw_data)
-        save_data(data)
-        alerts = {
-            "ema_alerts": check_ema_alerts(data),
-            "change_alerts": check_price_change_alerts(data)
-        }
-        return jsonify({"message": "成功获取", "data": data, "alerts": alerts})
+        response = ranked("data")
+        if response is not None:
+            return response
+        # 只读共享快照，不再每次请求都访问 Binance 和写库；同一版本的快照只序列化一次
+        version, snapshot = market_snapshot.get()
+        return response_cache.respond("data", version, lambda: {
+            "message": "成功获取", "data": snapshot["data"], "alerts": snapshot["alerts"]
+        })
     except Exception as e:
         print("❌ 数据抓取失败:", str(e))
         return jsonify({"message": "抓取失败", "data": [], "alerts": {}})
 
 # ✅ 历史数据接口
-@app.route("/api/history", methods=["GET"])
+@api.route("/api/history", methods=["GET"])
+@requires_warmup
 def get_history():
-    return jsonify(get_latest_data())
+    from database import get_latest_data
+    from response_cache import response_cache
+    # 数据来自数据库，每次重新查询，但仍然支持 ETag / 压缩
+    return response_cache.respond("history", None, get_latest_data)
 
 # ✅ 实时持仓量接口
-@app.route("/api/open_interest", methods=["GET"])
+@api.route("/api/open_interest", methods=["GET"])
+@requires_warmup
 def get_open_interest():
+    from alerts import check_open_interest_alerts
+    from open_interest_view import open_interest_view
+    from response_cache import response_cache
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(safe_get_open_interest())
-        loop.close()
-
-        session = SessionLocal()
-        records = session.query(OpenInterest).order_by(OpenInterest.timestamp.desc()).limit(100).all()
-        session.close()
-
-        data = [{
-            "symbol": r.symbol,
-            "open_interest": r.open_interest,
-            "change_pct": r.change_pct,
-            "timestamp": r.timestamp.isoformat()
-        } for r in records]
-
-        alerts = check_open_interest_alerts(data)
-        return jsonify({"message": "成功获取", "data": data, "alerts": alerts})
+        response = ranked("open_interest")
+        if response is not None:
+            return response
+        # 只读后台维护的最新视图，抓取完全由定时任务负责
+        version, data = open_interest_view.snapshot()
+        return response_cache.respond("open_interest", version, lambda: {
+            "message": "成功获取", "data": data, "alerts": check_open_interest_alerts(data)
+        })
     except Exception as e:
         print("❌ open_interest 接口错误:", e)
         return jsonify({"message": "获取失败", "error": str(e), "data": []}), 500
 
+# ✅ 跨交易所持仓量 / 资金费率聚合接口
+@api.route("/api/cross_venue", methods=["GET"])
+@requires_warmup
+def get_cross_venue():
+    from cross_venue import cross_venue_view
+    from response_cache import response_cache
+    try:
+        return response_cache.respond("cross_venue", cross_venue_view.version, lambda: dict(
+            cross_venue_view.payload(), message="成功获取"
+        ))
+    except Exception as e:
+        print("❌ cross_venue 接口错误:", e)
+        return jsonify({"message": "获取失败", "error": str(e), "data": []}), 500
+
 # ✅ 涨跌幅接口
-@app.route("/api/price_change", methods=["GET"])
+@api.route("/api/price_change", methods=["GET"])
+@requires_warmup
 def get_price_change_api():
+    from ingestion import price_change_snapshot
+    from response_cache import response_cache
     try:
-        current_data = fetch_all_data()
-        result = []
-
-        for item in current_data:
-            symbol = item['symbol']
-            current_price = item['price']
-            price_1m = get_price_change(symbol, 1)
-            price_2m = get_price_change(symbol, 2)
-            price_5m = get_price_change(symbol, 5)
-            price_20m = get_price_change(symbol, 20)
-            price_40m = get_price_change(symbol, 40)
-            price_1h = get_price_change(symbol, 60)
-
-            def change(old):
-                if not old or old == 0:
-                    return 0
-                return round((current_price - old) / old * 100, 2)
-
-            result.append({
-                "symbol": symbol,
-                "price": current_price,
-                "change": {
-                    "1m": change(price_1m),
-                    "2m": change(price_2m),
-                    "5m": change(price_5m),
-                    "20m": change(price_20m),
-                    "40m": change(price_40m),
-                    "1h": change(price_1h),
-                }
-            })
-
-        return jsonify({"message": "成功", "data": result})
+        response = ranked("price_change", "成功")
+        if response is not None:
+            return response
+        version, data = price_change_snapshot()
+        return response_cache.respond("price_change", version, lambda: {"message": "成功", "data": data})
     except Exception as e:
         print("❌ 涨跌幅接口错误:", str(e))
         return jsonify({"message": "失败", "error": str(e)})
 
+# ✅ 实时推送接口（SSE）：每轮定时任务推送一次快照和新告警，替代前端 30 秒轮询
+@api.route("/api/stream", methods=["GET"])
+@requires_warmup
+def stream():
+    from broadcaster import broadcaster
+    try:
+        events = broadcaster.stream()
+    except OverflowError as e:
+        return jsonify({"message": "订阅失败", "error": str(e)}), 503
+    return Response(events, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+# ✅ Prometheus 指标
+@api.route("/metrics")
+def metrics():
+    from metrics import registry, CONTENT_TYPE
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
 # ✅ 首页测试
-@app.route('/')
+@api.route('/')
 def index():
     return "Hello from Render!"
 
+# ✅ 健康检查：进程能响应即返回 200，预热状态放在响应体里
+@api.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok", "warmup": warmup.state})
+
+# ✅ 调试接口：启动耗时（各阶段耗时、首个 200 响应、预热完成时间，均相对进程启动）
+@api.route("/debug/startup")
+def debug_startup():
+    return jsonify(dict(profile.report(), warmup=warmup.state, error=warmup.error))
+
 # ✅ 调试接口：持仓量数据
-@app.route("/debug/oi")
+@api.route("/debug/oi")
+@requires_warmup
 def debug_oi():
+    from db import SessionLocal, OpenInterest
     session = SessionLocal()
     results = session.query(OpenInterest).order_by(OpenInterest.timestamp.desc()).limit(5).all()
     session.close()
@@ -161,10 +222,47 @@ def debug_oi():
         } for r in results
     ])
 
-# ✅ 启动入口
+# ✅ 调试接口：合约注册表状态
+@api.route("/debug/symbols")
+@requires_warmup
+def debug_symbols():
+    from symbol_registry import symbol_registry
+    return jsonify(dict(symbol_registry.stats, contracts=len(symbol_registry), active=len(symbol_registry.symbols()), age=symbol_registry.age))
+
+# ✅ 调试接口：当前进程是否为抓取 leader
+@api.route("/debug/leader")
+@requires_warmup
+def debug_leader():
+    from leader import leader
+    from shared_snapshot import shared_snapshot
+    return jsonify({
+        "pid": os.getpid(), "leader": leader.is_leader, "mode": leader.mode,
+        "shared_snapshot": dict(shared_snapshot.stats, path=shared_snapshot.path),
+    })
+
+# ✅ 调试接口：异步落库队列状态（队列深度、最近一次落库耗时、写入速率）
+@api.route("/debug/writer")
+@requires_warmup
+def debug_writer():
+    from write_behind import write_behind
+    return jsonify(write_behind.snapshot_stats())
+
+# ✅ 调试接口：响应缓存命中情况
+@api.route("/debug/responses")
+@requires_warmup
+def debug_responses():
+    from response_cache import response_cache
+    return jsonify(response_cache.stats)
+
+@api.route("/debug/scheduler")
+@requires_warmup
+def debug_scheduler():
+    import ingestion
+    from scheduling import schedule_stats
+    return jsonify({"jobs": schedule_stats.stats, "open_interest": ingestion.oi_planner.stats})
+
+# ✅ 启动入口：先监听端口，建表 / 回填 / 定时任务都在后台预热；
+#    不使用 debug 重载器，否则模块会被导入两次、定时任务启动两份
 if __name__ == '__main__':
-    create_tables()
-    update_price_data()
-    update_open_interest_data()
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    config = load_config()
+    create_app().run(host='0.0.0.0', port=config["PORT"], debug=config["DEBUG"], use_reloader=False)
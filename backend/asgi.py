@@ -0,0 +1,320 @@
+# asgi.py
+# ASGI 部署模式：与 app.py 相同的接口地址，路由全部为异步实现，
+# 抓取任务与请求共用同一个事件循环。启动方式：
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+# 多个 worker 时由 leader 选举保证只有一个进程抓取和写库。
+# 与 app.py 一样，导入本模块只加载 Starlette：抓取相关模块、数据库回填和定时任务都在 lifespan 启动的
+# 后台预热任务里完成，预热期间数据接口返回 503 + Retry-After。
+
+import asyncio
+import functools
+import os
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from startup import profile, warmup, load_config
+
+config = load_config()
+
+
+def json_response(data, status_code=200):
+    from response_cache import dumps
+    return Response(dumps(data), status_code=status_code, media_type="application/json")
+
+
+def cached_response(request, name, version, build):
+    from response_cache import response_cache
+    cached = response_cache.get(name, version, build)
+    status, headers, body = response_cache.negotiate(
+        cached, request.headers.get("if-none-match"), request.headers.get("accept-encoding")
+    )
+    return Response(body, status_code=status, headers=headers)
+
+
+# ✅ 预热完成前数据接口返回 503 + Retry-After，不触发同步抓取
+def requires_warmup(view):
+    @functools.wraps(view)
+    async def wrapper(request):
+        if not warmup.ready:
+            return JSONResponse(warmup.payload(), status_code=503, headers={
+                "Retry-After": str(config["WARMUP_RETRY_AFTER"]),
+            })
+        return await view(request)
+    return wrapper
+
+
+# ✅ 带排序 / top-K / 过滤参数时只返回当前页，参数不合法返回 400；没有参数时返回 None
+def ranked(request, name, message="成功获取"):
+    from ingestion import ranked_response
+    from ranking import parse_query, cache_key
+    try:
+        query = parse_query(name, request.query_params)
+    except ValueError as e:
+        return json_response({"message": "参数错误", "error": str(e), "data": []}, 400)
+    if query is None:
+        return None
+    version, build = ranked_response(name, query, message)
+    return cached_response(request, cache_key(name, query), version, build)
+
+
+# ✅ 实时数据接口
+@requires_warmup
+async def get_data(request):
+    from ingestion import market_snapshot
+    try:
+        # 索引重建时可能触发快照加载（同步 REST），放到线程池里执行
+        response = await run_in_threadpool(ranked, request, "data")
+        if response is not None:
+            return response
+        # 快照过期时 loader 会走同步 REST，放到线程池里执行；版本号和快照一起返回
+        version, snapshot = await run_in_threadpool(market_snapshot.get)
+        return cached_response(request, "data", version, lambda: {
+            "message": "成功获取", "data": snapshot["data"], "alerts": snapshot["alerts"]
+        })
+    except Exception as e:
+        print("❌ 数据抓取失败:", str(e))
+        return json_response({"message": "抓取失败", "data": [], "alerts": {}})
+
+
+# ✅ 历史数据接口（异步连接池）
+@requires_warmup
+async def get_history(request):
+    import async_db
+    data = await async_db.get_latest_data()
+    return cached_response(request, "history", None, lambda: data)
+
+
+# ✅ 实时持仓量接口
+@requires_warmup
+async def get_open_interest(request):
+    from alerts import check_open_interest_alerts
+    from open_interest_view import open_interest_view
+    try:
+        response = ranked(request, "open_interest")
+        if response is not None:
+            return response
+        version, data = open_interest_view.snapshot()
+        return cached_response(request, "open_interest", version, lambda: {
+            "message": "成功获取", "data": data, "alerts": check_open_interest_alerts(data)
+        })
+    except Exception as e:
+        print("❌ open_interest 接口错误:", e)
+        return json_response({"message": "获取失败", "error": str(e), "data": []}, 500)
+
+
+# ✅ 跨交易所持仓量 / 资金费率聚合接口
+@requires_warmup
+async def get_cross_venue(request):
+    from cross_venue import cross_venue_view
+    try:
+        return cached_response(request, "cross_venue", cross_venue_view.version, lambda: dict(
+            cross_venue_view.payload(), message="成功获取"
+        ))
+    except Exception as e:
+        print("❌ cross_venue 接口错误:", e)
+        return json_response({"message": "获取失败", "error": str(e), "data": []}, 500)
+
+
+# ✅ 涨跌幅接口
+@requires_warmup
+async def get_price_change_api(request):
+    from ingestion import price_change_snapshot
+    try:
+        response = ranked(request, "price_change", "成功")
+        if response is not None:
+            return response
+        version, data = price_change_snapshot()
+        return cached_response(request, "price_change", version, lambda: {"message": "成功", "data": data})
+    except Exception as e:
+        print("❌ 涨跌幅接口错误:", str(e))
+        return json_response({"message": "失败", "error": str(e)})
+
+
+# ✅ 实时推送接口（SSE）：异步生成器，等待期间不占用线程
+@requires_warmup
+async def stream(request):
+    from broadcaster import broadcaster
+    try:
+        events = broadcaster.astream()
+    except OverflowError as e:
+        return json_response({"message": "订阅失败", "error": str(e)}, 503)
+    return StreamingResponse(events, media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# ✅ Prometheus 指标
+async def metrics(request):
+    from metrics import registry, CONTENT_TYPE
+    return Response(registry.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def index(request):
+    return PlainTextResponse("Hello from Render!")
+
+
+# ✅ 健康检查：进程能响应即返回 200，预热状态放在响应体里
+async def healthz(request):
+    return JSONResponse({"status": "ok", "warmup": warmup.state})
+
+
+# ✅ 启动耗时：各阶段耗时、首个 200 响应、预热完成时间（相对进程启动）
+async def debug_startup(request):
+    return JSONResponse(dict(profile.report(), warmup=warmup.state, error=warmup.error))
+
+
+@requires_warmup
+async def debug_oi(request):
+    import async_db
+    return json_response(await async_db.get_recent_open_interest())
+
+
+@requires_warmup
+async def debug_symbols(request):
+    from symbol_registry import symbol_registry
+    return json_response(dict(
+        symbol_registry.stats, contracts=len(symbol_registry),
+        active=len(symbol_registry.symbols()), age=symbol_registry.age,
+    ))
+
+
+@requires_warmup
+async def debug_leader(request):
+    from leader import leader
+    from shared_snapshot import shared_snapshot
+    return json_response({
+        "pid": os.getpid(), "leader": leader.is_leader, "mode": leader.mode,
+        "shared_snapshot": dict(shared_snapshot.stats, path=shared_snapshot.path),
+    })
+
+
+@requires_warmup
+async def debug_writer(request):
+    from write_behind import write_behind
+    return json_response(write_behind.snapshot_stats())
+
+
+@requires_warmup
+async def debug_responses(request):
+    from response_cache import response_cache
+    return json_response(response_cache.stats)
+
+
+@requires_warmup
+async def debug_scheduler(request):
+    import ingestion
+    from scheduling import schedule_stats
+    return json_response({"jobs": schedule_stats.stats, "open_interest": ingestion.oi_planner.stats})
+
+
+# ✅ 预热：在线程池里导入抓取模块并回填缓存，定时任务在事件循环上启动（AsyncIOScheduler 需要在循环线程里调度）
+async def _warm(scheduler_box):
+    def prepare():
+        with profile.phase("imports"):
+            import ingestion
+        if config["START_INGESTION"]:
+            with profile.phase("hydrate"):
+                ingestion.hydrate()
+
+    await run_in_threadpool(prepare)
+    if not config["START_INGESTION"]:
+        return
+    import ingestion
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    with profile.phase("scheduler"):
+        scheduler = AsyncIOScheduler(event_loop=asyncio.get_running_loop())
+        if ingestion.start(scheduler):
+            scheduler_box.append(scheduler)
+
+
+# ✅ 生命周期：后台事件循环直接复用服务器的循环，定时任务改用 AsyncIOScheduler；
+#    预热作为后台任务运行，不阻塞服务器开始接受请求
+@asynccontextmanager
+async def lifespan(app):
+    from background_loop import background_loop
+    background_loop.attach(asyncio.get_running_loop())
+    schedulers = []
+    task = asyncio.create_task(warmup.run_async(lambda: _warm(schedulers)))
+    profile.mark("app_created")
+    try:
+        yield
+    finally:
+        task.cancel()
+        await _shutdown(schedulers)
+
+
+async def _shutdown(schedulers):
+    import async_db
+    import ingestion
+    from binance_fetcher import close_fetcher
+    from leader import leader
+    from write_behind import write_behind
+    ingestion.market_stream.stop()
+    for scheduler in schedulers:
+        scheduler.shutdown(wait=False)
+    await close_fetcher()
+    await run_in_threadpool(write_behind.stop)
+    leader.release()
+    await async_db.async_engine.dispose()
+
+
+class _RecordFirstResponse:
+    """
+    记录第一个 200 响应相对进程启动的时间
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_200" in profile.marks:
+            return await self.app(scope, receive, send)
+
+        async def record(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                profile.mark("first_200")
+            await send(message)
+        await self.app(scope, receive, record)
+
+
+routes = [
+    Route("/api/data", get_data),
+    Route("/api/history", get_history),
+    Route("/api/open_interest", get_open_interest),
+    Route("/api/cross_venue", get_cross_venue),
+    Route("/api/price_change", get_price_change_api),
+    Route("/api/stream", stream),
+    Route("/metrics", metrics),
+    Route("/", index),
+    Route("/healthz", healthz),
+    Route("/debug/startup", debug_startup),
+    Route("/debug/oi", debug_oi),
+    Route("/debug/symbols", debug_symbols),
+    Route("/debug/leader", debug_leader),
+    Route("/debug/writer", debug_writer),
+    Route("/debug/responses", debug_responses),
+    Route("/debug/scheduler", debug_scheduler),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"], allow_headers=["*"]),
+        Middleware(_RecordFirstResponse),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        "asgi:app",
+        host="0.0.0.0",
+        port=config["PORT"],
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+    )
@@ -0,0 +1,72 @@
+# async_db.py
+
+import os
+from sqlalchemy import desc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db import DATABASE_URL, PriceData, OpenInterest
+from metrics import instrument_engine
+
+ASYNC_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", 10))
+ASYNC_MAX_OVERFLOW = int(os.environ.get("ASYNC_DB_MAX_OVERFLOW", 10))
+
+
+def async_url(url):
+    """
+    把同步连接串换成异步驱动：PostgreSQL -> asyncpg，SQLite -> aiosqlite
+    """
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
+def _engine_options(url):
+    if url.startswith("sqlite"):
+        return {}
+    return {"pool_size": ASYNC_POOL_SIZE, "max_overflow": ASYNC_MAX_OVERFLOW, "pool_pre_ping": True}
+
+
+# ✅ ASGI 模式下请求路径使用的异步连接池，与抓取 / 落库使用的同步引擎互不占用
+async_engine = create_async_engine(async_url(DATABASE_URL), **_engine_options(DATABASE_URL))
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+
+# ✅ 与 database.get_latest_data 结构相同
+async def get_latest_data(limit=100):
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                PriceData.__table__.select().order_by(desc(PriceData.timestamp)).limit(limit)
+            )
+            return [
+                {
+                    "symbol": row.symbol,
+                    "price": row.price,
+                    "ema_7": row.ema_7,
+                    "ema_25": row.ema_25,
+                    "ema_99": row.ema_99,
+                    "timestamp": row.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+                }
+                for row in result
+            ]
+    except Exception as e:
+        print("❌ 查询历史数据失败:", e)
+        return []
+
+
+async def get_recent_open_interest(limit=5):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            OpenInterest.__table__.select().order_by(desc(OpenInterest.timestamp)).limit(limit)
+        )
+        return [
+            {
+                "symbol": r.symbol,
+                "oi": r.open_interest,
+                "change": r.change_pct,
+                "ts": r.timestamp.isoformat()
+            } for r in result
+        ]
@@ -0,0 +1,76 @@
+# background_loop.py
+
+import asyncio
+import threading
+
+
+# ✅ 常驻后台事件循环：持仓量抓取、行情订阅等异步任务都跑在同一个循环上，
+#    共享的 AsyncClient / asyncio.Lock 因此始终绑定同一个循环
+class BackgroundLoop:
+    def __init__(self, name="background-loop"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._attached = False
+
+    def attach(self, loop):
+        """
+        ASGI 模式：直接复用服务器的事件循环，不再单独起线程
+        """
+        with self._start_lock:
+            self.loop = loop
+            self._attached = True
+
+    def start(self):
+        with self._start_lock:
+            if self._attached:
+                return self.loop
+            if self._thread and self._thread.is_alive():
+                return self.loop
+            self._started.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        self._started.wait()
+        return self.loop
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, coro):
+        """
+        从任意线程提交协程，返回 concurrent.futures.Future
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """
+        同步等待协程结果（供 APScheduler 的线程任务调用）
+        """
+        return self.submit(coro).result(timeout)
+
+    def stop(self, cleanup=None):
+        """
+        cleanup: 停止前在循环内执行的协程函数，例如关闭共享的 AsyncClient
+        """
+        # 借用的事件循环由 ASGI 服务器负责关闭
+        if self._attached or not self.loop or not self._thread or not self._thread.is_alive():
+            return
+        if cleanup is not None:
+            try:
+                self.run(cleanup(), timeout=5)
+            except Exception as e:
+                print("❌ 后台事件循环清理失败:", e)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+background_loop = BackgroundLoop()
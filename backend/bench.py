@@ -0,0 +1,291 @@
+# bench.py
+# 基准测试（不是测试套件）：本地假 Binance + 预先灌好历史数据的本地数据库，
+# 分别测量 400 / 2000 / 10000 个币种下抓取、接口和批量写入的端到端耗时，并与保存的基线对比。
+#
+#   python bench.py --save-baseline                  # 记录基线（写入 bench_baseline.json）
+#   python bench.py                                  # 与基线对比，超出容差或缺少基线时退出码为 1
+#   python bench.py --sizes 2000 --latency 0.02 --error-rate 0.01
+#   python bench.py --database-url postgresql://...  # 使用本地 PostgreSQL 夹具库
+#
+# 耗时和机器有关，仓库里的 bench_baseline.json 只作参考。CI 在同一个任务里先检出基准提交运行
+# --save-baseline --baseline /tmp/base.json，再检出待测提交运行 --baseline /tmp/base.json，两次在同一台机器上对比
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(HERE, "bench_data")
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+DEFAULT_SIZES = (400, 2000, 10000)
+DEFAULT_TOLERANCE = 0.25
+# 基线很小时，抖动带来的相对误差很大，低于这个秒数的差值不算退化
+MIN_REGRESSION_SECONDS = 0.005
+RECENT_MINUTES = 90
+SEED_CHUNK_ROWS = 100000
+RESULT_MARKER = "BENCH_RESULT "
+
+
+# ✅ 夹具：M 天历史（按 step 分钟采样）+ 最近 90 分钟逐分钟数据，满足所有回看周期
+def _history_times(days, step, now):
+    minutes = set(range(RECENT_MINUTES + 1))
+    minutes.update(range(0, days * 1440 + 1, step))
+    return [now - datetime.timedelta(minutes=m) for m in sorted(minutes, reverse=True)]
+
+
+def _random_walk(rng, steps, n, start_low, start_high, vol):
+    import numpy as np
+    start = rng.uniform(start_low, start_high, size=n)
+    shocks = rng.normal(0, vol, size=(steps, n))
+    return start * np.exp(np.cumsum(shocks, axis=0))
+
+
+def seed_fixture(symbols, days, step):
+    import numpy as np
+    from db import engine
+    from storage import setup_storage
+    from write_behind import write_rows
+
+    setup_storage()
+    now = datetime.datetime.utcnow().replace(second=0, microsecond=0)
+    times = _history_times(days, step, now)
+    rng = np.random.default_rng(7)
+    prices = _random_walk(rng, len(times), len(symbols), 0.01, 50000, 0.002)
+    ois = _random_walk(rng, len(times), len(symbols), 1e3, 1e8, 0.003)
+    start = time.time()
+
+    if engine.dialect.name == "sqlite":
+        # SQLite 直接走 DBAPI executemany；时间格式与 SQLAlchemy 写入的一致，保证字符串比较正确
+        stamps = [t.strftime("%Y-%m-%d %H:%M:%S.%f") for t in times]
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            for table, column, matrix in (("price", "price", prices), ("open_interest", "open_interest", ois)):
+                cur.executemany(
+                    f'INSERT OR REPLACE INTO {table} (symbol, "timestamp", {column}) VALUES (?, ?, ?)',
+                    ((s, stamps[t], float(matrix[t, i])) for t in range(len(times)) for i, s in enumerate(symbols)),
+                )
+            recent = range(len(times) - 10, len(times))
+            cur.executemany(
+                'INSERT INTO price_data (symbol, price, ema_7, ema_25, ema_99, "timestamp") VALUES (?, ?, ?, ?, ?, ?)',
+                ((s, float(prices[t, i]), None, None, None, stamps[t]) for t in recent for i, s in enumerate(symbols)),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    else:
+        for target, column, matrix in (("price", "price", prices), ("open_interest", "open_interest", ois)):
+            rows = []
+            for t, ts in enumerate(times):
+                rows.extend({"symbol": s, "timestamp": ts, column: float(matrix[t, i])} for i, s in enumerate(symbols))
+                if len(rows) >= SEED_CHUNK_ROWS:
+                    write_rows(target, rows)
+                    rows = []
+            if rows:
+                write_rows(target, rows)
+    print(f"✅ 夹具已灌入 {len(symbols)} 个币种 × {len(times)} 个时间点，用时 {time.time() - start:.1f}s", file=sys.stderr)
+
+
+def _measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+# ✅ 子进程：先启动假服务端并设置环境变量，再导入项目模块（连接串 / 地址都在导入时读取）
+def run_worker(args):
+    from fake_binance import FakeBinance
+
+    fake = FakeBinance(args.symbols, latency=args.latency, error_rate=args.error_rate)
+    base_url = fake.start()
+    os.environ["BINANCE_BASE_URL"] = base_url
+    # 假服务端没有 WebSocket：关掉行情订阅，保证不会连到真实的 Binance
+    os.environ["BINANCE_WS_URL"] = ""
+    os.environ["BINANCE_WEIGHT_LIMIT"] = str(10 ** 9)
+    os.environ["START_INGESTION"] = "0"
+    os.environ["LEADER_ELECTION"] = "off"
+    os.environ["SYMBOL_CACHE_FILE"] = os.path.join(BENCH_DIR, f"symbols_{args.symbols}.json")
+    if os.path.exists(os.environ["SYMBOL_CACHE_FILE"]):
+        os.remove(os.environ["SYMBOL_CACHE_FILE"])
+
+    seed_fixture(fake.symbols, args.days, args.step)
+
+    from binance_api import fetch_all_data, get_open_interest_data
+    from background_loop import background_loop
+    from binance_fetcher import close_fetcher
+    from price_buffer import price_buffer
+    from open_interest_view import open_interest_view
+    from response_cache import response_cache
+    from write_behind import write_behind, write_rows
+    from ingestion import market_snapshot
+    import app as flask_app
+
+    results = {}
+    repeat = args.repeat
+
+    def crawl():
+        result = background_loop.run(get_open_interest_data())
+        open_interest_view.update(result, datetime.datetime.utcnow())
+
+    # 预热：合约列表、连接池、缓冲区回填都不计入测量
+    fetch_all_data()
+    crawl()
+    price_buffer.hydrate()
+    write_behind.stop()
+
+    results["fetch_all_data"] = _measure(fetch_all_data, repeat)
+    results["get_open_interest_data"] = _measure(crawl, repeat)
+    write_behind.stop()
+
+    client = flask_app.app.test_client()
+
+    def get(path):
+        def call():
+            resp = client.get(path)
+            assert resp.status_code == 200, (path, resp.status_code)
+        return call
+
+    def cold(path, invalidate=None):
+        def call():
+            if invalidate:
+                invalidate()
+            response_cache.clear()
+            get(path)()
+        return call
+
+    results["GET /api/data (cold)"] = _measure(cold("/api/data", market_snapshot.invalidate), repeat)
+    results["GET /api/data (warm)"] = _measure(get("/api/data"), repeat)
+    results["GET /api/price_change (cold)"] = _measure(cold("/api/price_change"), repeat)
+    results["GET /api/price_change (warm)"] = _measure(get("/api/price_change"), repeat)
+    results["GET /api/open_interest (cold)"] = _measure(cold("/api/open_interest"), repeat)
+    results["GET /api/open_interest (warm)"] = _measure(get("/api/open_interest"), repeat)
+    results["GET /api/history"] = _measure(get("/api/history"), repeat)
+
+    # 批量写入：每次使用新的时间戳，测量真实的插入而不是空冲突
+    base = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(days=1)
+    counter = iter(range(10 ** 6))
+
+    def saver(target, column):
+        def call():
+            ts = base + datetime.timedelta(seconds=next(counter))
+            write_rows(target, [{"symbol": s, "timestamp": ts, column: 1.0} for s in fake.symbols])
+        return call
+
+    results["write price"] = _measure(saver("price", "price"), repeat)
+    results["write open_interest"] = _measure(saver("open_interest", "open_interest"), repeat)
+    results["write price_data"] = _measure(saver("price_data", "price"), repeat)
+
+    background_loop.stop(close_fetcher)
+    fake.stop()
+    summary = {
+        name: {"median": statistics.median(s), "min": min(s), "max": max(s)}
+        for name, s in results.items()
+    }
+    summary["_server"] = dict(fake.stats)
+    print(RESULT_MARKER + json.dumps(summary))
+
+
+def run_size(size, args):
+    env = dict(os.environ)
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        path = os.path.join(BENCH_DIR, f"bench_{size}.db")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        env["DATABASE_URL"] = f"sqlite:///{path}"
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--worker",
+        "--symbols", str(size), "--days", str(args.days), "--step", str(args.step),
+        "--repeat", str(args.repeat), "--latency", str(args.latency), "--error-rate", str(args.error_rate),
+    ]
+    proc = subprocess.run(cmd, cwd=HERE, env=env, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"{size} 个币种的基准测试失败（退出码 {proc.returncode}）")
+
+
+def _load_baseline(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def compare(size, summary, baseline, tolerance):
+    regressions = []
+    for name, stats in summary.items():
+        if name.startswith("_"):
+            continue
+        base = baseline.get(str(size), {}).get(name)
+        marker = ""
+        if base is not None:
+            ratio = stats["median"] / base if base else float("inf")
+            marker = f"{ratio:6.2f}x"
+            if stats["median"] > base * (1 + tolerance) and stats["median"] - base > MIN_REGRESSION_SECONDS:
+                regressions.append((size, name, base, stats["median"]))
+                marker += "  ❌ 退化"
+        print(f"  {name:<32} {stats['median'] * 1000:10.1f} ms  (min {stats['min'] * 1000:.1f})  {marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="抓取 / 接口 / 批量写入基准测试")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES))
+    parser.add_argument("--days", type=int, default=1, help="夹具历史天数")
+    parser.add_argument("--step", type=int, default=5, help="超出最近 90 分钟的历史采样间隔（分钟）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="假服务端每个请求增加的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假服务端返回 429 的概率")
+    parser.add_argument("--database-url", default=None, help="使用指定的夹具库（例如本地 PostgreSQL）代替临时 SQLite")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--symbols", type=int, default=400, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    baseline = _load_baseline(args.baseline)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    missing = [size for size in sizes if str(size) not in baseline]
+    if missing and not args.save_baseline:
+        # 没有基线时什么都比不了，不能当作通过
+        print(f"❌ 基线 {args.baseline} 中没有 {', '.join(map(str, missing))} 个币种的数据，请先运行 --save-baseline")
+        return 1
+    regressions = []
+    for size in sizes:
+        summary = run_size(size, args)
+        print(f"📊 {size} 个币种（假服务端请求 {summary['_server']['requests']} 次，429 {summary['_server']['throttled']} 次）")
+        regressions.extend(compare(size, summary, baseline, args.tolerance))
+        if args.save_baseline:
+            baseline[str(size)] = {k: v["median"] for k, v in summary.items() if not k.startswith("_")}
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"✅ 基线已保存到 {args.baseline}")
+        return 0
+    if regressions:
+        print(f"❌ {len(regressions)} 项超出基线 {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
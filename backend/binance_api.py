@@ -2,99 +2,98 @@
 
 import httpx
 import asyncio
+import functools
+import numpy as np
 from datetime import datetime
-from db import get_previous_oi, save_open_interest_bulk  # ✅ 正确导入
+from db import get_previous_oi_batch  # ✅ 正确导入
+from write_behind import write_behind
+from binance_fetcher import BASE_URL, get_fetcher
+from exchanges import get_adapter
+from market_stream import market_state
+from frames import Frame
+from symbol_registry import symbol_registry
+from metrics import stage
 import time
 
-BASE_URL = "https://fapi.binance.com"
+# 报文解析由交易所适配器负责，这里只保留同步 REST 回退
+binance = get_adapter("binance")
 
 def fetch_all_data():
     premium_data = httpx.get(f"{BASE_URL}/fapi/v1/premiumIndex").json()
-    funding_dict = {
-        item["symbol"]: float(item.get("lastFundingRate") or 0.0)
-        for item in premium_data
-    }
-
     ticker_data = httpx.get(f"{BASE_URL}/fapi/v1/ticker/24hr").json()
+    return binance.parse_tickers(ticker_data, premium_data)
 
-    result = []
-    for item in ticker_data:
-        symbol = item["symbol"]
-        if not symbol.endswith("USDT"):
-            continue
-        result.append({
-            "symbol": symbol,
-            "price": float(item["lastPrice"]),
-            "change": float(item["priceChangePercent"]),
-            "volume": float(item["quoteVolume"]),
-            "fundingRate": funding_dict.get(symbol, None)
-        })
-
-    return result
+# ✅ 优先读取 WebSocket 维护的最新行情表，过期或未连接时回退到 REST 并顺便补缺
+def get_market_data():
+    if market_state.is_fresh():
+        return market_state.frame()
+    data = fetch_all_data()
+    market_state.seed(data)
+    return data
 
-def get_valid_symbols():
-    resp = httpx.get(f"{BASE_URL}/fapi/v1/exchangeInfo").json()
-    return [s["symbol"] for s in resp["symbols"]
-            if s["contractType"] == "PERPETUAL" and s["quoteAsset"] == "USDT"]
+# ✅ 合约列表来自本地注册表，只有过期时才重新校验 exchangeInfo
+async def get_valid_symbols(fetcher):
+    return await symbol_registry.get_symbols(fetcher)
 
-async def fetch_open_interest(session, symbol):
-    try:
-        await asyncio.sleep(0.1)
-        url = f"{BASE_URL}/fapi/v1/openInterest"
-        resp = await session.get(url, params={"symbol": symbol}, timeout=10.0)
-        data = resp.json()
-        if "openInterest" not in data:
-            return None
-        return {
-            "symbol": symbol,
-            "current_oi": float(data["openInterest"])
-        }
-    except Exception as e:
-        # print(f"❌ 获取 {symbol} 持仓量失败: {e}")
-        return None
+def calc_changes(old, current):
+    """
+    整列计算变化百分比（保留两位小数），old 为 NaN 或 0 时为 0
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change = np.round((current - old) / old * 100, 2)
+    return np.where(np.isnan(old) | (old == 0), 0.0, change)
 
-def calc_change(old, current):
-    if old is None or old == 0:
-        return 0.0
-    return round(((current - old) / old) * 100, 2)
+# ✅ 持仓量快照（列式）：当前持仓量 + 资金费率 + 5m/15m/1h 变化
+def open_interest_frame(current, previous, funding):
+    """
+    current:  {symbol: 持仓量}
+    previous: get_previous_oi_batch 的结果 {symbol: {分钟: 持仓量}}
+    funding:  {symbol: 资金费率}，缺失为 NaN（premiumIndex 失败时整列缺失），不能当作费率 0 落库或计入统计
+    """
+    symbols = list(current)
+    values = np.array([current[s] for s in symbols], dtype=float)
+    columns = {
+        "fundingRate": np.array([funding.get(s, np.nan) for s in symbols], dtype=float),
+        "openInterest": values,
+    }
+    for label, minutes in (("5m", 5), ("15m", 15), ("1h", 60)):
+        old = np.array([previous.get(s, {}).get(minutes) for s in symbols], dtype=float)
+        columns[f"openInterestChange.{label}"] = calc_changes(old, values)
+    return Frame.from_symbols(symbols, columns)
 
-async def get_open_interest_data():
+async def get_open_interest_data(symbols=None, now=None):
+    """
+    symbols: 只抓取这些币种（亚分钟节拍的高波动子集），默认抓取全部合约
+    now:     写入的采样时间戳（对齐后的调度节拍），默认当前时间
+    """
     print("📊 开始抓取持仓量数据...")
     start = time.time()
 
-    symbols = get_valid_symbols()
-    premium_data = httpx.get(f"{BASE_URL}/fapi/v1/premiumIndex").json()
-    funding_dict = {d["symbol"]: float(d.get("lastFundingRate") or 0.0) for d in premium_data}
-
-    async with httpx.AsyncClient() as client:
-        tasks = [fetch_open_interest(client, symbol) for symbol in symbols]
-        raw_results = await asyncio.gather(*tasks)
+    # 并发与限速由共享的 fetcher 控制，不再一次性放出所有请求
+    fetcher = get_fetcher()
+    with stage("open_interest", "symbols"):
+        if symbols is None:
+            symbols, funding_dict = await asyncio.gather(get_valid_symbols(fetcher), binance.fetch_funding_rates(fetcher))
+        else:
+            funding_dict = await binance.fetch_funding_rates(fetcher)
+    with stage("open_interest", "fetch"):
+        current = await binance.fetch_open_interest(fetcher, symbols)
+    failed = len(symbols) - len(current)
+    if failed:
+        print(f"⚠️ {failed}/{len(symbols)} 个币种持仓量获取失败，剩余权重 {fetcher.bucket.remaining}")
 
-    result = []
-    db_items = []
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
 
-    for item in raw_results:
-        if not item:
-            continue
-        symbol = item["symbol"]
-        current_oi = item["current_oi"]
-        result.append({
-            "symbol": symbol,
-            "fundingRate": funding_dict.get(symbol, 0.0),
-            "openInterest": current_oi,
-            "openInterestChange": {
-                "5m": calc_change(get_previous_oi(symbol, 5), current_oi),
-                "15m": calc_change(get_previous_oi(symbol, 15), current_oi),
-                "1h": calc_change(get_previous_oi(symbol, 60), current_oi),
-            }
-        })
-        db_items.append({
-            "symbol": symbol,
-            "timestamp": now,
-            "open_interest": current_oi
-        })
+    # 一次查询取出所有币种 5m/15m/1h 前的持仓量
+    with stage("open_interest", "lookback"):
+        # 同步的数据库查询放到线程池，不阻塞事件循环
+        previous = await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(get_previous_oi_batch, list(current), [5, 15, 60], now=now)
+        )
 
-    save_open_interest_bulk(db_items)
+    result = open_interest_frame(current, previous, funding_dict)
+    write_behind.enqueue("open_interest", result.records(
+        {"open_interest": "openInterest", "change_pct": "openInterestChange.5m"}, timestamp=now
+    ))
     print(f"✅ 持仓量数据抓取完成，用时 {time.time() - start:.2f}s，共 {len(result)} 个币种")
     return result
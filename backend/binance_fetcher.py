@@ -0,0 +1,181 @@
+# binance_fetcher.py
+
+import asyncio
+import os
+import random
+import time
+import httpx
+from metrics import binance_request_seconds, binance_responses_total, binance_retries_total
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# 可通过环境变量指向本地的假服务端（基准测试用）
+BASE_URL = os.environ.get("BINANCE_BASE_URL", "https://fapi.binance.com")
+
+# Binance 合约 IP 权重上限为每分钟 2400，这里默认只用 80%，留出余量给其他请求
+WEIGHT_LIMIT_1M = int(os.environ.get("BINANCE_WEIGHT_LIMIT", 2400))
+WEIGHT_SAFETY = float(os.environ.get("BINANCE_WEIGHT_SAFETY", 0.8))
+MAX_IN_FLIGHT = int(os.environ.get("BINANCE_MAX_IN_FLIGHT", 20))
+MAX_RETRIES = int(os.environ.get("BINANCE_MAX_RETRIES", 4))
+# Retry-After 超过这个秒数（例如 418 封禁）就不再等待，直接放弃本轮
+MAX_RETRY_WAIT = 30.0
+
+
+class BinanceAPIError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# 其他交易所适配器共用同一个请求层和异常类型
+ExchangeAPIError = BinanceAPIError
+
+
+# ✅ 基于 X-MBX-USED-WEIGHT-1m 的令牌桶：按自然分钟重置，用服务端返回的已用权重校准本地估计
+class WeightBucket:
+    def __init__(self, limit=WEIGHT_LIMIT_1M, safety=WEIGHT_SAFETY):
+        self.capacity = int(limit * safety)
+        self.used = 0
+        self.window = self._current_window()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _current_window():
+        return int(time.time() // 60)
+
+    def _roll(self):
+        window = self._current_window()
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    async def acquire(self, weight=1):
+        async with self._lock:
+            while True:
+                self._roll()
+                if self.used + weight <= self.capacity:
+                    self.used += weight
+                    return
+                # 本分钟额度用完，等到下一个自然分钟
+                await asyncio.sleep(60 - time.time() % 60 + 0.05)
+
+    def update(self, used_weight):
+        """
+        用响应头里的已用权重校准：服务端计数包含了其他进程的消耗，取较大值
+        """
+        self._roll()
+        if used_weight is not None and used_weight > self.used:
+            self.used = used_weight
+
+    @property
+    def remaining(self):
+        self._roll()
+        return max(self.capacity - self.used, 0)
+
+
+# ✅ 复用单个 AsyncClient 的请求层：并发上限、权重令牌桶、429/418 抖动退避重试
+#    默认参数对应 Binance，其他交易所通过 weight_limit / weight_header 传入各自的限额
+class BinanceFetcher:
+    def __init__(self, base_url=BASE_URL, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES, timeout=10.0,
+                 weight_limit=WEIGHT_LIMIT_1M, weight_header="X-MBX-USED-WEIGHT-1m"):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.weight_header = weight_header
+        self.bucket = WeightBucket(weight_limit)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=HTTP2_ENABLED,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+                keepalive_expiry=60,
+            ),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        # 指数退避 + full jitter
+        return random.uniform(0, min(0.5 * 2 ** attempt, 10.0))
+
+    async def request(self, path, params=None, weight=1, headers=None):
+        """
+        返回原始响应（调用方需要读取 ETag 等响应头或处理 304 时使用）
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(weight)
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    resp = await self.client.get(path, params=params, headers=headers)
+                    binance_request_seconds.observe(time.perf_counter() - start, endpoint=path)
+            except httpx.TransportError as e:
+                last_error = BinanceAPIError(f"{path} 网络错误: {e}")
+                binance_retries_total.inc(endpoint=path, reason="transport")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            binance_responses_total.inc(endpoint=path, status=resp.status_code)
+
+            used = resp.headers.get(self.weight_header) if self.weight_header else None
+            if used is not None:
+                self.bucket.update(int(used))
+
+            if resp.status_code in (429, 418) or resp.status_code >= 500:
+                retry_after = resp.headers.get("Retry-After")
+                retry_after = float(retry_after) if retry_after else None
+                last_error = BinanceAPIError(f"{path} 返回 {resp.status_code}", resp.status_code)
+                if retry_after is not None and retry_after > MAX_RETRY_WAIT:
+                    break
+                # 只退避当前请求（Retry-After 或抖动）；额度是否用尽以响应头里的已用权重为准，
+                # 不因一次没有 Retry-After 的 429 就把整分钟额度标记为用尽、卡住进程里的所有请求
+                binance_retries_total.inc(endpoint=path, reason=resp.status_code)
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+                continue
+
+            if resp.status_code >= 400:
+                raise BinanceAPIError(f"{path} 返回 {resp.status_code}: {resp.text[:200]}", resp.status_code)
+            return resp
+
+        raise last_error
+
+    async def get_json(self, path, params=None, weight=1):
+        resp = await self.request(path, params=params, weight=weight)
+        return resp.json()
+
+
+# ✅ 每个事件循环、每个交易所共享一个 fetcher（AsyncClient 不能跨事件循环使用，限额按交易所独立计算）
+_fetchers = {}
+
+
+def get_fetcher(venue="binance", factory=BinanceFetcher):
+    loop = asyncio.get_running_loop()
+    fetcher = _fetchers.get((loop, venue))
+    if fetcher is None:
+        # 清理已关闭事件循环遗留的实例
+        for key in [k for k in _fetchers if k[0].is_closed()]:
+            _fetchers.pop(key, None)
+        fetcher = _fetchers[(loop, venue)] = factory()
+    return fetcher
+
+
+async def close_fetcher():
+    loop = asyncio.get_running_loop()
+    for key in [k for k in _fetchers if k[0] is loop]:
+        await _fetchers.pop(key).close()
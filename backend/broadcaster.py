@@ -0,0 +1,144 @@
+# broadcaster.py
+
+import asyncio
+import os
+import threading
+from collections import deque
+from response_cache import dumps
+
+# 共享事件环的长度：客户端落后超过这么多条事件就会被踢掉
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", 64))
+MAX_SUBSCRIBERS = int(os.environ.get("STREAM_MAX_SUBSCRIBERS", 200))
+HEARTBEAT_SECONDS = 15
+
+
+# ✅ SSE 广播器：每个事件只序列化一次写入共享环形缓冲区，订阅者各自按序号游标读取
+class Broadcaster:
+    def __init__(self, buffer_size=STREAM_BUFFER_SIZE, max_subscribers=MAX_SUBSCRIBERS):
+        self._events = deque(maxlen=buffer_size)
+        self._latest = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.max_subscribers = max_subscribers
+        self.subscribers = 0
+        self.evicted = 0
+        # ASGI 订阅者：(事件循环, asyncio.Event)，发布时跨线程唤醒
+        self._waiters = set()
+
+    @staticmethod
+    def _encode(seq, event, data):
+        return f"id: {seq}\nevent: {event}\ndata: ".encode("utf-8") + dumps(data) + b"\n\n"
+
+    def publish(self, event, data):
+        """
+        发布成本与订阅者数量无关：只编码一次、追加一次、唤醒一次
+        """
+        with self._cond:
+            self._seq += 1
+            message = self._encode(self._seq, event, data)
+            self._events.append((self._seq, message))
+            self._latest[event] = message
+            self._cond.notify_all()
+            for loop, wakeup in self._waiters:
+                loop.call_soon_threadsafe(wakeup.set)
+
+    def _subscribe(self):
+        """
+        只检查容量并取初始游标；计数在生成器第一次迭代时才加一、在 finally 里减一，
+        响应在第一次迭代前就被关闭（客户端提前断开）时两者都不会执行，计数不会泄漏
+        """
+        with self._cond:
+            if self.subscribers >= self.max_subscribers:
+                raise OverflowError("订阅者数量已达上限")
+            return self._seq, list(self._latest.values())
+
+    def _enter(self):
+        with self._cond:
+            self.subscribers += 1
+
+    def _leave(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def _pending(self, cursor):
+        pending = [(seq, msg) for seq, msg in self._events if seq > cursor]
+        oldest = self._events[0][0] if self._events else cursor + 1
+        return pending, oldest
+
+    def stream(self):
+        """
+        返回给 Flask Response 的生成器；新连接先收到每类事件的最新一条
+        """
+        return self._generate(*self._subscribe())
+
+    def astream(self):
+        """
+        ASGI 版本的异步生成器：等待新事件时不占用线程
+        """
+        return self._agenerate(*self._subscribe())
+
+    def _generate(self, cursor, initial):
+        self._enter()
+        try:
+            yield b"retry: 5000\n\n"
+            for message in initial:
+                yield message
+            while True:
+                with self._cond:
+                    if self._seq == cursor:
+                        self._cond.wait(HEARTBEAT_SECONDS)
+                    pending, oldest = self._pending(cursor)
+                if not pending:
+                    # 心跳注释，顺便检测已断开的连接
+                    yield b": ping\n\n"
+                    continue
+                if oldest > cursor + 1:
+                    # 落后太多，事件已被覆盖：踢掉慢客户端，让浏览器重连后重新拿最新快照
+                    self.evicted += 1
+                    yield b"event: evicted\ndata: {}\n\n"
+                    return
+                for seq, message in pending:
+                    cursor = seq
+                    yield message
+        finally:
+            self._leave()
+
+    async def _agenerate(self, cursor, initial):
+        wakeup = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), wakeup)
+        with self._cond:
+            self._waiters.add(waiter)
+            self.subscribers += 1
+        try:
+            yield b"retry: 5000\n\n"
+            for message in initial:
+                yield message
+            while True:
+                with self._cond:
+                    idle = self._seq == cursor
+                    if idle:
+                        wakeup.clear()
+                if idle:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                with self._cond:
+                    pending, oldest = self._pending(cursor)
+                if not pending:
+                    yield b": ping\n\n"
+                    continue
+                if oldest > cursor + 1:
+                    self.evicted += 1
+                    yield b"event: evicted\ndata: {}\n\n"
+                    return
+                for seq, message in pending:
+                    cursor = seq
+                    yield message
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+                self.subscribers -= 1
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,182 @@
+# cross_venue.py
+
+import asyncio
+import os
+import threading
+import time
+import warnings
+import numpy as np
+from metrics import stage
+from frames import as_frame, to_list
+
+# 单个交易所一轮抓取的时间预算（秒）：超时只丢弃该交易所本轮数据，保证整轮在一分钟调度间隔内完成
+VENUE_TIMEOUT = float(os.environ.get("VENUE_TIMEOUT", 45))
+FIELDS = ("price", "openInterest", "fundingRate", "volume")
+
+
+async def _fetch_venue(adapter):
+    start = time.time()
+    try:
+        with stage("cross_venue", adapter.name):
+            data = await asyncio.wait_for(adapter.fetch_market(), VENUE_TIMEOUT)
+        print(f"✅ {adapter.name} 抓取完成，用时 {time.time() - start:.2f}s，共 {len(data)} 个币种")
+        return data
+    except asyncio.TimeoutError:
+        print(f"❌ {adapter.name} 抓取超时（{VENUE_TIMEOUT}s），本轮跳过")
+    except Exception as e:
+        print(f"❌ {adapter.name} 抓取失败:", e)
+    return None
+
+
+# ✅ 各交易所并发抓取，互不阻塞；失败或超时的交易所不出现在结果里
+async def fetch_venues(adapters):
+    results = await asyncio.gather(*[_fetch_venue(adapter) for adapter in adapters])
+    return {adapter.name: data for adapter, data in zip(adapters, results) if data is not None}
+
+
+def binance_venue_data(open_interest_rows, market_rows):
+    """
+    把主流程的持仓量快照和行情快照按币种编号对齐，合并成适配器统一结构
+    """
+    oi = as_frame(open_interest_rows, ("fundingRate", "openInterest"))
+    market = as_frame(market_rows, ("price", "change", "volume"))
+    columns = {
+        "price": to_list(market.align(oi.ids, "price")),
+        "change": to_list(market.align(oi.ids, "change")),
+        "volume": to_list(market.align(oi.ids, "volume")),
+        "fundingRate": to_list(oi.get("fundingRate")),
+        "openInterest": to_list(oi.get("openInterest")),
+    }
+    return {
+        symbol: {field: values[i] for field, values in columns.items()}
+        for i, symbol in enumerate(oi.symbols)
+    }
+
+
+# ✅ 列式快照：venue × symbol 的二维数组，缺失值为 NaN，聚合全部向量化
+class CrossVenueSnapshot:
+    def __init__(self, venues, symbols, columns):
+        self.venues = venues
+        self.symbols = symbols
+        self.columns = columns
+
+    @classmethod
+    def build(cls, venue_data):
+        venues = sorted(venue_data)
+        symbols = sorted({s for data in venue_data.values() for s in data})
+        index = {s: i for i, s in enumerate(symbols)}
+        columns = {field: np.full((len(venues), len(symbols)), np.nan) for field in FIELDS}
+        for v, venue in enumerate(venues):
+            for symbol, row in venue_data[venue].items():
+                i = index[symbol]
+                for field in FIELDS:
+                    value = row.get(field)
+                    if value is not None:
+                        columns[field][v, i] = value
+        return cls(venues, symbols, columns)
+
+    def aggregates(self):
+        """
+        按币种（列）聚合；调用方保证至少有一个交易所
+        """
+        price = self.columns["price"]
+        oi = self.columns["openInterest"]
+        funding = self.columns["fundingRate"]
+        notional = oi * price
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            # 全部为 NaN 的列（没有任何交易所给出资金费率）结果为 NaN，不需要告警
+            warnings.simplefilter("ignore", RuntimeWarning)
+            total_notional = np.nansum(notional, axis=0)
+            weighted = np.where(np.isnan(funding) | np.isnan(notional), 0.0, funding * notional).sum(axis=0)
+            covered = np.where(np.isnan(funding), 0.0, np.nan_to_num(notional)).sum(axis=0)
+            weighted_funding = np.where(covered > 0, weighted / covered, np.nan)
+            funding_spread = np.nanmax(funding, axis=0) - np.nanmin(funding, axis=0)
+        return {
+            "totalOpenInterest": np.nansum(oi, axis=0),
+            "notional": total_notional,
+            "weightedFundingRate": weighted_funding,
+            "fundingSpread": funding_spread,
+            "venues": (~np.isnan(price)).sum(axis=0),
+        }
+
+    def rows(self):
+        """
+        接口结构：每个币种一行，按名义持仓量降序，各交易所明细放在 venues 里
+        """
+        if not self.symbols:
+            return []
+        agg = self.aggregates()
+
+        def value(x):
+            return None if np.isnan(x) else float(x)
+
+        result = []
+        for i in np.argsort(-np.nan_to_num(agg["notional"]), kind="stable"):
+            venues = {}
+            for v, venue in enumerate(self.venues):
+                if np.isnan(self.columns["price"][v, i]) and np.isnan(self.columns["openInterest"][v, i]):
+                    continue
+                venues[venue] = {
+                    "price": value(self.columns["price"][v, i]),
+                    "openInterest": value(self.columns["openInterest"][v, i]),
+                    "fundingRate": value(self.columns["fundingRate"][v, i]),
+                    "volume": value(self.columns["volume"][v, i]),
+                }
+            result.append({
+                "symbol": self.symbols[i],
+                "totalOpenInterest": value(agg["totalOpenInterest"][i]),
+                "notional": value(agg["notional"][i]),
+                "weightedFundingRate": value(agg["weightedFundingRate"][i]),
+                "fundingSpread": value(agg["fundingSpread"][i]),
+                "venues": venues,
+            })
+        return result
+
+
+# ✅ 跨交易所视图：每轮抓取后整体重建；某个交易所本轮失败时沿用它上一轮的数据
+class CrossVenueView:
+    def __init__(self):
+        self._venue_data = {}
+        self._snapshot = CrossVenueSnapshot.build({})
+        self._lock = threading.Lock()
+        self.updated_at = {}
+        self.version = 0
+
+    def update(self, venue_data, updated_at=None):
+        """
+        updated_at 为所有交易所共用的时间，或 {交易所: 时间}（follower 从共享快照同步时各交易所的时间不同）
+        """
+        with self._lock:
+            merged = dict(self._venue_data, **venue_data)
+            self._snapshot = CrossVenueSnapshot.build(merged)
+            self._venue_data = merged
+            for venue in venue_data:
+                self.updated_at[venue] = updated_at.get(venue) if isinstance(updated_at, dict) else updated_at
+            self.version += 1
+
+    def extra_venues(self):
+        """
+        Binance 以外各交易所最近一次的数据和更新时间，leader 发布到共享快照
+        """
+        with self._lock:
+            return {
+                venue: (data, self.updated_at.get(venue))
+                for venue, data in self._venue_data.items() if venue != "binance"
+            }
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def rows(self):
+        return self._snapshot.rows()
+
+    def payload(self):
+        return {
+            "venues": self._snapshot.venues,
+            "updatedAt": {v: ts.isoformat() if ts else None for v, ts in self.updated_at.items()},
+            "data": self.rows(),
+        }
+
+
+cross_venue_view = CrossVenueView()
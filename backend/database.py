@@ -1,30 +1,19 @@
 # database.py
 
 from sqlalchemy.orm import scoped_session
-from db import SessionLocal,PriceData
+from db import SessionLocal,PriceData,get_lookback_values
 from sqlalchemy import desc
+from write_behind import write_behind
+from frames import as_frame
 import datetime
 
-# ✅ 保存实时数据（价格 + EMA）
-def save_data(data):
-    db = scoped_session(SessionLocal)
-    try:
-        for item in data:
-            entry = PriceData(
-                symbol=item['symbol'],
-                price=item['price'],
-                ema_7=item.get('ema_7'),
-                ema_25=item.get('ema_25'),
-                ema_99=item.get('ema_99'),
-                timestamp=datetime.datetime.utcnow()
-            )
-            db.add(entry)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print("❌ save_data 保存失败:", e)
-    finally:
-        db.close()
+# ✅ 保存实时数据（价格 + EMA），交给异步落库队列批量写入；直接从列式快照生成落库行
+def save_data(data, now=None):
+    now = now or datetime.datetime.utcnow()
+    frame = as_frame(data, ("price", "ema_7", "ema_25", "ema_99"))
+    write_behind.enqueue("price_data", frame.records(
+        {"price": "price", "ema_7": "ema_7", "ema_25": "ema_25", "ema_99": "ema_99"}, timestamp=now
+    ))
 
 # ✅ 查询最近一次价格数据（历史页面）
 def get_latest_data(limit=100):
@@ -48,19 +37,14 @@ def get_latest_data(limit=100):
     finally:
         db.close()
 
-# ✅ 获取某个 symbol 指定分钟数前的价格（用于涨跌幅）
-def get_price_change(symbol, minutes_ago):
-    db = scoped_session(SessionLocal)
+# ✅ 批量获取多个 symbol 在多个周期前的价格（一次查询）
+def get_price_changes(symbols, minutes_list):
     try:
-        target_time = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes_ago)
-        result = db.query(PriceData).filter(
-            PriceData.symbol == symbol,
-            PriceData.timestamp <= target_time
-        ).order_by(desc(PriceData.timestamp)).first()
-
-        return result.price if result else None
+        return get_lookback_values(PriceData, "price", minutes_list, symbols)
     except Exception as e:
-        print(f"❌ get_price_change 失败: {symbol} {minutes_ago}min:", e)
-        return None
-    finally:
-        db.close()
+        print("❌ get_price_changes 失败:", e)
+        return {}
+
+# ✅ 获取某个 symbol 指定分钟数前的价格（用于涨跌幅）
+def get_price_change(symbol, minutes_ago):
+    return get_price_changes([symbol], [minutes_ago]).get(symbol, {}).get(minutes_ago)
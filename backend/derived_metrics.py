@@ -0,0 +1,211 @@
+# derived_metrics.py
+
+import datetime
+import os
+import threading
+import numpy as np
+from db import session_scope, DerivedMetric
+from frames import Frame, symbol_index
+from market_stream import market_state
+from write_behind import write_behind
+from scheduling import OI_FULL_SECONDS
+
+# z-score 的滚动窗口，按整分钟全量抓取的次数计（默认 60 次 ≈ 1 小时）
+ZSCORE_WINDOW = int(os.environ.get("ZSCORE_WINDOW", 60))
+# 窗口内样本数少于这个值时不给 z-score
+ZSCORE_MIN_SAMPLES = int(os.environ.get("ZSCORE_MIN_SAMPLES", 10))
+
+# 计算 z-score 的列
+ZSCORE_COLUMNS = ("openInterestNotional", "basis", "fundingRate")
+
+# derived_metrics 表字段 -> 快照列
+DERIVED_FIELDS = {
+    "open_interest_notional": "openInterestNotional",
+    "mark_price": "markPrice",
+    "index_price": "indexPrice",
+    "basis": "basis",
+    "funding_rate": "fundingRate",
+    "notional_zscore": "zscore.openInterestNotional",
+    "basis_zscore": "zscore.basis",
+    "funding_zscore": "zscore.fundingRate",
+}
+
+
+# ✅ 滚动窗口统计：每个币种一个固定长度的环形缓冲区 + 滚动和 / 平方和，按 symbol_index 编号存放。
+#    每次更新只加入新值、减去被挤出的旧值，与窗口长度无关；每转完一圈按缓冲区重新求和一次，消除浮点累加误差
+class RollingWindow:
+    def __init__(self, window=ZSCORE_WINDOW, min_samples=ZSCORE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._values = np.full((0, window), np.nan)
+        self._sum = np.zeros(0)
+        self._sumsq = np.zeros(0)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._pos = np.zeros(0, dtype=np.int64)
+
+    def _ensure(self, ids):
+        size = len(self._count)
+        needed = int(ids.max()) + 1 if len(ids) else 0
+        if needed <= size:
+            return
+        grown = max(needed, size * 2, 64)
+        values = np.full((grown, self.window), np.nan)
+        values[:size] = self._values
+        self._values = values
+        for name in ("_sum", "_sumsq", "_count", "_pos"):
+            old = getattr(self, name)
+            new = np.zeros(grown, dtype=old.dtype)
+            new[:size] = old
+            setattr(self, name, new)
+
+    def push(self, ids, values):
+        """
+        ids 不能重复；values 为 NaN 的币种本轮不计入窗口。返回加入本轮值之后的 z-score
+        """
+        self._ensure(ids)
+        valid = ~np.isnan(values)
+        ids_v, new = ids[valid], values[valid]
+        pos = self._pos[ids_v]
+        old = self._values[ids_v, pos]
+        evicted = ~np.isnan(old)
+        old = np.where(evicted, old, 0.0)
+        self._sum[ids_v] += new - old
+        self._sumsq[ids_v] += new * new - old * old
+        self._count[ids_v] += ~evicted
+        self._values[ids_v, pos] = new
+        pos = (pos + 1) % self.window
+        self._pos[ids_v] = pos
+        wrapped = ids_v[pos == 0]
+        if len(wrapped):
+            self._sum[wrapped] = np.nansum(self._values[wrapped], axis=1)
+            self._sumsq[wrapped] = np.nansum(self._values[wrapped] ** 2, axis=1)
+        return self.zscores(ids, values)
+
+    def zscores(self, ids, values):
+        """
+        样本不足或窗口内没有波动时为 NaN
+        """
+        self._ensure(ids)
+        n = self._count[ids]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self._sum[ids] / n
+            std = np.sqrt(np.maximum(self._sumsq[ids] / n - mean * mean, 0.0))
+            z = (values - mean) / std
+        # 平方和相减有舍入误差，相对均值小于 1e-6 的波动视为没有波动
+        flat = std <= 1e-6 * np.maximum(np.abs(mean), 1e-12)
+        return np.where((n >= self.min_samples) & ~flat, z, np.nan)
+
+    def discard(self, ids):
+        ids = ids[ids < len(self._count)]
+        self._values[ids] = np.nan
+        self._sum[ids] = 0.0
+        self._sumsq[ids] = 0.0
+        self._count[ids] = 0
+        self._pos[ids] = 0
+
+
+# ✅ 派生指标：每次整分钟全量抓取持仓量后，用持仓量快照 + 行情表的标记 / 指数价格整列计算
+#    名义价值、基差（标记价格相对指数价格的百分比）和资金费率的滚动 z-score，写入 derived_metrics；
+#    资金费率只在变化时写入 funding_rate 历史表
+class DerivedMetricsView:
+    def __init__(self, window=ZSCORE_WINDOW):
+        self._windows = {name: RollingWindow(window) for name in ZSCORE_COLUMNS}
+        # 每个币种最近一次写入 funding_rate 表的费率，按编号存放
+        self._funding = np.full(0, np.nan)
+        self._frame = Frame.empty()
+        self._lock = threading.Lock()
+        self.version = 0
+        self.updated_at = None
+
+    @property
+    def frame(self):
+        return self._frame
+
+    def rows(self):
+        return self._frame
+
+    def compute(self, oi_frame):
+        ids = oi_frame.ids
+        mark = market_state.align(ids, "markPrice")
+        index = market_state.align(ids, "indexPrice")
+        # 没有标记价格时（WebSocket 和 premiumIndex 都缺）退化为最新成交价
+        price = np.where(np.isnan(mark), market_state.align(ids, "price"), mark)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            basis = np.where(index > 0, (mark - index) / index * 100, np.nan)
+        columns = {
+            "openInterestNotional": oi_frame.get("openInterest") * price,
+            "markPrice": mark,
+            "indexPrice": index,
+            "basis": basis,
+            "fundingRate": oi_frame.get("fundingRate"),
+        }
+        for name in ZSCORE_COLUMNS:
+            columns[f"zscore.{name}"] = self._windows[name].push(ids, columns[name])
+        return Frame(ids, columns, oi_frame.symbols)
+
+    def _funding_changes(self, frame):
+        """
+        返回本轮费率与上次写入不同的行，并记下新的费率
+        """
+        funding = frame.get("fundingRate")
+        if len(frame.ids) and int(frame.ids.max()) >= len(self._funding):
+            grown = np.full(max(int(frame.ids.max()) + 1, len(self._funding) * 2, 64), np.nan)
+            grown[:len(self._funding)] = self._funding
+            self._funding = grown
+        last = self._funding[frame.ids]
+        changed = ~np.isnan(funding) & (np.isnan(last) | (funding != last))
+        self._funding[frame.ids[changed]] = funding[changed]
+        return frame.take(changed)
+
+    def update(self, oi_frame, now):
+        """
+        只在全量抓取后调用：窗口按抓取次数滚动，亚分钟的部分抓取不计入
+        """
+        with self._lock:
+            frame = self.compute(oi_frame)
+            changed = self._funding_changes(frame)
+            self._frame = frame
+            self.updated_at = now
+            self.version += 1
+        write_behind.enqueue("derived_metrics", frame.records(DERIVED_FIELDS, timestamp=now))
+        if len(changed):
+            write_behind.enqueue("funding_rate", changed.records({"funding_rate": "fundingRate"}, timestamp=now))
+        return frame
+
+    def discard(self, symbols):
+        ids = symbol_index.ids(symbols)
+        with self._lock:
+            for window in self._windows.values():
+                window.discard(ids)
+            self._funding[ids[ids < len(self._funding)]] = np.nan
+            self._frame = self._frame.drop(symbols)
+
+    def hydrate(self):
+        """
+        重启后从 derived_metrics 表按时间顺序重放最近一个窗口，恢复滚动统计和资金费率的去重基准
+        """
+        try:
+            window = next(iter(self._windows.values())).window
+            since = datetime.datetime.utcnow() - datetime.timedelta(seconds=OI_FULL_SECONDS * window)
+            with session_scope() as session:
+                rows = session.query(
+                    DerivedMetric.timestamp, DerivedMetric.symbol, DerivedMetric.open_interest_notional,
+                    DerivedMetric.basis, DerivedMetric.funding_rate,
+                ).filter(DerivedMetric.timestamp >= since).order_by(DerivedMetric.timestamp.asc()).all()
+            if not rows:
+                return
+            timestamps = np.array([r[0] for r in rows])
+            values = np.array([r[2:] for r in rows], dtype=float)
+            ids = symbol_index.ids([r[1] for r in rows])
+            bounds = np.flatnonzero(timestamps[1:] != timestamps[:-1]) + 1
+            with self._lock:
+                for batch in np.split(np.arange(len(rows)), bounds):
+                    for j, name in enumerate(ZSCORE_COLUMNS):
+                        self._windows[name].push(ids[batch], values[batch, j])
+                    self._funding_changes(Frame(ids[batch], {"fundingRate": values[batch, 2]}))
+            print(f"✅ 派生指标窗口已回填 {len(bounds) + 1} 轮，共 {len(rows)} 条")
+        except Exception as e:
+            print("❌ 派生指标回填失败:", e)
+
+
+derived_metrics = DerivedMetricsView()
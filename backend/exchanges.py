@@ -0,0 +1,285 @@
+# exchanges.py
+
+import asyncio
+import os
+import numpy as np
+from binance_fetcher import (
+    BinanceFetcher, ExchangeAPIError, get_fetcher,
+    BASE_URL as BINANCE_BASE_URL, WEIGHT_LIMIT_1M as BINANCE_WEIGHT_LIMIT, MAX_IN_FLIGHT as BINANCE_MAX_IN_FLIGHT,
+)
+from market_stream import market_state
+from frames import Frame, symbol_index
+from symbol_registry import symbol_registry
+from metrics import open_interest_failures_total
+
+# 参与跨交易所聚合的交易所，逗号分隔；binance 始终由主流程抓取
+EXCHANGES = [e.strip() for e in os.environ.get("EXCHANGES", "binance").split(",") if e.strip()]
+QUOTE = "USDT"
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ✅ 交易所适配器接口：每个交易所自带地址、限额和报文解析，统一输出
+#    {symbol: {"price", "change", "volume", "fundingRate", "openInterest"}}，symbol 统一为 BTCUSDT 形式，
+#    openInterest 统一为标的币数量
+class ExchangeAdapter:
+    name = None
+    base_url = None
+    # 每分钟请求权重上限（各交易所自己的单位），按 WEIGHT_SAFETY 打折后作为本地令牌桶容量
+    weight_limit = 1200
+    weight_header = None
+    max_in_flight = 10
+
+    def fetcher(self):
+        return get_fetcher(self.name, lambda: BinanceFetcher(
+            self.base_url, max_in_flight=self.max_in_flight,
+            weight_limit=self.weight_limit, weight_header=self.weight_header,
+        ))
+
+    async def fetch_tickers(self, fetcher):
+        """
+        返回 {symbol: {"price", "change", "volume"}}
+        """
+        raise NotImplementedError
+
+    async def fetch_open_interest(self, fetcher, symbols=None):
+        """
+        返回 {symbol: 持仓量}
+        """
+        raise NotImplementedError
+
+    async def fetch_funding_rates(self, fetcher):
+        """
+        返回 {symbol: 资金费率}
+        """
+        raise NotImplementedError
+
+    async def fetch_market(self):
+        fetcher = self.fetcher()
+        tickers, open_interest, funding = await asyncio.gather(
+            self.fetch_tickers(fetcher), self.fetch_open_interest(fetcher), self.fetch_funding_rates(fetcher)
+        )
+        result = {}
+        for symbol, ticker in tickers.items():
+            result[symbol] = dict(ticker, fundingRate=funding.get(symbol), openInterest=open_interest.get(symbol))
+        return result
+
+
+# ✅ Binance U 本位合约（原 binance_api 中的报文解析）
+class BinanceAdapter(ExchangeAdapter):
+    name = "binance"
+    base_url = BINANCE_BASE_URL
+    weight_limit = BINANCE_WEIGHT_LIMIT
+    weight_header = "X-MBX-USED-WEIGHT-1m"
+    max_in_flight = BINANCE_MAX_IN_FLIGHT
+
+    @staticmethod
+    def parse_funding(premium_data):
+        return {item["symbol"]: float(item.get("lastFundingRate") or 0.0) for item in premium_data}
+
+    @staticmethod
+    def parse_tickers(ticker_data, premium_data):
+        """
+        返回 fetch_all_data 结构的列式快照：报文字段直接解析成列，资金费率按币种编号对齐
+        """
+        items = [item for item in ticker_data if item["symbol"].endswith(QUOTE)]
+        frame = Frame.from_symbols([item["symbol"] for item in items], {
+            "price": np.array([item["lastPrice"] for item in items], dtype=float),
+            "change": np.array([item["priceChangePercent"] for item in items], dtype=float),
+            "volume": np.array([item["quoteVolume"] for item in items], dtype=float),
+        })
+        funding_ids = symbol_index.ids([item["symbol"] for item in premium_data])
+        funding = np.array([item.get("lastFundingRate") or 0.0 for item in premium_data], dtype=float)
+        return frame.with_columns({"fundingRate": symbol_index.scatter(funding_ids, funding)[frame.ids]})
+
+    def fetcher(self):
+        # 与 binance_api / symbol_registry 共用默认的 Binance fetcher 和权重桶
+        return get_fetcher()
+
+    async def fetch_tickers(self, fetcher):
+        ticker_data, premium_data = await asyncio.gather(
+            fetcher.get_json("/fapi/v1/ticker/24hr", weight=40),
+            fetcher.get_json("/fapi/v1/premiumIndex", weight=10),
+        )
+        return {
+            row["symbol"]: {"price": row["price"], "change": row["change"], "volume": row["volume"]}
+            for row in self.parse_tickers(ticker_data, premium_data)
+        }
+
+    async def fetch_funding_rates(self, fetcher):
+        if market_state.is_fresh():
+            return market_state.funding_rates()
+        try:
+            premium_data = await fetcher.get_json("/fapi/v1/premiumIndex", weight=10)
+        except (ExchangeAPIError, ValueError) as e:
+            print("❌ 获取资金费率失败:", e)
+            return {}
+        # 同一份报文里的标记价格 / 指数价格补进行情表，供派生指标使用
+        market_state.apply_premium(premium_data)
+        return self.parse_funding(premium_data)
+
+    async def _fetch_one(self, fetcher, symbol):
+        try:
+            data = await fetcher.get_json("/fapi/v1/openInterest", params={"symbol": symbol}, weight=1)
+            if "openInterest" not in data:
+                return None
+            return float(data["openInterest"])
+        except (ExchangeAPIError, ValueError) as e:
+            open_interest_failures_total.inc(symbol=symbol)
+            print(f"❌ 获取 {symbol} 持仓量失败: {e}")
+            return None
+
+    async def fetch_open_interest(self, fetcher, symbols=None):
+        # Binance 没有批量持仓量接口，只能逐个币种请求；并发与限速由 fetcher 控制
+        if symbols is None:
+            symbols = await symbol_registry.get_symbols(fetcher)
+        values = await asyncio.gather(*[self._fetch_one(fetcher, symbol) for symbol in symbols])
+        return {symbol: value for symbol, value in zip(symbols, values) if value is not None}
+
+
+# ✅ Bybit V5 线性合约：一个 tickers 请求就包含价格、成交额、资金费率和持仓量
+class BybitAdapter(ExchangeAdapter):
+    name = "bybit"
+    base_url = os.environ.get("BYBIT_BASE_URL", "https://api.bybit.com")
+    # 公共接口限制为每 IP 每 5 秒 600 次
+    weight_limit = 6000
+
+    @staticmethod
+    def parse_tickers(payload):
+        if payload.get("retCode") not in (0, None):
+            raise ExchangeAPIError(f"bybit 返回错误: {payload.get('retMsg')}")
+        result = {}
+        for item in payload.get("result", {}).get("list", []):
+            symbol = item.get("symbol", "")
+            price = _float(item.get("lastPrice"))
+            if not symbol.endswith(QUOTE) or not price:
+                continue
+            change = _float(item.get("price24hPcnt"))
+            result[symbol] = {
+                "price": price,
+                "change": change * 100 if change is not None else None,
+                "volume": _float(item.get("turnover24h")),
+                "fundingRate": _float(item.get("fundingRate")),
+                "openInterest": _float(item.get("openInterest")),
+            }
+        return result
+
+    async def fetch_market(self):
+        payload = await self.fetcher().get_json("/v5/market/tickers", params={"category": "linear"})
+        return self.parse_tickers(payload)
+
+
+# ✅ OKX 永续合约：行情和持仓量各一个批量接口，资金费率只能逐个合约查询，每轮轮换查询一批并缓存
+class OkxAdapter(ExchangeAdapter):
+    name = "okx"
+    base_url = os.environ.get("OKX_BASE_URL", "https://www.okx.com")
+    # 资金费率接口限制为每 2 秒 10 次
+    weight_limit = 300
+    max_in_flight = 5
+    funding_batch = int(os.environ.get("OKX_FUNDING_BATCH", 60))
+
+    def __init__(self):
+        self._funding = {}
+        self._cursor = 0
+
+    @staticmethod
+    def to_symbol(inst_id):
+        """
+        BTC-USDT-SWAP -> BTCUSDT；非 USDT 永续返回 None
+        """
+        parts = inst_id.split("-")
+        if len(parts) != 3 or parts[1] != QUOTE or parts[2] != "SWAP":
+            return None
+        return parts[0] + parts[1]
+
+    @staticmethod
+    def _data(payload):
+        if str(payload.get("code", "0")) != "0":
+            raise ExchangeAPIError(f"okx 返回错误: {payload.get('msg')}")
+        return payload.get("data", [])
+
+    async def fetch_tickers(self, fetcher):
+        payload = await fetcher.get_json("/api/v5/market/tickers", params={"instType": "SWAP"})
+        result = {}
+        for item in self._data(payload):
+            symbol = self.to_symbol(item.get("instId", ""))
+            price, open_24h = _float(item.get("last")), _float(item.get("open24h"))
+            if symbol is None or not price:
+                continue
+            base_volume = _float(item.get("volCcy24h"))
+            result[symbol] = {
+                "price": price,
+                "change": (price - open_24h) / open_24h * 100 if open_24h else None,
+                "volume": base_volume * price if base_volume is not None else None,
+            }
+        return result
+
+    async def fetch_open_interest(self, fetcher, symbols=None):
+        payload = await fetcher.get_json("/api/v5/public/open-interest", params={"instType": "SWAP"})
+        result = {}
+        for item in self._data(payload):
+            symbol = self.to_symbol(item.get("instId", ""))
+            value = _float(item.get("oiCcy"))
+            if symbol is not None and value is not None:
+                result[symbol] = value
+        return result
+
+    async def _fetch_funding(self, fetcher, inst_id):
+        try:
+            data = self._data(await fetcher.get_json("/api/v5/public/funding-rate", params={"instId": inst_id}))
+            if data:
+                self._funding[self.to_symbol(inst_id)] = _float(data[0].get("fundingRate"))
+        except (ExchangeAPIError, ValueError) as e:
+            print(f"❌ okx 获取 {inst_id} 资金费率失败: {e}")
+
+    async def fetch_funding_rates(self, fetcher):
+        return self._funding
+
+    async def fetch_market(self):
+        fetcher = self.fetcher()
+        tickers, open_interest = await asyncio.gather(self.fetch_tickers(fetcher), self.fetch_open_interest(fetcher))
+        # 资金费率按轮换批次刷新，控制每轮请求数，保证整轮在调度间隔内完成
+        inst_ids = [f"{s[:-len(QUOTE)]}-{QUOTE}-SWAP" for s in sorted(tickers)]
+        if inst_ids:
+            start = self._cursor % len(inst_ids)
+            batch = (inst_ids[start:] + inst_ids[:start])[:self.funding_batch]
+            self._cursor = start + len(batch)
+            await asyncio.gather(*[self._fetch_funding(fetcher, inst_id) for inst_id in batch])
+        return {
+            symbol: dict(ticker, fundingRate=self._funding.get(symbol), openInterest=open_interest.get(symbol))
+            for symbol, ticker in tickers.items()
+        }
+
+
+# 新增交易所只需实现适配器并在这里登记
+ADAPTERS = {
+    "binance": BinanceAdapter,
+    "bybit": BybitAdapter,
+    "okx": OkxAdapter,
+}
+
+_instances = {}
+
+_unknown = [n for n in EXCHANGES if n not in ADAPTERS]
+if _unknown:
+    print(f"⚠️ 未知的交易所已忽略: {', '.join(_unknown)}")
+
+
+def get_adapter(name):
+    adapter = _instances.get(name)
+    if adapter is None:
+        adapter = _instances[name] = ADAPTERS[name]()
+    return adapter
+
+
+def extra_adapters(names=None):
+    """
+    除 Binance 以外需要单独抓取的交易所（Binance 的数据来自主抓取流程）
+    """
+    names = EXCHANGES if names is None else names
+    return [get_adapter(n) for n in names if n in ADAPTERS and n != "binance"]
@@ -0,0 +1,171 @@
+# fake_binance.py
+# 本地 Binance 合约 REST 假服务端（基准测试用）：N 个合成币种，可配置延迟和 429 比例
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def synthetic_symbols(n):
+    return [f"S{i:05d}USDT" for i in range(n)]
+
+
+# ✅ 响应体在启动时一次性生成，避免假服务端自身的编码开销混进测量结果
+class FakeBinance:
+    def __init__(self, symbols=400, latency=0.0, error_rate=0.0, seed=42, host="127.0.0.1", port=0):
+        """
+        latency:    每个请求固定增加的秒数（模拟网络往返）
+        error_rate: 返回 429 的概率（不带 Retry-After，走客户端自己的退避）
+        """
+        self.symbols = synthetic_symbols(symbols)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.stats = {"requests": 0, "throttled": 0, "not_modified": 0}
+        self._build(seed)
+
+    def _build(self, seed):
+        rng = random.Random(seed)
+        prices = {s: rng.uniform(0.01, 50000) for s in self.symbols}
+        self.open_interest = {s: rng.uniform(1e3, 1e8) for s in self.symbols}
+        self.payloads = {
+            "/fapi/v1/ticker/24hr": json.dumps([
+                {
+                    "symbol": s,
+                    "lastPrice": f"{prices[s]:.6f}",
+                    "priceChangePercent": f"{rng.uniform(-15, 15):.3f}",
+                    "quoteVolume": f"{rng.uniform(1e5, 1e10):.2f}",
+                }
+                for s in self.symbols
+            ]).encode(),
+            "/fapi/v1/premiumIndex": json.dumps([
+                {
+                    "symbol": s,
+                    "markPrice": f"{prices[s]:.6f}",
+                    "indexPrice": f"{prices[s]:.6f}",
+                    "lastFundingRate": f"{rng.uniform(-0.001, 0.001):.8f}",
+                }
+                for s in self.symbols
+            ]).encode(),
+            "/fapi/v1/exchangeInfo": json.dumps({"symbols": [
+                {
+                    "symbol": s,
+                    "pair": s,
+                    "contractType": "PERPETUAL",
+                    "baseAsset": s[:-4],
+                    "quoteAsset": "USDT",
+                    "status": "TRADING",
+                    "pricePrecision": 6,
+                    "quantityPrecision": 3,
+                    "filters": [
+                        {"filterType": "PRICE_FILTER", "tickSize": "0.000001"},
+                        {"filterType": "LOT_SIZE", "stepSize": "0.001"},
+                    ],
+                }
+                for s in self.symbols
+            ]}).encode(),
+        }
+        self.etag = f'"{seed}-{len(self.symbols)}"'
+
+    def _throttled(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                fake.stats["requests"] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake._throttled():
+                    fake.stats["throttled"] += 1
+                    return self._send(429, b'{"code":-1003,"msg":"Too many requests"}')
+                if url.path == "/fapi/v1/openInterest":
+                    symbol = parse_qs(url.query).get("symbol", [""])[0]
+                    if symbol not in fake.open_interest:
+                        return self._send(400, b'{"code":-1121,"msg":"Invalid symbol."}')
+                    body = json.dumps({
+                        "symbol": symbol,
+                        "openInterest": f"{fake.open_interest[symbol]:.3f}",
+                        "time": int(time.time() * 1000),
+                    }).encode()
+                    return self._send(200, body)
+                if url.path == "/fapi/v1/exchangeInfo" and self.headers.get("If-None-Match") == fake.etag:
+                    fake.stats["not_modified"] += 1
+                    return self._send(304, headers={"ETag": fake.etag})
+                body = fake.payloads.get(url.path)
+                if body is None:
+                    return self._send(404, b'{"code":-1,"msg":"not found"}')
+                headers = {"ETag": fake.etag} if url.path == "/fapi/v1/exchangeInfo" else None
+                return self._send(200, body, headers)
+
+        return Handler
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self._server.server_address[1]}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-binance", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="本地 Binance 假服务端")
+    parser.add_argument("--symbols", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    server = FakeBinance(args.symbols, args.latency, args.error_rate, port=args.port)
+    print(f"✅ 假服务端已启动: {server.start()}（{args.symbols} 个币种）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
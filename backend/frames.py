@@ -0,0 +1,208 @@
+# frames.py
+
+import sys
+import threading
+import numpy as np
+
+
+# ✅ 全进程共用的币种驻留表：每个 symbol 分配一个稳定的整数编号（只增不减），
+#    行情表、EMA 状态和各个列式快照都按编号对齐，symbol 字符串全进程只保留一份
+class SymbolIndex:
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def id(self, symbol):
+        i = self._ids.get(symbol)
+        if i is None:
+            with self._lock:
+                i = self._ids.get(symbol)
+                if i is None:
+                    symbol = sys.intern(symbol)
+                    i = self._ids[symbol] = len(self._names)
+                    self._names.append(symbol)
+        return i
+
+    def ids(self, symbols):
+        get = self._ids.get
+        ids = [get(s) for s in symbols]
+        if None in ids:
+            ids = [self.id(s) if i is None else i for s, i in zip(symbols, ids)]
+        return np.array(ids, dtype=np.int64)
+
+    def names(self, ids):
+        names = self._names
+        return [names[i] for i in np.asarray(ids).tolist()]
+
+    def scatter(self, ids, values, fill=np.nan):
+        """
+        把按 ids 排列的值铺到以编号为下标的数组上，用于不同快照之间按币种对齐
+        """
+        out = np.full(len(self._names), fill, dtype=float)
+        out[ids] = values
+        return out
+
+
+symbol_index = SymbolIndex()
+
+
+def _path(row, key):
+    for part in key.split("."):
+        row = row.get(part) if isinstance(row, dict) else None
+    return row
+
+
+def to_list(values):
+    """
+    NaN -> None，其余转成 Python float
+    """
+    values_list = values.tolist()
+    if np.isnan(values).any():
+        return [None if x != x else x for x in values_list]
+    return values_list
+
+
+# ✅ 列式快照：一组币种编号 + 若干等长 float64 列（缺失值为 NaN），列名用 . 表示接口里的嵌套字段
+#    （例如 openInterestChange.5m）。计算全部在列上向量化完成，只有序列化 / 迭代时才按需生成一次行字典，
+#    迭代、下标和 len 与原来的行列表一致，旧的调用方不需要修改
+class Frame:
+    def __init__(self, ids, columns, symbols=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.columns = columns
+        self._symbols = symbols
+        self._rows = None
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=np.int64), {}, [])
+
+    @classmethod
+    def from_symbols(cls, symbols, columns):
+        return cls(symbol_index.ids(symbols), columns, [sys.intern(s) for s in symbols])
+
+    @classmethod
+    def from_rows(cls, rows, names):
+        """
+        兼容旧的行列表：按 names（可以是 . 连接的嵌套字段）取列
+        """
+        symbols = [row["symbol"] for row in rows]
+        return cls.from_symbols(symbols, {
+            name: np.array([_path(row, name) for row in rows], dtype=float) for name in names
+        })
+
+    @property
+    def symbols(self):
+        if self._symbols is None:
+            self._symbols = symbol_index.names(self.ids)
+        return self._symbols
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __getitem__(self, i):
+        return self.rows()[i]
+
+    def get(self, name):
+        column = self.columns.get(name)
+        return np.full(len(self.ids), np.nan) if column is None else column
+
+    def with_columns(self, columns):
+        """
+        增加 / 替换列，已有的列数组共享不拷贝
+        """
+        return Frame(self.ids, dict(self.columns, **columns), self._symbols)
+
+    def take(self, idx):
+        symbols = self.symbols
+        positions = np.flatnonzero(idx) if np.asarray(idx).dtype == bool else np.asarray(idx)
+        return Frame(
+            self.ids[positions],
+            {name: column[positions] for name, column in self.columns.items()},
+            [symbols[i] for i in positions.tolist()],
+        )
+
+    def align(self, ids, name):
+        """
+        按 ids 的顺序取本快照的一列，本快照里没有的币种为 NaN
+        """
+        if not len(self.ids):
+            return np.full(len(ids), np.nan)
+        return symbol_index.scatter(self.ids, self.get(name))[ids]
+
+    def merge(self, other):
+        """
+        other 中的币种替换本快照里的同名行，其余保持不变
+        """
+        if not len(self.ids):
+            return other
+        keep = ~np.isin(self.ids, other.ids)
+        names = list(self.columns) + [n for n in other.columns if n not in self.columns]
+        symbols = [s for s, k in zip(self.symbols, keep.tolist()) if k] + other.symbols
+        return Frame(
+            np.concatenate([self.ids[keep], other.ids]),
+            {n: np.concatenate([self.get(n)[keep], other.get(n)]) for n in names},
+            symbols,
+        )
+
+    def drop(self, symbols):
+        return self.take(~np.isin(self.ids, symbol_index.ids(symbols)))
+
+    def row(self, i):
+        """
+        单行的扁平字典（列名原样作为键），用于告警文案
+        """
+        row = {"symbol": self.symbols[i]}
+        for name, column in self.columns.items():
+            value = column[i]
+            row[name] = None if np.isnan(value) else float(value)
+        return row
+
+    def rows(self):
+        """
+        接口结构的行字典列表（嵌套字段还原成子字典），每个快照只生成一次；调用方不应修改
+        """
+        if self._rows is None:
+            layout = []
+            groups = {}
+            for name, column in self.columns.items():
+                values = to_list(column)
+                if "." in name:
+                    parent, child = name.split(".", 1)
+                    if parent not in groups:
+                        groups[parent] = []
+                        layout.append((parent, True, groups[parent]))
+                    groups[parent].append((child, values))
+                else:
+                    layout.append((name, False, values))
+            rows = []
+            for i, symbol in enumerate(self.symbols):
+                row = {"symbol": symbol}
+                for name, nested, values in layout:
+                    row[name] = {child: v[i] for child, v in values} if nested else values[i]
+                rows.append(row)
+            self._rows = rows
+        return self._rows
+
+    def records(self, fields, **constants):
+        """
+        落库用的行：fields 为 {表字段: 列名}，constants 为每行相同的字段（例如 timestamp）
+        """
+        names = list(fields)
+        columns = [to_list(self.get(fields[n])) for n in names]
+        keys = ("symbol", *names, *constants)
+        fixed = tuple(constants.values())
+        return [dict(zip(keys, (symbol, *values, *fixed))) for symbol, *values in zip(self.symbols, *columns)]
+
+
+def as_frame(data, names):
+    """
+    已经是 Frame 时原样返回，旧的行列表按 names 转成列式
+    """
+    return data if isinstance(data, Frame) else Frame.from_rows(data, names)
@@ -0,0 +1,198 @@
+# history_export.py
+
+import argparse
+import datetime
+import os
+import shutil
+import time
+from db import session_scope, Price, PriceData, OpenInterest
+from price_buffer import PriceBuffer, LOOKBACK_MINUTES
+from indicators import EmaEngine
+from alert_rules import AlertEngine, load_rules_file
+
+# 导出表名 -> (模型, 导出列)
+EXPORT_TABLES = {
+    "price": (Price, ("symbol", "timestamp", "price")),
+    "price_data": (PriceData, ("symbol", "timestamp", "price", "ema_7", "ema_25", "ema_99")),
+    "open_interest": (OpenInterest, ("symbol", "timestamp", "open_interest", "change_pct")),
+}
+EXPORT_CHUNK_ROWS = 50000
+OI_LOOKBACK_MINUTES = {"5m": 5, "15m": 15, "1h": 60}
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise RuntimeError("导出 / 回放 Parquet 需要安装 pyarrow") from None
+    return pa, ds
+
+
+def _schema(pa, columns):
+    types = {"symbol": pa.string(), "timestamp": pa.timestamp("us"), "date": pa.string()}
+    return pa.schema([(c, types.get(c, pa.float64())) for c in columns] + [("date", pa.string())])
+
+
+def _partitioning(pa, ds):
+    return ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def _days(start, end):
+    day = datetime.datetime(start.year, start.month, start.day)
+    while day < end:
+        yield day, min(day + datetime.timedelta(days=1), end)
+        day += datetime.timedelta(days=1)
+
+
+# ✅ 按天流式读取，每块转成 Arrow RecordBatch，一天的所有批次通过 RecordBatchReader 一次写入按 date 分区的 Parquet 数据集；
+#    重新导出时 delete_matching 先清掉当天分区里的旧文件，避免残留
+def export_table(table, out_dir, start, end, chunk_rows=EXPORT_CHUNK_ROWS):
+    pa, ds = _pyarrow()
+    model, columns = EXPORT_TABLES[table]
+    schema = _schema(pa, columns)
+    partitioning = _partitioning(pa, ds)
+    target = os.path.join(out_dir, table)
+    attrs = [getattr(model, c) for c in columns]
+    total = 0
+    for day_start, day_end in _days(start, end):
+        date = day_start.strftime("%Y-%m-%d")
+        counted = [0]
+        with session_scope() as session:
+            result = session.query(*attrs).filter(
+                model.timestamp >= day_start, model.timestamp < day_end
+            ).order_by(model.symbol, model.timestamp).execution_options(
+                stream_results=True, yield_per=chunk_rows
+            )
+            reader = pa.RecordBatchReader.from_batches(
+                schema, _batches(pa, schema, result, date, chunk_rows, counted)
+            )
+            ds.write_dataset(
+                reader, target, format="parquet", partitioning=partitioning,
+                basename_template="part-{i}.parquet",
+                existing_data_behavior="delete_matching",
+            )
+        if not counted[0]:
+            # 当天没有数据时 write_dataset 不会碰这个分区，旧导出需要手动清掉
+            shutil.rmtree(os.path.join(target, f"date={date}"), ignore_errors=True)
+        total += counted[0]
+    print(f"✅ {table} 导出完成，共 {total} 行 -> {target}")
+    return total
+
+
+def _batches(pa, schema, result, date, size, counted):
+    width = len(schema) - 1
+    for rows in _chunks(result, size):
+        arrays = [pa.array([r[i] for r in rows], type=schema.field(i).type) for i in range(width)]
+        arrays.append(pa.array([date] * len(rows), type=pa.string()))
+        counted[0] += len(rows)
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _chunks(result, size):
+    chunk = []
+    for row in result:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ✅ 回放：按时间顺序逐批读出 (timestamp, {symbol: value})，不一次性加载全部文件
+def read_ticks(in_dir, table, start, end, value_column):
+    pa, ds = _pyarrow()
+    dataset = ds.dataset(os.path.join(in_dir, table), format="parquet", partitioning=_partitioning(pa, ds))
+    dates = [d.strftime("%Y-%m-%d") for d, _ in _days(start, end)]
+    for date in dates:
+        day = dataset.to_table(
+            columns=["symbol", "timestamp", value_column],
+            filter=(ds.field("date") == date) & (ds.field("timestamp") >= pa.scalar(start, pa.timestamp("us")))
+            & (ds.field("timestamp") < pa.scalar(end, pa.timestamp("us"))),
+        ).sort_by([("timestamp", "ascending")])
+        symbols = day.column("symbol").to_pylist()
+        stamps = day.column("timestamp").to_pylist()
+        values = day.column(value_column).to_pylist()
+        tick, current = None, {}
+        for symbol, ts, value in zip(symbols, stamps, values):
+            if ts != tick and current:
+                yield tick, current
+                current = {}
+            tick = ts
+            current[symbol] = value
+        if current:
+            yield tick, current
+
+
+def replay(in_dir, start, end, rules=None, speed=None):
+    """
+    把导出的价格 / 持仓量历史按时间顺序喂给 EMA 引擎和告警规则引擎。
+    speed 为 None 时全速回放，否则按 speed 倍速还原真实间隔。
+    """
+    prices = PriceBuffer(capacity=256)
+    open_interest = PriceBuffer(capacity=256)
+    emas = EmaEngine()
+    engine = AlertEngine(rules if rules is not None else load_rules_file())
+    oi_ticks = read_ticks(in_dir, "open_interest", start, end, "open_interest") \
+        if os.path.isdir(os.path.join(in_dir, "open_interest")) else iter(())
+    next_oi = next(oi_ticks, None)
+
+    alerts = []
+    ticks = 0
+    last_ts = None
+    for ts, tick in read_ticks(in_dir, "price", start, end, "price"):
+        if speed and last_ts is not None:
+            time.sleep((ts - last_ts).total_seconds() / speed)
+        last_ts = ts
+        while next_oi is not None and next_oi[0] <= ts:
+            open_interest.extend({"symbol": s, "timestamp": next_oi[0], "price": v} for s, v in next_oi[1].items())
+            next_oi = next(oi_ticks, None)
+        prices.extend({"symbol": s, "timestamp": ts, "price": p} for s, p in tick.items())
+
+        rows = []
+        for symbol, price in tick.items():
+            row = {"symbol": symbol, "price": price}
+            row["ema_7"], row["ema_25"], row["ema_99"] = emas.update(symbol, price, ts)
+            _, history = prices.lookback(symbol, LOOKBACK_MINUTES, now=ts)
+            for label, old in history.items():
+                if old:
+                    row[f"change_{label}"] = (price - old) / old * 100
+            current_oi, oi_history = open_interest.lookback(symbol, OI_LOOKBACK_MINUTES, now=ts)
+            for label, old in oi_history.items():
+                if current_oi and old:
+                    row[f"oi_change_{label}"] = (current_oi - old) / old * 100
+            rows.append(row)
+        for alert in engine.evaluate(rows, now=ts.timestamp()):
+            alert["timestamp"] = ts.isoformat()
+            alerts.append(alert)
+        ticks += 1
+    print(f"✅ 回放完成：{ticks} 个时间点，触发 {len(alerts)} 条告警")
+    return alerts
+
+
+def _parse_time(value):
+    return datetime.datetime.fromisoformat(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 / 回放历史行情")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export")
+    exp.add_argument("--table", choices=sorted(EXPORT_TABLES), action="append")
+    exp.add_argument("--start", type=_parse_time, required=True)
+    exp.add_argument("--end", type=_parse_time, default=datetime.datetime.utcnow())
+    exp.add_argument("--out", default="history")
+    rep = sub.add_parser("replay")
+    rep.add_argument("--start", type=_parse_time, required=True)
+    rep.add_argument("--end", type=_parse_time, default=datetime.datetime.utcnow())
+    rep.add_argument("--dir", default="history")
+    rep.add_argument("--speed", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        for name in args.table or ["price", "open_interest"]:
+            export_table(name, args.out, args.start, args.end)
+    else:
+        for alert in replay(args.dir, args.start, args.end, speed=args.speed):
+            print(alert["timestamp"], alert["message"])
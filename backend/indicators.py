@@ -1,13 +1,175 @@
-import pandas as pd
+import datetime
+import threading
+import numpy as np
+from db import session_scope, Price
+from frames import as_frame, symbol_index
+from market_stream import MARKET_COLUMNS
+
+EMA_PERIODS = (7, 25, 99)
+# 一根 K 线的长度（秒），与价格定时任务的采样间隔一致
+BAR_SECONDS = 60
+# 启动回填时每个币种读取的历史分钟数，约 3 倍最长周期，足够让 EMA99 收敛
+SEED_MINUTES = 3 * max(EMA_PERIODS)
+
+
+def _alpha(period):
+    return 2.0 / (period + 1)
+
+
+# ✅ 向量化批量计算：matrix 形状为 (时间, 币种)，缺失值为 NaN，返回每个币种最后的 EMA
+def bulk_ema(matrix, period):
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    alpha = _alpha(period)
+    ema = np.full(matrix.shape[1], np.nan)
+    for row in matrix:
+        valid = ~np.isnan(row)
+        started = ~np.isnan(ema)
+        ema = np.where(valid & started, ema + alpha * (row - ema), ema)
+        ema = np.where(valid & ~started, row, ema)
+    return ema
+
 
 def calculate_ema(prices, period=25):
-    df = pd.DataFrame(prices, columns=["price"])
-    ema = df["price"].ewm(span=period, adjust=False).mean()
-    return round(ema.iloc[-1], 4)
-
-def append_ema(data):
-    for item in data:
-        # 模拟一个历史价格序列用于计算
-        prices = [item["price"]] * 30
-        item["ema25"] = calculate_ema(prices, period=25)
-    return data
+    return round(float(bulk_ema(prices, period)[0]), 4)
+
+
+# ✅ 增量 EMA 引擎：各周期 EMA 状态按 symbol_index 编号存成矩阵，整个市场一次向量化更新
+class EmaEngine:
+    def __init__(self, periods=EMA_PERIODS, bar_seconds=BAR_SECONDS):
+        self.periods = periods
+        self.alphas = np.array([_alpha(p) for p in periods])
+        self.bar_seconds = bar_seconds
+        # 按币种编号：当前K线序号（-1 表示没有状态）、上一根K线收盘时的 EMA、含当前价格的 EMA
+        self._bars = np.full(0, -1, dtype=np.int64)
+        self._prev = np.full((0, len(periods)), np.nan)
+        self._cur = np.full((0, len(periods)), np.nan)
+        self._lock = threading.Lock()
+
+    def _bar(self, ts):
+        return int(ts.timestamp() // self.bar_seconds) if isinstance(ts, datetime.datetime) else int(ts // self.bar_seconds)
+
+    def _ensure(self, ids):
+        size = len(self._bars)
+        needed = int(ids.max()) + 1 if len(ids) else 0
+        if needed > size:
+            grown = max(needed, size * 2, 64)
+            bars = np.full(grown, -1, dtype=np.int64)
+            bars[:size] = self._bars
+            prev = np.full((grown, len(self.periods)), np.nan)
+            prev[:size] = self._prev
+            cur = np.full((grown, len(self.periods)), np.nan)
+            cur[:size] = self._cur
+            self._bars, self._prev, self._cur = bars, prev, cur
+
+    def update_many(self, ids, prices, ts):
+        """
+        ids / prices 为等长数组，返回形状 (币种, 周期) 的 EMA；
+        同一根 K 线内的多次更新只修正当前值，不会重复推进 EMA
+        """
+        bar = self._bar(ts)
+        prices = np.asarray(prices, dtype=float)
+        valid = ~np.isnan(prices)
+        with self._lock:
+            self._ensure(ids)
+            bars = self._bars[ids]
+            new = valid & (bars < 0)
+            live = valid & (bars >= 0) & (bars <= bar)
+            advance = ids[live & (bars < bar)]
+            self._prev[advance] = self._cur[advance]
+            self._bars[advance] = bar
+            live_ids = ids[live]
+            prev = self._prev[live_ids]
+            self._cur[live_ids] = prev + self.alphas * (prices[live, None] - prev)
+            new_ids = ids[new]
+            self._bars[new_ids] = bar
+            self._prev[new_ids] = prices[new, None]
+            self._cur[new_ids] = prices[new, None]
+            return self._cur[ids]
+
+    def update(self, symbol, price, ts):
+        return self.update_many(symbol_index.ids([symbol]), [price], ts)[0].tolist()
+
+    def discard(self, symbols):
+        ids = symbol_index.ids(symbols)
+        with self._lock:
+            ids = ids[ids < len(self._bars)]
+            self._bars[ids] = -1
+            self._prev[ids] = np.nan
+            self._cur[ids] = np.nan
+
+    def get(self, symbol):
+        i = symbol_index.id(symbol)
+        with self._lock:
+            if i >= len(self._bars) or self._bars[i] < 0:
+                return None
+            return self._cur[i].tolist()
+
+    # ✅ 用 price 表的历史价格做一次向量化回填
+    def seed(self, rows):
+        """
+        rows: 按时间升序的 (symbol, timestamp, price)
+        """
+        symbols = {}
+        bars = {}
+        for symbol, ts, price in rows:
+            symbols.setdefault(symbol, len(symbols))
+            bars.setdefault(self._bar(ts), {})[symbol] = price
+        if not symbols:
+            return 0
+        ordered_bars = sorted(bars)
+        matrix = np.full((len(ordered_bars), len(symbols)), np.nan)
+        for t, bar in enumerate(ordered_bars):
+            for symbol, price in bars[bar].items():
+                matrix[t, symbols[symbol]] = price
+        # 最后一根 K 线可能还会继续更新，所以分别保存收盘前和含最后价格的 EMA
+        current = [bulk_ema(matrix, p) for p in self.periods]
+        previous = [bulk_ema(matrix[:-1], p) for p in self.periods]
+        last_bar = ordered_bars[-1]
+        ids = symbol_index.ids(list(symbols))
+        cur = np.column_stack(current)
+        prev = np.column_stack(previous)
+        # 最后一根 K 线上没有价格（或历史不足）的币种，收盘前的 EMA 就是当前 EMA
+        stale = np.isnan(matrix[-1]) | np.isnan(prev).any(axis=1)
+        prev[stale] = cur[stale]
+        with self._lock:
+            self._ensure(ids)
+            self._bars[ids] = last_bar
+            self._prev[ids] = prev
+            self._cur[ids] = cur
+        return len(symbols)
+
+    def seed_from_db(self, minutes=SEED_MINUTES):
+        since = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes)
+        try:
+            with session_scope() as session:
+                rows = (
+                    session.query(Price.symbol, Price.timestamp, Price.price)
+                    .filter(Price.timestamp >= since)
+                    .order_by(Price.timestamp.asc())
+                    .all()
+                )
+            count = self.seed(rows)
+            print(f"✅ EMA 状态已回填 {count} 个币种")
+        except Exception as e:
+            print("❌ EMA 状态回填失败:", e)
+
+
+ema_engine = EmaEngine()
+
+
+def append_ema(data, ts=None):
+    """
+    返回增加了 ema_7 / ema_25 / ema_99 列的快照（不修改传入的快照）
+    """
+    ts = ts or datetime.datetime.utcnow()
+    frame = as_frame(data, MARKET_COLUMNS)
+    emas = np.round(ema_engine.update_many(frame.ids, frame.get("price"), ts), 4)
+    return frame.with_columns({
+        "ema_7": emas[:, 0],
+        "ema_25": emas[:, 1],
+        "ema_99": emas[:, 2],
+        # 兼容前端和告警使用的旧字段
+        "ema25": emas[:, 1],
+    })
@@ -0,0 +1,397 @@
+# ingestion.py
+
+import asyncio
+import datetime
+import time
+import numpy as np
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.base import JobLookupError
+from binance_api import fetch_all_data, get_market_data, get_open_interest_data
+from indicators import append_ema, ema_engine
+from alerts import check_ema_alerts, check_price_change_alerts, check_open_interest_alerts
+from alert_rules import alert_engine
+from database import save_data
+from write_behind import write_behind
+from price_buffer import price_buffer, LOOKBACK_MINUTES
+from open_interest_view import open_interest_view
+from derived_metrics import derived_metrics
+from exchanges import extra_adapters
+from cross_venue import cross_venue_view, fetch_venues, binance_venue_data
+from market_stream import MarketStream, market_state
+from symbol_registry import symbol_registry
+from snapshot_cache import SnapshotCache
+from ranking import rankings, ranked_payload
+from shared_snapshot import shared_snapshot, VENUES as SHARED_VENUES
+from broadcaster import broadcaster
+from background_loop import background_loop
+from binance_fetcher import close_fetcher, get_fetcher
+from storage import run_rollups, run_retention
+from leader import leader
+from startup import profile
+from metrics import registry, stage, job_failures_total, instrument_scheduler
+from scheduling import (
+    AlignedTrigger, AdaptivePlanner, schedule_stats, tick_time,
+    PRICE_SAMPLE_SECONDS, PRICE_PERSIST_SECONDS, OI_TICK_SECONDS,
+)
+
+# 只有 leader 进程执行的任务（抓取 + 写库 + 聚合 / 保留策略）
+LEADER_JOBS = ("update_price_data", "update_open_interest_data", "run_rollups", "run_retention")
+# follower 进程从数据库同步 leader 写入的数据
+FOLLOWER_JOBS = ("sync_from_leader", "sync_from_shared")
+# 当前是否为 follower：涨跌幅优先读同机 leader 发布的共享快照
+following = False
+
+
+# ✅ 给规则引擎准备指标：多周期涨跌幅来自价格缓冲区，持仓量变化来自最近一轮抓取，按币种编号整列对齐
+def build_rule_metrics(data):
+    changes = price_buffer.changes()
+    oi = open_interest_view.frame
+    columns = {f"change_{label}": changes.align(data.ids, f"change.{label}") for label in LOOKBACK_MINUTES}
+    columns.update({f"oi_change_{h}": oi.align(data.ids, f"openInterestChange.{h}") for h in ("5m", "15m", "1h")})
+    return data.with_columns(columns)
+
+def build_alerts(data):
+    return {
+        "ema_alerts": check_ema_alerts(data),
+        "change_alerts": check_price_change_alerts(data),
+        "rule_alerts": alert_engine.evaluate(build_rule_metrics(data))
+    }
+
+# ✅ 行情快照：价格 + EMA + 告警，只在定时任务或缓存过期时计算；
+#    follower 只读本进程 WebSocket 维护的行情表，行情表过期时的 REST 回退只由 leader 执行
+def build_market_snapshot():
+    data = append_ema(market_state.frame() if following else get_market_data())
+    return {"data": data, "alerts": build_alerts(data)}
+
+market_snapshot = SnapshotCache(build_market_snapshot, name="market_snapshot")
+
+# ✅ 多周期涨跌幅：直接从内存缓冲区读取当前价格和各周期历史价格；
+#    同机 follower 直接使用 leader 发布到共享快照里的结果。返回 (版本号, Frame)，两者一起读取
+def price_change_snapshot():
+    if following:
+        view = shared_snapshot.read()
+        if view is not None and view.changes_at:
+            return ("shared", view.changes_at), view.price_change_rows()
+    version, frame = price_buffer.latest_changes()
+    # 接口里涨跌幅保留两位小数，没有历史价格时为 0
+    return version, frame.with_columns({
+        name: np.nan_to_num(np.round(column, 2))
+        for name, column in frame.columns.items() if name.startswith("change.")
+    })
+
+def build_price_change():
+    return price_change_snapshot()[1]
+
+# ✅ 最新持仓量视图 + 告警
+def build_open_interest_payload():
+    data = open_interest_view.rows()
+    return {"data": data, "alerts": check_open_interest_alerts(data)}
+
+# ✅ 共享快照只在选举模式下由 leader 发布（off 模式下每个进程都是 leader，不能多写）
+def publishes_shared():
+    return leader.is_leader and leader.mode != "off"
+
+def publish_shared(**parts):
+    if not publishes_shared():
+        return
+    try:
+        with stage("shared_snapshot", "publish"):
+            shared_snapshot.publish(**parts)
+    except Exception as e:
+        print("❌ 共享快照发布失败:", e)
+
+# ✅ 排序 / top-K / 过滤查询：每个接口返回 (版本号, 行)，两者一起读取，避免新数据被缓存在旧版本号下；
+#    索引在版本变化后第一次查询时重建
+def _market_rows():
+    version, snapshot = market_snapshot.get()
+    return version, snapshot["data"]
+
+RANKED_SOURCES = {
+    "data": _market_rows,
+    "price_change": price_change_snapshot,
+    "open_interest": open_interest_view.snapshot,
+}
+
+def ranked_response(name, query, message="成功获取"):
+    """
+    返回 (版本号, 构建响应体的函数)，交给 response_cache 按参数缓存
+    """
+    version, rows = RANKED_SOURCES[name]()
+
+    def build():
+        index = rankings.get(name, version, lambda: rows, market_state.volumes)
+        return dict(ranked_payload(index, query), message=message)
+    return version, build
+
+# ✅ 每轮定时任务计算一次，推送给所有 SSE 订阅者
+def publish_market_update(snapshot):
+    broadcaster.publish("market", snapshot)
+    broadcaster.publish("price_change", {"data": build_price_change()})
+    if snapshot["alerts"]["rule_alerts"]:
+        broadcaster.publish("alerts", snapshot["alerts"]["rule_alerts"])
+
+# ✅ 定时任务：亚分钟价格采样，只写内存缓冲区，涨跌幅在几秒内反映快速行情
+def sample_prices():
+    try:
+        # 行情推送中断时不采样，整分钟任务会走 REST 补缺
+        if not market_state.is_fresh():
+            return
+        now = tick_time(PRICE_SAMPLE_SECONDS)
+        with stage("sample_prices", "buffer"):
+            price_buffer.extend_frame(market_state.frame(), now)
+        if publishes_shared():
+            publish_shared(price_changes=build_price_change())
+        if broadcaster.subscribers:
+            with stage("sample_prices", "publish"):
+                broadcaster.publish("price_change", {"data": build_price_change()})
+    except Exception as e:
+        job_failures_total.inc(job="sample_prices")
+        print("❌ 价格采样失败:", e)
+
+# ✅ 定时任务：更新价格数据（落库 + EMA + 告警），时间戳取对齐后的节拍
+def update_price_data():
+    try:
+        print("📈 正在抓取价格数据...")
+        start = time.time()
+        now = tick_time(PRICE_PERSIST_SECONDS)
+        with stage("update_price_data", "snapshot"):
+            snapshot = market_snapshot.refresh()
+        price_data = snapshot["data"]
+        with stage("update_price_data", "buffer"):
+            price_buffer.extend_frame(price_data, now)
+        with stage("update_price_data", "enqueue"):
+            write_behind.enqueue("price", price_data.records({"price": "price"}, timestamp=now))
+            save_data(price_data, now)
+        with stage("update_price_data", "publish"):
+            publish_shared(market_rows=price_data)
+            publish_market_update(snapshot)
+        print(f"✅ 价格数据已保存，用时 {time.time() - start:.2f}s")
+    except Exception as e:
+        job_failures_total.inc(job="update_price_data")
+        print("❌ 价格数据保存失败:", e)
+
+# ✅ 定时任务：更新持仓量数据（自动保存）
+# 抓取只在常驻后台事件循环上执行，锁在该循环内首次使用时绑定
+open_interest_lock = asyncio.Lock()
+oi_planner = AdaptivePlanner()
+
+# 波动分数：5 分钟价格变化 + 最近一轮持仓量 5 分钟变化（绝对百分比）
+def _volatility_scores():
+    active = set(symbol_registry.symbols())
+    changes = price_buffer.changes({"5m": 5})
+    scores = np.abs(np.nan_to_num(changes.get("change.5m")))
+    scores += np.abs(np.nan_to_num(open_interest_view.frame.align(changes.ids, "openInterestChange.5m")))
+    return {symbol: score for symbol, score in zip(changes.symbols, scores.tolist()) if symbol in active}
+
+async def safe_get_open_interest(now=None):
+    """
+    整分钟节拍抓全部币种（并发抓取其他交易所），其余节拍只抓到期的高波动币种；
+    返回本轮是否为全量抓取，没有需要抓取的币种时返回 None
+    """
+    now = now or tick_time(OI_TICK_SECONDS)
+    async with open_interest_lock:
+        if oi_planner.is_full(now):
+            # Binance 逐币种抓取与其他交易所的批量接口并发进行，各自使用独立的限额
+            result, venues = await asyncio.gather(
+                get_open_interest_data(now=now), fetch_venues(extra_adapters())
+            )
+            open_interest_view.update(result, now)
+            with stage("open_interest", "derived"):
+                derived_metrics.update(result, now)
+            oi_planner.mark(result.symbols, now, full=True)
+            venues["binance"] = binance_venue_data(result, market_state.frame())
+            cross_venue_view.update(venues, now)
+            return True
+        symbols = oi_planner.plan(_volatility_scores(), get_fetcher().bucket.remaining, now)
+        oi_planner.mark(symbols, now)
+        if not symbols:
+            return None
+        open_interest_view.merge(await get_open_interest_data(symbols, now=now), now)
+        return False
+
+async def crawl_open_interest():
+    try:
+        start = time.time()
+        full = await safe_get_open_interest()
+        if full is None:
+            return
+        with stage("open_interest", "publish"):
+            # 其他交易所只由 leader 抓取，全量节拍后随持仓量一起发布给同机 follower
+            publish_shared(
+                open_interest_rows=open_interest_view.frame,
+                venues=cross_venue_view.extra_venues() if full else None,
+            )
+            broadcaster.publish("open_interest", build_open_interest_payload())
+            if full:
+                broadcaster.publish("cross_venue", cross_venue_view.payload())
+        print(f"✅ 持仓量数据已抓取并保存（{'全量' if full else '高波动'}），用时 {time.time() - start:.2f}s")
+    except Exception as e:
+        job_failures_total.inc(job="update_open_interest_data")
+        print("❌ 持仓量数据保存失败:", e)
+
+def update_open_interest_data():
+    background_loop.run(crawl_open_interest())
+
+# ✅ follower 的跨交易所视图：Binance 部分来自本进程同步的持仓量视图；其他交易所只由 leader 抓取，
+#    通过共享快照分发（见 sync_from_shared），follower 不再各自请求，同一台机器上只有一份出站流量。
+#    leader 不在本机时 follower 只有 Binance 部分
+def sync_cross_venue(venues=None, updated_at=None):
+    venues = dict(venues or {})
+    updated_at = dict(updated_at or {})
+    venues["binance"] = binance_venue_data(open_interest_view.frame, market_state.frame())
+    updated_at["binance"] = open_interest_view.updated_at
+    cross_venue_view.update(venues, updated_at)
+    broadcaster.publish("cross_venue", cross_venue_view.payload())
+
+# ✅ follower 任务（同机）：leader 每次发布后几秒内从共享快照拿到行情、持仓量和其他交易所数据，不查数据库
+_shared_seen = {"market": 0.0, "open_interest": 0.0, "venues": 0.0}
+
+def sync_from_shared():
+    try:
+        view = shared_snapshot.read()
+        if view is None:
+            return
+        if view.market_at > _shared_seen["market"]:
+            _shared_seen["market"] = view.market_at
+            data = view.market_rows()
+            publish_market_update(market_snapshot.set({"data": data, "alerts": build_alerts(data)}))
+        if view.open_interest_at > _shared_seen["open_interest"]:
+            _shared_seen["open_interest"] = view.open_interest_at
+            open_interest_view.update(view.open_interest_rows(), view.updated_at("open_interest"))
+            broadcaster.publish("open_interest", build_open_interest_payload())
+        venues_at = max((getattr(view, f"{venue}_at") for venue in SHARED_VENUES), default=0.0)
+        if venues_at > _shared_seen["venues"]:
+            _shared_seen["venues"] = venues_at
+            sync_cross_venue(*view.venue_data())
+    except Exception as e:
+        job_failures_total.inc(job="sync_from_shared")
+        print("❌ 共享快照同步失败:", e)
+
+# ✅ follower 任务：不访问 Binance REST（行情只读本进程的 WebSocket 行情表，见 build_market_snapshot）、不写库；
+#    leader 不在本机（共享快照过期）时从数据库追上 leader 写入的数据
+def sync_from_leader():
+    try:
+        if shared_snapshot.read() is None:
+            price_buffer.hydrate(minutes=3)
+            publish_market_update(market_snapshot.refresh())
+            open_interest_view.hydrate()
+            broadcaster.publish("open_interest", build_open_interest_payload())
+        sync_cross_venue()
+    except Exception as e:
+        job_failures_total.inc(job="sync_from_leader")
+        print("❌ follower 同步失败:", e)
+
+# ✅ 合约下架时增量清理各内存缓存；新上线的合约在下一轮抓取时自然出现
+@symbol_registry.subscribe
+def on_symbols_changed(added, removed):
+    if added:
+        print(f"🆕 新上线合约: {', '.join(added)}")
+    if removed:
+        for cache in (price_buffer, ema_engine, market_state, open_interest_view, derived_metrics):
+            cache.discard(removed)
+        print(f"🗑️ 已清理下架合约: {', '.join(removed)}")
+
+# ✅ /metrics 抓取时读取的实时状态：数据是否过期一眼可见
+def _open_interest_age():
+    if open_interest_view.updated_at is None:
+        return None
+    return (datetime.datetime.utcnow() - open_interest_view.updated_at).total_seconds()
+
+registry.gauge("market_state_age_seconds", "行情表距最近一次推送的秒数",
+               callback=lambda: time.time() - market_state.updated_at if market_state.updated_at else None)
+registry.gauge("open_interest_view_age_seconds", "持仓量视图距最近一轮抓取的秒数", callback=_open_interest_age)
+registry.gauge("sse_subscribers", "当前 SSE 订阅者数量", callback=lambda: broadcaster.subscribers)
+registry.gauge("ingestion_leader", "当前进程是否为抓取 leader", callback=lambda: int(leader.is_leader))
+
+# ✅ 启动时先加载本地合约缓存，再从数据库回填价格缓冲区、EMA 状态、持仓量视图和派生指标窗口
+def hydrate():
+    with profile.phase("hydrate.symbols"):
+        symbol_registry.load()
+    with profile.phase("hydrate.price_buffer"):
+        price_buffer.hydrate()
+    with profile.phase("hydrate.ema"):
+        ema_engine.seed_from_db()
+    with profile.phase("hydrate.open_interest"):
+        open_interest_view.hydrate()
+    with profile.phase("hydrate.derived_metrics"):
+        derived_metrics.hydrate()
+
+
+def _remove_jobs(scheduler, job_ids):
+    for job_id in job_ids:
+        try:
+            scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+
+def _add_job(scheduler, func, job_id, seconds, next_run_time=None):
+    # 节拍对齐到整 seconds 边界；错过的节拍合并成一次，上一轮未结束时跳过（计入调度统计）
+    options = {"next_run_time": next_run_time} if next_run_time else {}
+    scheduler.add_job(
+        func, AlignedTrigger(seconds), id=job_id, max_instances=1, coalesce=True, replace_existing=True,
+        misfire_grace_time=max(int(seconds), 1), **options
+    )
+
+
+def become_leader(scheduler):
+    global following
+    following = False
+    _remove_jobs(scheduler, FOLLOWER_JOBS)
+    # AsyncIOScheduler 直接在共享事件循环上运行协程任务
+    oi_job = crawl_open_interest if isinstance(scheduler, AsyncIOScheduler) else update_open_interest_data
+    # 当选后立即抓取一轮，不必等第一个间隔
+    now = datetime.datetime.now()
+    _add_job(scheduler, update_price_data, 'update_price_data', PRICE_PERSIST_SECONDS, next_run_time=now)
+    _add_job(scheduler, oi_job, 'update_open_interest_data', OI_TICK_SECONDS, next_run_time=now)
+    _add_job(scheduler, run_rollups, 'run_rollups', 300)
+    _add_job(scheduler, run_retention, 'run_retention', 3600)
+
+
+def become_follower(scheduler):
+    global following
+    following = True
+    _remove_jobs(scheduler, LEADER_JOBS)
+    _add_job(scheduler, sync_from_leader, 'sync_from_leader', 60)
+    _add_job(scheduler, sync_from_shared, 'sync_from_shared', PRICE_SAMPLE_SECONDS)
+
+
+# ✅ 行情 WebSocket 订阅（REST 仅用于补缺）每个进程都跑；抓取和写库只由选出的 leader 负责
+market_stream = MarketStream(market_state, gap_fill=fetch_all_data)
+
+_started = False
+
+def start(scheduler):
+    """
+    scheduler: Flask 模式为 BackgroundScheduler，ASGI 模式为 AsyncIOScheduler；
+    两种模式下协程都提交到 background_loop（ASGI 模式下它就是服务器的事件循环）。
+    每个进程只启动一次，重复调用返回 False
+    """
+    global _started
+    if _started:
+        print("⚠️ 定时任务已经启动，忽略重复调用")
+        return False
+    _started = True
+    instrument_scheduler(scheduler)
+    schedule_stats.attach(scheduler)
+    # 价格采样每个进程都执行：只读本进程的行情表，不访问 REST、不写库
+    _add_job(scheduler, sample_prices, 'sample_prices', PRICE_SAMPLE_SECONDS)
+    become_follower(scheduler)
+    scheduler.start()
+    background_loop.submit(market_stream.run())
+    background_loop.submit(leader.campaign(
+        on_elected=lambda: become_leader(scheduler),
+        on_demoted=lambda: become_follower(scheduler),
+    ))
+    return True
+
+
+def stop(scheduler):
+    """
+    Flask 模式的退出清理；ASGI 模式由 asgi.lifespan 在事件循环内完成
+    """
+    market_stream.stop()
+    scheduler.shutdown(wait=False)
+    background_loop.stop(close_fetcher)
+    write_behind.stop()
+    leader.release()
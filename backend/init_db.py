@@ -1,6 +1,6 @@
 # init_db.py
-from db import create_tables
+from storage import setup_storage
 
 if __name__ == "__main__":
-    create_tables()
+    setup_storage()
     print("✅ 数据库表创建成功！")
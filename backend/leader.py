@@ -0,0 +1,134 @@
+# leader.py
+
+import asyncio
+import os
+import zlib
+from sqlalchemy import text
+from db import engine
+
+# auto：PostgreSQL 用 advisory lock，其他数据库用本地文件锁；off：每个进程都当 leader（单进程部署）
+LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "auto")
+LEADER_LOCK_FILE = os.environ.get(
+    "LEADER_LOCK_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingestion.lock")
+)
+# follower 重新竞选 / leader 检查锁是否还在的间隔
+LEADER_CHECK_SECONDS = float(os.environ.get("LEADER_CHECK_SECONDS", 15))
+
+
+def _lock_file(fd):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+# ✅ 多 worker 部署时只允许一个进程抓取和写库：
+#    PostgreSQL 上持有一个会话级 advisory lock，进程退出或连接断开时锁自动释放
+class LeaderElection:
+    def __init__(self, name="crypto-ingestion", mode=LEADER_ELECTION, lock_file=LEADER_LOCK_FILE):
+        self.name = name
+        self.key = zlib.crc32(name.encode("utf-8"))
+        if mode == "auto":
+            mode = "advisory" if engine.dialect.name == "postgresql" else "file"
+        self.mode = mode
+        self.lock_file = lock_file
+        self.is_leader = False
+        self._conn = None
+        self._fd = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        if self.mode == "off":
+            self.is_leader = True
+        elif self.mode == "advisory":
+            self.is_leader = self._acquire_advisory()
+        else:
+            self.is_leader = self._acquire_file()
+        return self.is_leader
+
+    def _acquire_advisory(self):
+        conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": self.key}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        # 连接必须一直持有，锁跟随会话存在
+        self._conn = conn
+        return True
+
+    def _acquire_file(self):
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _lock_file(fd):
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def check(self):
+        """
+        leader 定期确认锁还在：advisory lock 所在的连接断开后锁已经被释放
+        """
+        if not self.is_leader or self.mode != "advisory":
+            return self.is_leader
+        try:
+            self._conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            print("❌ leader 锁连接已断开:", e)
+            self._release()
+            return False
+
+    def _release(self):
+        self.is_leader = False
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": self.key})
+            except Exception:
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def release(self):
+        if self.is_leader:
+            self._release()
+
+    async def campaign(self, on_elected, on_demoted, interval=LEADER_CHECK_SECONDS):
+        """
+        常驻协程：follower 周期性竞选，leader 周期性确认；数据库调用放到线程池里，不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if not self.is_leader:
+                    if await loop.run_in_executor(None, self.try_acquire):
+                        print(f"✅ 当前进程 {os.getpid()} 成为 leader（{self.mode}）")
+                        on_elected()
+                elif not await loop.run_in_executor(None, self.check):
+                    print(f"⚠️ 当前进程 {os.getpid()} 失去 leader 身份")
+                    on_demoted()
+            except Exception as e:
+                print("❌ leader 选举失败:", e)
+            await asyncio.sleep(interval)
+
+
+leader = LeaderElection()
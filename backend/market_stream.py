@@ -0,0 +1,227 @@
+# market_stream.py
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+import numpy as np
+from frames import Frame, as_frame, symbol_index
+
+# 设为空字符串时不订阅 WebSocket，行情全部走 REST（基准测试 / 没有 WebSocket 的假服务端）
+STREAM_URL = os.environ.get(
+    "BINANCE_WS_URL", "wss://fstream.binance.com/stream?streams=!ticker@arr/!markPrice@arr@1s"
+)
+
+# 超过这个秒数没有推送，就认为行情表已过期，调用方应回退到 REST
+STALE_SECONDS = 15
+
+
+# 行情表的列；change / volume / fundingRate 等缺失值为 NaN
+FIELDS = ("price", "change", "volume", "fundingRate", "markPrice", "indexPrice")
+# fetch_all_data / get_market_data 输出的列
+MARKET_COLUMNS = ("price", "change", "volume", "fundingRate")
+
+
+def _floats(items, key):
+    """
+    直接把推送报文里的字符串字段解析成 float64 列，缺失或空字符串为 NaN
+    """
+    return np.array([item.get(key) if item.get(key) not in (None, "") else np.nan for item in items], dtype=float)
+
+
+# ✅ 内存中的最新行情表：按 symbol_index 编号存放的列（最新价格 / 涨跌幅 / 成交额 / 资金费率 / 标记价格），
+#    推送报文整批解析后按编号一次写入，不再为每个币种维护字典
+class MarketState:
+    def __init__(self):
+        self._columns = {f: np.full(0, np.nan) for f in FIELDS}
+        self._present = np.zeros(0, dtype=bool)
+        self._lock = threading.Lock()
+        self.updated_at = 0.0
+
+    def _ensure(self, ids):
+        size = len(self._present)
+        needed = int(ids.max()) + 1 if len(ids) else 0
+        if needed > size:
+            grown = max(needed, size * 2, 64)
+            for f in FIELDS:
+                column = np.full(grown, np.nan)
+                column[:size] = self._columns[f]
+                self._columns[f] = column
+            present = np.zeros(grown, dtype=bool)
+            present[:size] = self._present
+            self._present = present
+        self._present[ids] = True
+
+    # !ticker@arr 推送的 24hr 行情
+    def apply_tickers(self, tickers):
+        ids = symbol_index.ids([t["s"] for t in tickers])
+        price, change, volume = _floats(tickers, "c"), _floats(tickers, "P"), _floats(tickers, "q")
+        with self._lock:
+            self._ensure(ids)
+            self._columns["price"][ids] = price
+            self._columns["change"][ids] = change
+            self._columns["volume"][ids] = volume
+            self.updated_at = time.time()
+
+    # !markPrice@arr@1s 推送的标记价格和资金费率
+    def apply_mark_prices(self, marks):
+        ids = symbol_index.ids([m["s"] for m in marks])
+        mark, index, funding = _floats(marks, "p"), _floats(marks, "i"), _floats(marks, "r")
+        with self._lock:
+            self._ensure(ids)
+            self._columns["markPrice"][ids] = mark
+            self._columns["indexPrice"][ids] = index
+            self._columns["fundingRate"][ids] = funding
+            self.updated_at = time.time()
+
+    # REST 补缺：/premiumIndex 的标记价格、指数价格和资金费率。只补列，不刷新 updated_at，
+    # 行情表是否过期仍由最新价格的推送决定
+    def apply_premium(self, premium_data):
+        ids = symbol_index.ids([item["symbol"] for item in premium_data])
+        mark, index = _floats(premium_data, "markPrice"), _floats(premium_data, "indexPrice")
+        funding = _floats(premium_data, "lastFundingRate")
+        with self._lock:
+            self._ensure(ids)
+            self._columns["markPrice"][ids] = mark
+            self._columns["indexPrice"][ids] = index
+            self._columns["fundingRate"][ids] = funding
+
+    # REST 补缺：用 fetch_all_data 的结果覆盖
+    def seed(self, frame):
+        frame = as_frame(frame, MARKET_COLUMNS)
+        ids = frame.ids
+        funding = frame.get("fundingRate")
+        known = ~np.isnan(funding)
+        with self._lock:
+            self._ensure(ids)
+            for f in ("price", "change", "volume"):
+                self._columns[f][ids] = frame.get(f)
+            self._columns["fundingRate"][ids[known]] = funding[known]
+            self.updated_at = time.time()
+
+    def discard(self, symbols):
+        ids = symbol_index.ids(symbols)
+        with self._lock:
+            ids = ids[ids < len(self._present)]
+            self._present[ids] = False
+            for f in FIELDS:
+                self._columns[f][ids] = np.nan
+
+    def is_fresh(self, max_age=STALE_SECONDS):
+        return bool(self._present.any()) and time.time() - self.updated_at <= max_age
+
+    def frame(self, quote="USDT"):
+        """
+        返回与 fetch_all_data 相同结构的列式快照
+        """
+        with self._lock:
+            ids = np.flatnonzero(self._present & ~np.isnan(self._columns["price"]))
+            columns = {f: self._columns[f][ids] for f in MARKET_COLUMNS}
+        frame = Frame(ids, columns)
+        quoted = np.array([s.endswith(quote) for s in frame.symbols], dtype=bool)
+        return frame if quoted.all() else frame.take(quoted)
+
+    def rows(self, quote="USDT"):
+        return self.frame(quote)
+
+    def align(self, ids, field):
+        """
+        按 ids 的顺序取一列，行情表里没有的币种为 NaN
+        """
+        with self._lock:
+            column = self._columns[field]
+            inside = ids < len(column)
+            values = np.full(len(ids), np.nan)
+            values[inside] = column[ids[inside]]
+        return values
+
+    def _mapping(self, field):
+        with self._lock:
+            ids = np.flatnonzero(self._present & ~np.isnan(self._columns[field]))
+            values = self._columns[field][ids].tolist()
+        return dict(zip(symbol_index.names(ids), values))
+
+    def funding_rates(self):
+        return self._mapping("fundingRate")
+
+    def mark_prices(self):
+        return self._mapping("markPrice")
+
+    def volumes(self):
+        return self._mapping("volume")
+
+
+# ✅ 默认传输层：websockets 连接，yield 一个可异步迭代的文本消息流
+@asynccontextmanager
+async def websockets_transport(url):
+    import websockets
+    async with websockets.connect(url, ping_interval=20, max_size=2 ** 23) as ws:
+        yield ws
+
+
+# ✅ 行情订阅服务：断线自动重连，每次（重）连接后用 REST 补一次缺口
+class MarketStream:
+    def __init__(self, state, url=STREAM_URL, transport=websockets_transport, gap_fill=None):
+        """
+        transport: 接收 url、返回异步上下文管理器的可调用对象，
+                   上下文产出可 `async for` 的原始文本消息，测试时可替换为本地假服务端
+        gap_fill:  同步函数，返回 fetch_all_data 结构的行情快照
+        """
+        self.state = state
+        self.url = url
+        self.transport = transport
+        self.gap_fill = gap_fill
+        self.messages = 0
+        self.reconnects = 0
+        self._stopping = False
+
+    def handle_message(self, raw):
+        msg = json.loads(raw)
+        stream = msg.get("stream", "")
+        data = msg.get("data", [])
+        if stream.startswith("!ticker@arr"):
+            self.state.apply_tickers(data)
+        elif stream.startswith("!markPrice@arr"):
+            self.state.apply_mark_prices(data)
+        self.messages += 1
+
+    async def _gap_fill(self):
+        if self.gap_fill is None:
+            return
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(None, self.gap_fill)
+            self.state.seed(rows)
+        except Exception as e:
+            print("❌ 行情 REST 补缺失败:", e)
+
+    async def run(self):
+        if not self.url:
+            print("⚠️ 未配置 BINANCE_WS_URL，行情 WebSocket 不启动，只用 REST")
+            return
+        attempt = 0
+        while not self._stopping:
+            try:
+                async with self.transport(self.url) as messages:
+                    print("✅ 行情 WebSocket 已连接")
+                    attempt = 0
+                    await self._gap_fill()
+                    async for raw in messages:
+                        self.handle_message(raw)
+                        if self._stopping:
+                            break
+            except Exception as e:
+                print("❌ 行情 WebSocket 断开:", e)
+            if self._stopping:
+                break
+            self.reconnects += 1
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, min(2 ** attempt, 30)))
+
+    def stop(self):
+        self._stopping = True
+
+
+market_state = MarketState()
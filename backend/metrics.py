@@ -0,0 +1,268 @@
+# metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认耗时分桶（秒）：覆盖单个 REST 请求到整轮持仓量抓取
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ✅ 极简指标实现：按标签值元组存储，写入只加一把锁，渲染为 Prometheus 文本格式
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        """
+        callback: 抓取 /metrics 时调用，返回数值（无标签）或 {标签值元组: 数值}
+        """
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = self.header()
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                value = None
+            items = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+# ✅ 各模块共用的指标
+binance_request_seconds = registry.histogram(
+    "binance_request_seconds", "Binance REST 单次 HTTP 往返耗时", ("endpoint",))
+binance_responses_total = registry.counter(
+    "binance_responses_total", "Binance REST 响应次数", ("endpoint", "status"))
+binance_retries_total = registry.counter(
+    "binance_retries_total", "Binance REST 重试次数", ("endpoint", "reason"))
+open_interest_failures_total = registry.counter(
+    "open_interest_fetch_failures_total", "单个币种持仓量获取失败次数", ("symbol",))
+db_query_seconds = registry.histogram(
+    "db_query_seconds", "数据库语句耗时", ("statement", "table"))
+write_flush_seconds = registry.histogram(
+    "write_flush_seconds", "异步落库单次批量写入耗时", ("target",))
+write_rows_total = registry.counter(
+    "write_rows_total", "异步落库行数", ("target", "outcome"))
+stage_seconds = registry.histogram(
+    "stage_seconds", "定时任务各阶段耗时", ("job", "stage"))
+job_lag_seconds = registry.histogram(
+    "scheduler_job_lag_seconds", "定时任务实际开始时间相对计划时间的延迟", ("job",))
+job_duration_seconds = registry.histogram(
+    "scheduler_job_duration_seconds", "定时任务执行耗时", ("job",))
+job_runs_total = registry.counter(
+    "scheduler_job_runs_total", "定时任务执行结果", ("job", "outcome"))
+job_failures_total = registry.counter(
+    "job_failures_total", "定时任务内部捕获的失败次数", ("job",))
+
+
+def stage(job, name):
+    return stage_seconds.time(job=job, stage=name)
+
+
+# ✅ 数据库语句耗时：挂在引擎的游标事件上，按语句类型和表名聚合
+def _statement_labels(statement):
+    words = statement.split()
+    if not words:
+        return "", ""
+    verb = words[0].upper()
+    upper = [w.upper() for w in words[:40]]
+    table = ""
+    for marker in ("FROM", "INTO", "UPDATE"):
+        if marker in upper:
+            i = upper.index(marker) + 1
+            if i < len(words):
+                table = words[i].strip('"(').split("(")[0]
+                break
+    return verb, table
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if not starts:
+            return
+        verb, table = _statement_labels(statement)
+        db_query_seconds.observe(time.perf_counter() - starts.pop(), statement=verb, table=table)
+
+
+# ✅ 定时任务：提交延迟（相对计划时间）、执行耗时、错过 / 超过并发上限的次数
+def instrument_scheduler(scheduler):
+    from apscheduler.events import (
+        EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR,
+        EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES,
+    )
+    started = {}
+
+    def listener(event):
+        now = time.time()
+        if event.code == EVENT_JOB_SUBMITTED:
+            started[event.job_id] = now
+            for run_time in event.scheduled_run_times:
+                job_lag_seconds.observe(max(now - run_time.timestamp(), 0.0), job=event.job_id)
+        elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+            start = started.pop(event.job_id, None)
+            if start is not None:
+                job_duration_seconds.observe(now - start, job=event.job_id)
+            outcome = "error" if event.code == EVENT_JOB_ERROR else "success"
+            job_runs_total.inc(job=event.job_id, outcome=outcome)
+        elif event.code == EVENT_JOB_MISSED:
+            job_runs_total.inc(job=event.job_id, outcome="missed")
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            job_runs_total.inc(job=event.job_id, outcome="skipped")
+
+    scheduler.add_listener(
+        listener,
+        EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+    )
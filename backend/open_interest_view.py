@@ -0,0 +1,104 @@
+# open_interest_view.py
+
+import datetime
+import threading
+import numpy as np
+from sqlalchemy import func
+from db import session_scope, OpenInterest, get_previous_oi_batch
+from binance_api import open_interest_frame
+from frames import Frame, as_frame
+from market_stream import market_state
+from scheduling import OI_FULL_SECONDS
+
+
+# 持仓量快照的列（与 get_open_interest_data 输出一致）
+OI_COLUMNS = (
+    "fundingRate", "openInterest",
+    "openInterestChange.5m", "openInterestChange.15m", "openInterestChange.1h",
+)
+
+
+def _display(frame):
+    """
+    接口里缺失的资金费率显示为 0
+    """
+    return frame.with_columns({"fundingRate": np.nan_to_num(frame.get("fundingRate"))})
+
+
+# ✅ 最新持仓量视图：每轮抓取后整体替换为新的列式快照，接口直接读取，不再触发抓取。
+#    frame 保留缺失资金费率的 NaN，供跨交易所聚合和共享快照发布使用（follower 据此跳过缺失值）；
+#    rows() / snapshot() 是接口用的副本，缺失费率显示为 0，每次更新时算一次
+class OpenInterestView:
+    def __init__(self):
+        self._frame = Frame.empty()
+        self._display = self._frame
+        self._lock = threading.Lock()
+        self.updated_at = None
+        self.version = 0
+
+    def update(self, result, updated_at=None):
+        frame = as_frame(result, OI_COLUMNS)
+        display = _display(frame)
+        with self._lock:
+            self._frame = frame
+            self._display = display
+            self.updated_at = updated_at
+            self.version += 1
+
+    def merge(self, result, updated_at=None):
+        """
+        亚分钟节拍只抓取部分币种：只替换这些币种的行
+        """
+        frame = as_frame(result, OI_COLUMNS)
+        with self._lock:
+            self._frame = self._frame.merge(frame)
+            self._display = _display(self._frame)
+            self.updated_at = updated_at
+            self.version += 1
+
+    def discard(self, symbols):
+        with self._lock:
+            self._frame = self._frame.drop(symbols)
+            self._display = self._display.drop(symbols)
+            self.version += 1
+
+    @property
+    def frame(self):
+        return self._frame
+
+    def snapshot(self):
+        """
+        返回 (版本号, 接口用的 Frame)，两者在同一把锁内读取
+        """
+        with self._lock:
+            return self.version, self._display
+
+    def rows(self):
+        return self._display
+
+    def __len__(self):
+        return len(self._frame)
+
+    # ✅ 启动时用数据库里最近一轮的持仓量和历史回看填充，重启后接口不会是空的
+    def hydrate(self):
+        try:
+            with session_scope() as session:
+                latest_ts = session.query(func.max(OpenInterest.timestamp)).scalar()
+                if latest_ts is None:
+                    return
+                # 最新时间戳可能只是亚分钟节拍抓取的少数币种，取最近一个完整周期内每个币种的最后一条
+                since = latest_ts - datetime.timedelta(seconds=OI_FULL_SECONDS * 1.5)
+                latest = {}
+                for symbol, value in session.query(OpenInterest.symbol, OpenInterest.open_interest).filter(
+                    OpenInterest.timestamp >= since
+                ).order_by(OpenInterest.timestamp.asc()):
+                    latest[symbol] = value
+            previous = get_previous_oi_batch(list(latest), [5, 15, 60], now=latest_ts)
+            result = open_interest_frame(latest, previous, market_state.funding_rates())
+            self.update(result, latest_ts)
+            print(f"✅ 持仓量视图已回填 {len(result)} 个币种")
+        except Exception as e:
+            print("❌ 持仓量视图回填失败:", e)
+
+
+open_interest_view = OpenInterestView()
@@ -0,0 +1,238 @@
+# price_buffer.py
+
+import datetime
+import math
+import os
+import threading
+import numpy as np
+from db import session_scope, Price
+from scheduling import PRICE_SAMPLE_SECONDS
+from frames import Frame
+
+# 涨跌幅接口用到的回看周期（分钟）
+LOOKBACK_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "20m": 20, "40m": 40, "1h": 60}
+
+# 每个币种保留的采样点数：1 分钟一条，约 2 小时，足够覆盖 1h 回看
+DEFAULT_CAPACITY = 128
+# 亚分钟采样只保留最近几分钟（覆盖 1m / 2m / 5m 回看），更早的周期用分钟粒度，内存占用不随采样频率线性增长
+FINE_MINUTES = float(os.environ.get("PRICE_FINE_MINUTES", 6))
+FINE_CAPACITY = math.ceil(FINE_MINUTES * 60 / PRICE_SAMPLE_SECONDS) + 2
+
+
+# ✅ 单个币种的定长环形缓冲区，按时间戳升序保存 (timestamp, price)
+class SymbolRing:
+    __slots__ = ("capacity", "times", "prices", "start", "size")
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = [None] * capacity
+        self.prices = [0.0] * capacity
+        self.start = 0
+        self.size = 0
+
+    def _index(self, i):
+        return (self.start + i) % self.capacity
+
+    def append(self, ts, price):
+        if self.size:
+            last = self._index(self.size - 1)
+            if ts < self.times[last]:
+                # 乱序数据（例如回填）直接忽略，保证缓冲区始终有序
+                return
+            if ts == self.times[last]:
+                self.prices[last] = price
+                return
+        if self.size < self.capacity:
+            pos = self._index(self.size)
+            self.size += 1
+        else:
+            pos = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.times[pos] = ts
+        self.prices[pos] = price
+
+    def latest(self):
+        if not self.size:
+            return None, None
+        pos = self._index(self.size - 1)
+        return self.times[pos], self.prices[pos]
+
+    def price_at(self, target):
+        """
+        二分查找 target 时刻（含）之前最近的一条价格，没有则返回 None
+        """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._index(mid)] <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        return self.prices[self._index(lo - 1)]
+
+
+# ✅ 两级缓冲：fine 保存每个采样点，coarse 每分钟只保存第一条；回看目标落在 fine 覆盖范围内时用 fine
+class SymbolHistory:
+    __slots__ = ("fine", "coarse")
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, fine_capacity=FINE_CAPACITY):
+        self.fine = SymbolRing(fine_capacity)
+        self.coarse = SymbolRing(capacity)
+
+    def append(self, ts, price):
+        self.fine.append(ts, price)
+        last, _ = self.coarse.latest()
+        if last is None or ts.replace(second=0, microsecond=0) > last.replace(second=0, microsecond=0):
+            self.coarse.append(ts, price)
+
+    def latest(self):
+        return self.fine.latest()
+
+    def price_at(self, target):
+        if self.fine.size and self.fine.times[self.fine.start] <= target:
+            return self.fine.price_at(target)
+        return self.coarse.price_at(target)
+
+
+# ✅ 进程内共享的多币种价格缓冲区
+class PriceBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY, fine_capacity=FINE_CAPACITY):
+        self.capacity = capacity
+        self.fine_capacity = fine_capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+        # 每次写入自增，供响应缓存判断数据是否变化
+        self.version = 0
+        # 默认周期涨跌幅的 (版本号, Frame)，同一版本只计算一次
+        self._latest = None
+
+    def append(self, symbol, ts, price):
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None:
+                ring = self._rings[symbol] = SymbolHistory(self.capacity, self.fine_capacity)
+            ring.append(ts, price)
+            self.version += 1
+
+    def extend(self, rows):
+        """
+        rows: [{"symbol", "timestamp", "price"}]，timestamp 为 datetime（UTC）
+        """
+        with self._lock:
+            for row in rows:
+                ring = self._rings.get(row["symbol"])
+                if ring is None:
+                    ring = self._rings[row["symbol"]] = SymbolHistory(self.capacity, self.fine_capacity)
+                ring.append(row["timestamp"], row["price"])
+            self.version += 1
+
+    def extend_frame(self, frame, ts):
+        """
+        把列式快照的 price 列按同一个时间戳写入，不需要先拼成行字典
+        """
+        with self._lock:
+            for symbol, price in zip(frame.symbols, frame.get("price").tolist()):
+                ring = self._rings.get(symbol)
+                if ring is None:
+                    ring = self._rings[symbol] = SymbolHistory(self.capacity, self.fine_capacity)
+                ring.append(ts, price)
+            self.version += 1
+
+    def discard(self, symbols):
+        with self._lock:
+            for symbol in symbols:
+                self._rings.pop(symbol, None)
+            self.version += 1
+
+    def symbols(self):
+        with self._lock:
+            return list(self._rings)
+
+    def __len__(self):
+        return len(self._rings)
+
+    def lookback(self, symbol, horizons=LOOKBACK_MINUTES, now=None):
+        """
+        返回 (当前价格, {周期: 该周期前的价格})，周期前没有数据时值为 None
+        """
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None:
+                return None, {}
+            _, current = ring.latest()
+            return current, {
+                label: ring.price_at(now - datetime.timedelta(minutes=minutes))
+                for label, minutes in horizons.items()
+            }
+
+    def snapshot(self, horizons=LOOKBACK_MINUTES, now=None):
+        """
+        一次性取出所有币种的当前价格和各周期历史价格
+        """
+        with self._lock:
+            return self._snapshot(horizons, now)
+
+    def _snapshot(self, horizons, now):
+        # 调用方持有 self._lock
+        now = now or datetime.datetime.utcnow()
+        targets = {label: now - datetime.timedelta(minutes=m) for label, m in horizons.items()}
+        result = []
+        for symbol, ring in self._rings.items():
+            _, current = ring.latest()
+            if current is None:
+                continue
+            result.append((symbol, current, {
+                label: ring.price_at(target) for label, target in targets.items()
+            }))
+        return result
+
+    def changes(self, horizons=LOOKBACK_MINUTES, now=None):
+        """
+        snapshot 的列式版本：price 列为当前价格，change.<周期> 列为涨跌幅（%），没有历史价格时为 NaN
+        """
+        return self._changes_frame(self.snapshot(horizons, now), horizons)
+
+    def latest_changes(self):
+        """
+        默认周期的 changes，返回 (版本号, Frame)：版本号和数据在同一把锁内读取，同一版本只计算一次
+        """
+        with self._lock:
+            version, latest = self.version, self._latest
+            if latest is not None and latest[0] == version:
+                return latest
+            snapshot = self._snapshot(LOOKBACK_MINUTES, None)
+        latest = self._latest = (version, self._changes_frame(snapshot, LOOKBACK_MINUTES))
+        return latest
+
+    @staticmethod
+    def _changes_frame(snapshot, horizons):
+        current = np.array([price for _, price, _ in snapshot], dtype=float)
+        columns = {"price": current}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for label in horizons:
+                old = np.array([history[label] for _, _, history in snapshot], dtype=float)
+                columns[f"change.{label}"] = np.where(old != 0, (current - old) / old * 100, np.nan)
+        return Frame.from_symbols([symbol for symbol, _, _ in snapshot], columns)
+
+    # ✅ 启动时从 price 表回填最近的历史，保证重启后回看结果依然正确
+    def hydrate(self, minutes=None):
+        minutes = minutes or max(LOOKBACK_MINUTES.values()) + 5
+        since = datetime.datetime.utcnow() - datetime.timedelta(minutes=minutes)
+        try:
+            with session_scope() as session:
+                rows = (
+                    session.query(Price.symbol, Price.timestamp, Price.price)
+                    .filter(Price.timestamp >= since)
+                    .order_by(Price.timestamp.asc())
+                    .all()
+                )
+                self.extend({"symbol": s, "timestamp": ts, "price": p} for s, ts, p in rows)
+            print(f"✅ 价格缓冲区已回填 {len(rows)} 条记录，共 {len(self)} 个币种")
+        except Exception as e:
+            print("❌ 价格缓冲区回填失败:", e)
+
+
+price_buffer = PriceBuffer()
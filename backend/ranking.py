@@ -0,0 +1,139 @@
+# ranking.py
+
+import os
+import threading
+import numpy as np
+from frames import as_frame
+
+# 每个接口允许排序的字段（嵌套字段用 . 连接），只对这些字段建索引
+VIEWS = {
+    "data": ("price", "change", "volume", "fundingRate", "ema25"),
+    "price_change": ("price", "change.1m", "change.2m", "change.5m", "change.20m", "change.40m", "change.1h"),
+    "open_interest": (
+        "openInterest", "fundingRate", "openInterestChange.5m", "openInterestChange.15m", "openInterestChange.1h",
+    ),
+}
+MAX_LIMIT = int(os.environ.get("RANKING_MAX_LIMIT", 1000))
+QUERY_PARAMS = ("sort", "order", "limit", "offset", "symbol", "symbols", "min_volume")
+
+
+# ✅ 一个快照版本对应的排序索引：直接在列式快照的列上排序，每个字段的排列在第一次被查询时
+#    用 numpy 排好并缓存，之后的 top-K 查询只是切片，过滤条件用向量化掩码
+class RankedIndex:
+    def __init__(self, rows, keys, volumes=None):
+        self.frame = as_frame(rows, tuple(keys) + ("volume",))
+        self.keys = keys
+        self.symbols = np.array(self.frame.symbols, dtype=str)
+        self._upper = np.char.upper(self.symbols)
+        self.volumes = self.frame.get("volume")
+        if volumes and np.isnan(self.volumes).any():
+            fallback = np.array([volumes.get(s, np.nan) for s in self.frame.symbols], dtype=float)
+            self.volumes = np.where(np.isnan(self.volumes), fallback, self.volumes)
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def order(self, key, descending=True):
+        order = self._orders.get((key, descending))
+        if order is None:
+            with self._lock:
+                order = self._orders.get((key, descending))
+                if order is None:
+                    values = self.frame.get(key)
+                    # 缺失值无论升降序都排在最后
+                    if descending:
+                        order = np.argsort(-np.where(np.isnan(values), -np.inf, values), kind="stable")
+                    else:
+                        order = np.argsort(np.where(np.isnan(values), np.inf, values), kind="stable")
+                    self._orders[(key, descending)] = order
+        return order
+
+    def query(self, sort=None, order="desc", limit=None, offset=0, symbol=None, symbols=None, min_volume=None):
+        """
+        返回 (过滤后的总数, 当前页的行)
+        """
+        idx = self.order(sort, order == "desc") if sort else np.arange(len(self.frame))
+        mask = None
+        if symbol:
+            mask = np.char.find(self._upper, symbol.upper()) >= 0
+        if symbols:
+            selected = np.isin(self.symbols, symbols)
+            mask = selected if mask is None else mask & selected
+        if min_volume is not None:
+            # 成交额未知（NaN）的币种不满足条件
+            enough = self.volumes >= min_volume
+            mask = enough if mask is None else mask & enough
+        if mask is not None:
+            idx = idx[mask[idx]]
+        page = idx[offset:offset + limit] if limit else idx[offset:]
+        rows = self.frame.rows()
+        return len(idx), [rows[i] for i in page]
+
+
+# ✅ 每个接口只保留最新版本的索引；版本变化（快照刷新）后第一次查询时重建
+class Rankings:
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version, rows, volumes=None):
+        """
+        rows / volumes 为无参函数，只在需要重建时调用
+        """
+        entry = self._indexes.get(name)
+        if entry is not None and version is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._indexes.get(name)
+            if entry is not None and version is not None and entry[0] == version:
+                return entry[1]
+            index = RankedIndex(rows(), VIEWS[name], volumes() if volumes else None)
+            self._indexes[name] = (version, index)
+            return index
+
+
+rankings = Rankings()
+
+
+def parse_query(name, args):
+    """
+    args 为请求的查询参数（Flask / Starlette 均可）；没有任何排序 / 过滤参数时返回 None，
+    接口保持原来的完整响应。参数不合法时抛出 ValueError
+    """
+    if not any(args.get(p) not in (None, "") for p in QUERY_PARAMS):
+        return None
+    query = {"sort": args.get("sort") or None, "order": (args.get("order") or "desc").lower()}
+    if query["sort"] is not None and query["sort"] not in VIEWS[name]:
+        raise ValueError(f"不支持的排序字段: {query['sort']}，可选: {', '.join(VIEWS[name])}")
+    if query["order"] not in ("asc", "desc"):
+        raise ValueError("order 只能是 asc 或 desc")
+    try:
+        query["limit"] = min(int(args.get("limit") or MAX_LIMIT), MAX_LIMIT)
+        query["offset"] = max(int(args.get("offset") or 0), 0)
+        query["min_volume"] = float(args["min_volume"]) if args.get("min_volume") else None
+    except ValueError:
+        raise ValueError("limit / offset / min_volume 必须是数字")
+    if query["limit"] <= 0:
+        raise ValueError("limit 必须大于 0")
+    query["symbol"] = args.get("symbol") or None
+    query["symbols"] = [s.strip().upper() for s in args["symbols"].split(",") if s.strip()] if args.get("symbols") else None
+    return query
+
+
+def cache_key(name, query):
+    """
+    同一组参数共享一份已编码响应
+    """
+    parts = [f"{k}={','.join(v) if isinstance(v, list) else v}" for k, v in sorted(query.items()) if v is not None]
+    return f"{name}?{'&'.join(parts)}"
+
+
+def ranked_payload(index, query):
+    total, rows = index.query(**query)
+    return {
+        "data": rows,
+        "total": total,
+        "offset": query["offset"],
+        "limit": query["limit"],
+        "sort": query["sort"],
+        "order": query["order"],
+    }
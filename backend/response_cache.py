@@ -0,0 +1,162 @@
+# response_cache.py
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from flask import Response, request
+from werkzeug.http import parse_accept_header, parse_etags
+from frames import Frame
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于这个字节数的响应不压缩
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+# 带查询参数的接口每组参数各占一条缓存，超过上限时淘汰最早写入的
+MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", 256))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(obj):
+    # 列式快照按接口结构输出行列表（每个快照只生成一次）
+    if isinstance(obj, Frame):
+        return obj.rows()
+    return str(obj)
+
+
+def dumps(data):
+    """
+    统一的 JSON 编码：优先 orjson，返回 UTF-8 字节
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=_default)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+# ✅ 一个数据版本对应的一份已编码响应：JSON 只序列化一次，压缩结果按编码方式各缓存一份
+class CachedResponse:
+    def __init__(self, body):
+        self.body = body
+        # 内容哈希作为 ETag：数据重算但内容没变时，客户端依然能拿到 304
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        if encoding is None or len(self.body) < COMPRESS_MIN_BYTES:
+            return None
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    if encoding == "br":
+                        data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                    else:
+                        data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._encoded[encoding] = data
+        return data
+
+
+def _pick_encoding(accept_encoding):
+    accepted = parse_accept_header(accept_encoding)
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+# ✅ 按接口缓存已编码响应：version 不变时直接返回缓存字节，If-None-Match 命中时返回 304
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}
+        # 每个接口一把构建锁：同一接口同一时间只构建一次，不同接口的构建互不阻塞
+        self._building = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "not_modified": 0}
+
+    def _hit(self, name, version):
+        entry = self._entries.get(name)
+        if version is not None and entry is not None and entry[0] == version:
+            self.stats["hits"] += 1
+            return entry[1]
+        return None
+
+    def get(self, name, version, build):
+        """
+        version 为 None 表示每次都重新构建（仍然享受 ETag / 压缩）。
+        build() 和编码都在全局锁之外执行，全局锁只用来替换缓存条目
+        """
+        cached = self._hit(name, version)
+        if cached is not None:
+            return cached
+        if version is None:
+            return self._store(name, version, CachedResponse(dumps(build())))
+        with self._lock:
+            building = self._building.setdefault(name, threading.Lock())
+        with building:
+            # 等锁期间别的请求可能已经构建好了同一版本
+            cached = self._hit(name, version)
+            if cached is not None:
+                return cached
+            return self._store(name, version, CachedResponse(dumps(build())))
+
+    def _store(self, name, version, cached):
+        with self._lock:
+            self._entries.pop(name, None)
+            self._entries[name] = (version, cached)
+            while len(self._entries) > self.max_entries:
+                evicted = next(iter(self._entries))
+                self._entries.pop(evicted)
+                self._building.pop(evicted, None)
+            self.stats["builds"] += 1
+        return cached
+
+    def negotiate(self, cached, if_none_match, accept_encoding):
+        """
+        与 Web 框架无关：根据请求头返回 (状态码, 响应头, 响应体)
+        """
+        headers = {"ETag": f'W/"{cached.etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if if_none_match and parse_etags(if_none_match).contains_weak(cached.etag):
+            self.stats["not_modified"] += 1
+            return 304, headers, b""
+        encoding = _pick_encoding(accept_encoding)
+        body = cached.encoded(encoding)
+        if body is None:
+            body = cached.body
+        else:
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = "application/json"
+        return 200, headers, body
+
+    def respond(self, name, version, build):
+        """
+        Flask 视图使用
+        """
+        cached = self.get(name, version, build)
+        status, headers, body = self.negotiate(
+            cached, request.headers.get("If-None-Match"), request.headers.get("Accept-Encoding")
+        )
+        return Response(body, status=status, headers=headers)
+
+    def clear(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+response_cache = ResponseCache()
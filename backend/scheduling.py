@@ -0,0 +1,187 @@
+# scheduling.py
+
+import datetime
+import math
+import os
+import threading
+import time
+from apscheduler.triggers.base import BaseTrigger
+from metrics import registry
+
+# 价格采样间隔（秒）：只从行情表采样进内存缓冲区，支持 1–5 秒
+PRICE_SAMPLE_SECONDS = float(os.environ.get("PRICE_SAMPLE_SECONDS", 5))
+# 价格 / EMA 落库和告警计算的间隔（秒），数据库里的采样点保持整分钟对齐
+PRICE_PERSIST_SECONDS = float(os.environ.get("PRICE_PERSIST_SECONDS", 60))
+# 持仓量调度的基本节拍（秒）：整分钟抓全部币种，其余节拍只抓波动大的币种
+OI_TICK_SECONDS = float(os.environ.get("OI_TICK_SECONDS", 15))
+OI_FULL_SECONDS = float(os.environ.get("OI_FULL_SECONDS", 60))
+
+job_overruns_total = registry.counter(
+    "scheduler_job_overruns_total", "定时任务执行耗时超过调度间隔的次数", ("job",))
+
+
+def tick_time(seconds, now=None):
+    """
+    当前时刻所在的对齐节拍（naive UTC）；任务在节拍边界触发，用它作为采样时间戳，
+    写入的数据点间隔严格一致，不随执行耗时漂移
+    """
+    now = time.time() if now is None else now
+    return datetime.datetime.utcfromtimestamp(math.floor(now / seconds) * seconds)
+
+
+def epoch(tick):
+    """
+    tick_time 的逆运算：naive UTC -> epoch 秒
+    """
+    return tick.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+# ✅ 对齐触发器：只在 epoch 起算的 seconds 整数倍（+ offset）时刻触发，
+#    下一次触发时间由边界计算而不是“上次触发 + 间隔”，长时间运行也不会漂移
+class AlignedTrigger(BaseTrigger):
+    def __init__(self, seconds, offset=0.0):
+        if seconds <= 0:
+            raise ValueError("seconds 必须大于 0")
+        self.seconds = float(seconds)
+        self.offset = float(offset)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        if previous_fire_time is None:
+            # 首次：不早于 now 的第一个边界
+            n = math.ceil((now.timestamp() - self.offset) / self.seconds)
+        else:
+            n = math.floor((previous_fire_time.timestamp() - self.offset) / self.seconds) + 1
+        return datetime.datetime.fromtimestamp(n * self.seconds + self.offset, tz=now.tzinfo)
+
+    def __str__(self):
+        return f"aligned[{self.seconds:g}s]"
+
+    def __repr__(self):
+        return f"<AlignedTrigger (seconds={self.seconds:g}, offset={self.offset:g})>"
+
+
+# ✅ 每个任务的调度统计：执行次数、超时（耗时 > 间隔）、因上一轮未结束被跳过、错过触发时间
+class ScheduleStats:
+    def __init__(self):
+        self._jobs = {}
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _job(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._jobs[job_id] = {
+                "interval": None, "runs": 0, "errors": 0, "overruns": 0, "skipped": 0, "missed": 0,
+                "last_lag": None, "last_duration": None, "max_duration": 0.0,
+            }
+        return job
+
+    def attach(self, scheduler):
+        from apscheduler.events import (
+            EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR,
+            EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES,
+        )
+
+        def interval(job_id):
+            job = scheduler.get_job(job_id)
+            return getattr(job.trigger, "seconds", None) if job else None
+
+        def listener(event):
+            now = time.time()
+            with self._lock:
+                stats = self._job(event.job_id)
+                if event.code == EVENT_JOB_SUBMITTED:
+                    self._started[event.job_id] = now
+                    stats["last_lag"] = max(now - event.scheduled_run_times[-1].timestamp(), 0.0)
+                elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+                    stats["runs"] += 1
+                    stats["errors"] += event.code == EVENT_JOB_ERROR
+                    start = self._started.pop(event.job_id, None)
+                    if start is None:
+                        return
+                    duration = now - start
+                    stats["last_duration"] = duration
+                    stats["max_duration"] = max(stats["max_duration"], duration)
+                    stats["interval"] = interval(event.job_id)
+                    if stats["interval"] and duration > stats["interval"]:
+                        stats["overruns"] += 1
+                        job_overruns_total.inc(job=event.job_id)
+                elif event.code == EVENT_JOB_MAX_INSTANCES:
+                    stats["skipped"] += 1
+                elif event.code == EVENT_JOB_MISSED:
+                    stats["missed"] += 1
+
+        scheduler.add_listener(
+            listener,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+        )
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {job_id: dict(stats) for job_id, stats in self._jobs.items()}
+
+
+schedule_stats = ScheduleStats()
+
+
+# ✅ 自适应抓取计划：每个币种按波动大小决定自己的抓取间隔（OI_TICK_SECONDS ~ OI_FULL_SECONDS），
+#    整分钟节拍抓全部币种；其余节拍只抓到期的高波动币种，数量受本分钟剩余权重约束
+class AdaptivePlanner:
+    def __init__(self, tick=OI_TICK_SECONDS, full=OI_FULL_SECONDS,
+                 hot_change=float(os.environ.get("OI_HOT_CHANGE", 1.0)),
+                 max_hot=int(os.environ.get("OI_HOT_MAX", 100)),
+                 reserve=int(os.environ.get("OI_BUDGET_RESERVE", 200))):
+        """
+        hot_change: 波动分数（5 分钟价格 + 持仓量变化的绝对百分比）达到该值时间隔减半，越大越短
+        reserve:    每分钟给其他请求（REST 补缺、合约列表等）预留的权重
+        """
+        self.tick = tick
+        self.full = full
+        self.hot_change = hot_change
+        self.max_hot = max_hot
+        self.reserve = reserve
+        self._last = {}
+        self._last_full = None
+        self.stats = {"full": 0, "partial": 0, "idle": 0, "budget_limited": 0}
+
+    def interval(self, score):
+        interval = self.full / (1 + score / self.hot_change) if self.hot_change > 0 else self.full
+        return min(max(interval, self.tick), self.full)
+
+    def is_full(self, tick):
+        ts = epoch(tick)
+        # 整分钟节拍，或者整分钟那次被跳过 / 延迟时补一轮全量
+        return (
+            self._last_full is None
+            or ts % self.full == 0
+            or ts - self._last_full >= self.full
+        )
+
+    def plan(self, scores, remaining_weight, tick):
+        """
+        scores: {symbol: 波动分数}；返回本节拍应抓取的币种，分数高的优先
+        """
+        ts = epoch(tick)
+        ticks_left = max(round((self.full - ts % self.full) / self.tick), 1)
+        budget = min(self.max_hot, max(int((remaining_weight - self.reserve) / ticks_left), 0))
+        due = sorted(
+            ((score, symbol) for symbol, score in scores.items()
+             if ts - self._last.get(symbol, 0.0) >= self.interval(score) - 1e-6),
+            reverse=True,
+        )
+        if len(due) > budget:
+            self.stats["budget_limited"] += 1
+        return [symbol for _, symbol in due[:budget]]
+
+    def mark(self, symbols, tick, full=False):
+        ts = epoch(tick)
+        for symbol in symbols:
+            self._last[symbol] = ts
+        if full:
+            self._last_full = ts
+            self.stats["full"] += 1
+        elif symbols:
+            self.stats["partial"] += 1
+        else:
+            self.stats["idle"] += 1
@@ -0,0 +1,259 @@
+# shared_snapshot.py
+
+import datetime
+import mmap
+import os
+import tempfile
+import time
+import numpy as np
+from frames import Frame, as_frame, symbol_index, to_list
+from cross_venue import FIELDS as VENUE_FIELDS
+from scheduling import epoch
+from exchanges import ADAPTERS
+
+# 同一台机器上所有 worker 共享的快照文件；/dev/shm 存在时放在内存文件系统里
+SHARED_SNAPSHOT_FILE = os.environ.get("SHARED_SNAPSHOT_FILE") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "crypto-monitor-snapshot"
+)
+# 最多容纳的币种数，决定文件大小（每个币种一条定长记录）
+SHARED_SNAPSHOT_CAPACITY = int(os.environ.get("SHARED_SNAPSHOT_CAPACITY", 4096))
+# 超过这个秒数没有发布，读端认为 leader 已不在本机或已停止，回退到数据库同步
+SHARED_SNAPSHOT_STALE_SECONDS = float(os.environ.get("SHARED_SNAPSHOT_STALE_SECONDS", 30))
+
+MAGIC = b"CMSNAP02"
+READ_RETRIES = 100
+
+PRICE_HORIZONS = ("1m", "2m", "5m", "20m", "40m", "1h")
+OI_HORIZONS = ("5m", "15m", "1h")
+# 由 leader 抓取、通过共享快照分发给 follower 的其他交易所（Binance 部分由各进程自己的持仓量视图拼出）
+VENUES = tuple(name for name in ADAPTERS if name != "binance")
+
+# 各部分对应的 (快照列, 记录字段)；记录里的 symbol 行只要对应部分有一个字段不是 NaN 就属于该部分
+PARTS = {
+    "market": [(f, f) for f in ("price", "change", "volume", "fundingRate", "ema_7", "ema_25", "ema_99")],
+    "changes": [("price", "samplePrice")] + [(f"change.{h}", f"change_{h}") for h in PRICE_HORIZONS],
+    "open_interest": [("openInterest", "openInterest"), ("fundingRate", "oiFundingRate")]
+    + [(f"openInterestChange.{h}", f"oi_change_{h}") for h in OI_HORIZONS],
+}
+PARTS.update({venue: [(f, f"{venue}_{f}") for f in VENUE_FIELDS] for venue in VENUES})
+
+# 文件头：魔数 + 序号（seqlock，奇数表示正在写）+ 记录数 + 各部分的更新时间（epoch 秒）
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("seq", "<u8"),
+    ("count", "<u8"),
+    ("published_at", "<f8"),
+] + [(f"{part}_at", "<f8") for part in PARTS])
+# 每个币种一条定长记录，缺失值为 NaN
+RECORD = np.dtype(
+    [("symbol", "S24")]
+    + [(field, "<f8") for fields in PARTS.values() for _, field in fields]
+)
+HEADER_SIZE = 128
+
+
+# ✅ 读端拿到的一份一致快照（本进程内按序号缓存，序号不变时不再拷贝）
+class SharedView:
+    def __init__(self, header, records):
+        self.seq = int(header["seq"])
+        self.published_at = float(header["published_at"])
+        # market_at / changes_at / open_interest_at / {交易所}_at
+        for part in PARTS:
+            setattr(self, f"{part}_at", float(header[f"{part}_at"]))
+        self.records = records
+        self.symbols = [s.decode() for s in records["symbol"]]
+        self._ids = symbol_index.ids(self.symbols)
+        self._frames = {}
+
+    @property
+    def age(self):
+        return time.time() - self.published_at
+
+    def updated_at(self, part):
+        """
+        part 为 PARTS 中的一项，返回 naive UTC 时间
+        """
+        ts = getattr(self, f"{part}_at")
+        return datetime.datetime.utcfromtimestamp(ts) if ts else None
+
+    def frame(self, part):
+        """
+        某一部分的列式快照，结构与发布时传入的一致
+        """
+        frame = self._frames.get(part)
+        if frame is None:
+            fields = PARTS[part]
+            r = self.records
+            keep = np.flatnonzero(np.any([~np.isnan(r[field]) for _, field in fields], axis=0))
+            frame = self._frames[part] = Frame(
+                self._ids[keep],
+                {column: np.ascontiguousarray(r[field][keep]) for column, field in fields},
+                [self.symbols[i] for i in keep.tolist()],
+            )
+            if part == "market":
+                # 兼容前端和告警使用的旧字段
+                frame = self._frames[part] = frame.with_columns({"ema25": frame.get("ema_25")})
+        return frame
+
+    def market_rows(self):
+        """
+        与 append_ema(get_market_data()) 相同的结构
+        """
+        return self.frame("market")
+
+    def price_change_rows(self):
+        """
+        与 build_price_change 相同的结构
+        """
+        return self.frame("changes")
+
+    def open_interest_rows(self):
+        """
+        与 open_interest_view.frame 相同的结构（缺失的资金费率为 NaN）
+        """
+        return self.frame("open_interest")
+
+    def venue_data(self):
+        """
+        其他交易所的数据，结构与 fetch_venues 的结果相同：{交易所: {symbol: {字段: 值}}}，
+        以及各交易所的更新时间；leader 还没有发布过的交易所不出现在结果里
+        """
+        data, updated_at = {}, {}
+        for venue in VENUES:
+            if not getattr(self, f"{venue}_at"):
+                continue
+            frame = self.frame(venue)
+            columns = {f: to_list(frame.get(f)) for f in VENUE_FIELDS}
+            data[venue] = {
+                symbol: {f: values[i] for f, values in columns.items()}
+                for i, symbol in enumerate(frame.symbols)
+            }
+            updated_at[venue] = self.updated_at(venue)
+        return data, updated_at
+
+
+# ✅ 单写多读的共享快照：leader 进程写，同机其他 worker 无锁读取。
+#    写端先把序号加一（变成奇数）、整块拷贝记录、再加一；读端在拷贝前后各读一次序号，
+#    序号为奇数或前后不一致就重试，不需要任何跨进程锁
+class SharedSnapshot:
+    def __init__(self, path=SHARED_SNAPSHOT_FILE, capacity=SHARED_SNAPSHOT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.size = HEADER_SIZE + capacity * RECORD.itemsize
+        self._mm = None
+        self._cached = None
+        self._parts = {}
+        self.stats = {"published": 0, "reads": 0, "copies": 0, "retries": 0, "truncated": 0}
+
+    def _open(self):
+        if self._mm is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size != self.size:
+                    os.ftruncate(fd, self.size)
+                self._mm = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+            self._header = np.ndarray((), dtype=HEADER, buffer=self._mm, offset=0)
+            self._records = np.ndarray((self.capacity,), dtype=RECORD, buffer=self._mm, offset=HEADER_SIZE)
+        return self._mm
+
+    def close(self):
+        if self._mm is not None:
+            self._header = self._records = None
+            self._mm.close()
+            self._mm = None
+
+    # ✅ 写端（只有 leader 调用）：各部分各自保存最近一次的列式快照，每次发布整体重写
+    def publish(self, market_rows=None, price_changes=None, open_interest_rows=None, venues=None):
+        """
+        某一部分为 None 时沿用本进程上一次发布的值；
+        venues 为 {交易所: (fetch_venues 结构的数据, naive UTC 更新时间)}
+        """
+        self._open()
+        now = time.time()
+        for part, frame in (("market", market_rows), ("changes", price_changes), ("open_interest", open_interest_rows)):
+            if frame is not None:
+                self._parts[part] = (as_frame(frame, [column for column, _ in PARTS[part]]), now)
+        for venue, (data, updated_at) in (venues or {}).items():
+            if venue in VENUES:
+                frame = Frame.from_symbols(list(data), {
+                    f: np.array([row.get(f) for row in data.values()], dtype=float) for f in VENUE_FIELDS
+                })
+                self._parts[venue] = (frame, epoch(updated_at) if updated_at else now)
+
+        # 各部分按币种编号取并集，先出现的币种排在前面
+        frames = [(part, self._parts[part][0]) for part in PARTS if part in self._parts]
+        all_ids = np.concatenate([frame.ids for _, frame in frames]) if frames else np.zeros(0, dtype=np.int64)
+        ids, first = np.unique(all_ids, return_index=True)
+        ids = ids[np.argsort(first, kind="stable")]
+        dropped = 0
+        if len(ids) > self.capacity:
+            dropped = int(np.isin(all_ids, ids[self.capacity:]).sum())
+            ids = ids[:self.capacity]
+            self.stats["truncated"] += dropped
+            print(f"⚠️ 共享快照容量不足（{self.capacity}），{dropped} 行未写入")
+
+        count = len(ids)
+        local = np.zeros(count, dtype=RECORD)
+        for name in RECORD.names[1:]:
+            local[name] = np.nan
+        local["symbol"] = np.array(symbol_index.names(ids), dtype="S24")
+        slots = np.full(len(symbol_index), -1, dtype=np.int64)
+        slots[ids] = np.arange(count)
+        for part, frame in frames:
+            slot = slots[frame.ids]
+            written = slot >= 0
+            for column, field in PARTS[part]:
+                local[field][slot[written]] = frame.get(column)[written]
+
+        h = self._header
+        seq = int(h["seq"])
+        if seq & 1:
+            # 上一个写端在写入中途退出，从偶数重新开始
+            seq += 1
+        h["seq"] = seq + 1
+        self._records[:count] = local
+        h["magic"] = MAGIC
+        h["count"] = count
+        h["published_at"] = now
+        for part in PARTS:
+            h[f"{part}_at"] = self._parts.get(part, (None, 0.0))[1]
+        h["seq"] = seq + 2
+        self.stats["published"] += 1
+
+    # ✅ 读端：无锁读取，返回 SharedView；文件未初始化或超过 max_age 秒未发布时返回 None
+    def read(self, max_age=SHARED_SNAPSHOT_STALE_SECONDS):
+        self._open()
+        self.stats["reads"] += 1
+        h = self._header
+        view = None
+        for _ in range(READ_RETRIES):
+            seq = int(h["seq"])
+            if seq & 1:
+                self.stats["retries"] += 1
+                time.sleep(0)
+                continue
+            if self._cached is not None and self._cached.seq == seq:
+                view = self._cached
+                break
+            header = h.copy()
+            count = min(int(header["count"]), self.capacity)
+            records = self._records[:count].copy()
+            if int(h["seq"]) != seq:
+                self.stats["retries"] += 1
+                continue
+            if header["magic"] != MAGIC:
+                return None
+            view = self._cached = SharedView(header, records)
+            self.stats["copies"] += 1
+            break
+        if view is None:
+            # 写端一直在写（或写到一半退出）：沿用上一份一致的快照
+            view = self._cached
+        if view is None or (max_age is not None and view.age > max_age):
+            return None
+        return view
+
+
+shared_snapshot = SharedSnapshot()
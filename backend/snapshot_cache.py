@@ -0,0 +1,75 @@
+# snapshot_cache.py
+
+import itertools
+import os
+import threading
+import time
+
+# 快照有效期（秒），定时任务每分钟刷新一次，请求只在过期时才触发加载
+SNAPSHOT_TTL = float(os.environ.get("SNAPSHOT_TTL", 60))
+
+
+# ✅ 共享快照缓存：TTL 过期才重新加载，并发请求只允许一个线程去加载（single-flight）
+class SnapshotCache:
+    def __init__(self, loader, ttl=SNAPSHOT_TTL, name="snapshot"):
+        self.loader = loader
+        self.ttl = ttl
+        self.name = name
+        # (版本号, 快照) 作为一个元组整体替换，读端一次取出，版本号和数据不会错位；
+        # 版本号每次替换快照自增，供响应缓存判断是否需要重新序列化
+        self._entry = (0, None)
+        self._versions = itertools.count(1)
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._entry[0]
+
+    @property
+    def _value(self):
+        return self._entry[1]
+
+    def _is_fresh(self):
+        return self._value is not None and time.time() - self._loaded_at < self.ttl
+
+    @property
+    def age(self):
+        return time.time() - self._loaded_at if self._value is not None else None
+
+    def set(self, value):
+        self._entry = (next(self._versions), value)
+        self._loaded_at = time.time()
+        return value
+
+    def invalidate(self):
+        """
+        下一次 get() 强制重新加载
+        """
+        self._loaded_at = 0.0
+
+    def refresh(self):
+        """
+        定时任务调用：无条件重新加载
+        """
+        with self._refresh_lock:
+            return self.set(self.loader())
+
+    def get(self):
+        """
+        返回 (版本号, 快照)；过期时先重新加载，返回的版本号就是这份快照的版本号
+        """
+        entry = self._entry
+        if self._is_fresh():
+            return entry
+        with self._refresh_lock:
+            # 等锁期间可能已有其他线程刷新完成
+            if self._is_fresh():
+                return self._entry
+            try:
+                self.set(self.loader())
+            except Exception as e:
+                if self._value is None:
+                    raise
+                print(f"❌ {self.name} 刷新失败，继续使用旧快照:", e)
+            return self._entry
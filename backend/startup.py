@@ -0,0 +1,172 @@
+# startup.py
+# 启动相关的轻量工具：环境变量配置、启动耗时记录、后台预热状态。
+# 只依赖标准库：Web 入口导入时只加载它和 Web 框架，抓取相关的重模块留到预热时再导入。
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _process_started_at():
+    """
+    进程真正的启动时间（Linux 读 /proc），拿不到时退化为本模块的导入时间
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # 第 22 个字段是进程启动时的系统运行时钟（单位 clock tick）；comm 字段可能含空格，从右括号之后开始数
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED_AT = _process_started_at()
+
+
+def _flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes", "on")
+
+
+def load_config(overrides=None):
+    """
+    所有启动配置都来自环境变量，overrides 用于测试 / 基准测试时覆盖
+    """
+    config = {
+        # 0 时只提供接口，不启动抓取和定时任务（基准测试等场景）
+        "START_INGESTION": os.environ.get("START_INGESTION", "1") == "1",
+        # 预热（建表、回填缓存、启动定时任务）在后台线程里执行，端口立即可用；关闭后在 create_app 内同步完成
+        "BACKGROUND_WARMUP": _flag("BACKGROUND_WARMUP", "1"),
+        # 预热期间数据接口返回 503 时建议客户端等待的秒数
+        "WARMUP_RETRY_AFTER": int(os.environ.get("WARMUP_RETRY_AFTER", 2)),
+        "PORT": int(os.environ.get("PORT", 5000)),
+        "DEBUG": _flag("FLASK_DEBUG", "0"),
+    }
+    config.update(overrides or {})
+    return config
+
+
+# ✅ 启动耗时记录：各阶段的耗时 + 关键时间点（相对进程启动），/debug/startup 和预热结束时的日志都读这里
+class StartupProfile:
+    def __init__(self, started_at=PROCESS_STARTED_AT):
+        self.started_at = started_at
+        self.phases = {}
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """
+        只记录第一次：例如第一个 200 响应
+        """
+        with self._lock:
+            if name not in self.marks:
+                self.marks[name] = time.time() - self.started_at
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = time.time() - start
+
+    def report(self):
+        with self._lock:
+            return {
+                "marks": {k: round(v, 4) for k, v in self.marks.items()},
+                "phases": {k: round(v, 4) for k, v in self.phases.items()},
+            }
+
+    def summary(self):
+        report = self.report()
+        marks = ", ".join(f"{k} {v:.2f}s" for k, v in report["marks"].items())
+        phases = ", ".join(f"{k} {v:.2f}s" for k, v in sorted(report["phases"].items(), key=lambda kv: -kv[1]))
+        return f"⏱️ 启动耗时（相对进程启动）: {marks}；各阶段: {phases}"
+
+
+profile = StartupProfile()
+
+
+# ✅ 后台预热：只执行一次；执行期间数据接口返回“预热中”，结束后才开始读取缓存和视图
+class Warmup:
+    def __init__(self):
+        self.state = "pending"
+        self.error = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def _begin(self):
+        with self._lock:
+            if self.state != "pending":
+                return False
+            self.state = "warming"
+            return True
+
+    def _finish(self, error=None):
+        if error is None:
+            self.state = "ready"
+        else:
+            self.error = str(error)
+            self.state = "failed"
+            print("❌ 启动预热失败:", error)
+        profile.mark(f"warmup_{self.state}")
+        self._done.set()
+        print(profile.summary())
+
+    def start(self, target, background=True):
+        """
+        target 为无参函数；重复调用（例如多次 create_app）不会再次执行
+        """
+        if not self._begin():
+            return False
+        if background:
+            threading.Thread(target=self._run, args=(target,), name="warmup", daemon=True).start()
+        else:
+            self._run(target)
+        return True
+
+    def _run(self, target):
+        try:
+            with profile.phase("warmup"):
+                target()
+        except Exception as e:
+            self._finish(e)
+        else:
+            self._finish()
+
+    async def run_async(self, target):
+        """
+        ASGI 模式：target 为协程函数，在服务器的事件循环上执行（由 lifespan 作为后台任务启动）
+        """
+        if not self._begin():
+            return False
+        try:
+            with profile.phase("warmup"):
+                await target()
+        except Exception as e:
+            self._finish(e)
+        else:
+            self._finish()
+        return True
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def payload(self):
+        return {
+            "message": "服务预热中，请稍后重试" if self.state != "failed" else "服务预热失败",
+            "status": self.state,
+            "error": self.error,
+            "uptime": round(time.time() - profile.started_at, 3),
+            "data": [],
+        }
+
+
+warmup = Warmup()
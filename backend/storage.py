@@ -0,0 +1,277 @@
+# storage.py
+
+import datetime
+import os
+import re
+from itertools import groupby
+from sqlalchemy import text, bindparam, func, DateTime
+from db import (
+    engine, session_scope, dialect_insert, create_tables,
+    Price, OpenInterest, PriceData, DerivedMetric, FundingRate, ROLLUPS,
+    RAW_RETENTION_DAYS, FUNDING_RETENTION_DAYS,
+)
+
+# 设为 1 时，init_db 会把 price / open_interest 迁移为按天分区的表（仅 PostgreSQL）
+PARTITION_TABLES = os.environ.get("PARTITION_TABLES", "0") == "1"
+PARTITION_DAYS_AHEAD = 3
+# 首次聚合或长时间停机后，每次最多补聚合的天数，避免单次任务过重
+ROLLUP_MAX_BACKFILL_DAYS = 1
+# 单条 upsert 语句的最大行数（受数据库绑定参数个数限制）
+UPSERT_CHUNK_SIZE = 2000
+
+# 原始表 -> 数值列
+RAW_TABLES = {
+    'price': (Price, 'price'),
+    'open_interest': (OpenInterest, 'open_interest'),
+}
+
+
+def _is_postgres():
+    return engine.dialect.name == "postgresql"
+
+
+def _day(dt):
+    return datetime.datetime(dt.year, dt.month, dt.day)
+
+
+def _bucket(ts, width):
+    return ts.replace(second=0, microsecond=0) - datetime.timedelta(minutes=ts.minute % width)
+
+
+# ✅ PostgreSQL 按天范围分区
+def is_partitioned(table):
+    if not _is_postgres():
+        return False
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"
+        ), {"t": table}).first() is not None
+
+
+def migrate_to_partitioned(table):
+    """
+    一次性迁移：旧表改名为 {table}_legacy，作为 [MINVALUE, 上界) 的分区挂到新的分区父表下。
+    旧表里已经有今天（以及时钟偏差导致的更晚）的数据，上界取明天零点和最新一行的次日零点中较晚的一个，
+    否则 ATTACH 会因为分区约束不成立而失败；之后的按天分区从这个上界开始建
+    """
+    if not _is_postgres() or is_partitioned(table):
+        return False
+    tomorrow = _day(datetime.datetime.utcnow()) + datetime.timedelta(days=1)
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} RENAME TO {table}_legacy'))
+        newest = conn.execute(text(f'SELECT MAX("timestamp") FROM {table}_legacy')).scalar()
+        bound = tomorrow if newest is None else max(tomorrow, _day(newest) + datetime.timedelta(days=1))
+        conn.execute(text(f'ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey'))
+        conn.execute(text(
+            f'CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")'
+        ))
+        conn.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (symbol, "timestamp")'))
+        conn.execute(text(
+            f"ALTER TABLE {table} ATTACH PARTITION {table}_legacy FOR VALUES FROM (MINVALUE) TO ('{bound:%Y-%m-%d}')"
+        ))
+    print(f"✅ {table} 已迁移为按天分区表")
+    return True
+
+
+def _legacy_upper_bound(conn, table):
+    """
+    {table}_legacy 分区的上界（迁移时确定），没有 legacy 分区时返回 None
+    """
+    expr = conn.execute(text(
+        "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_class c WHERE c.relname = :t AND c.relispartition"
+    ), {"t": f"{table}_legacy"}).scalar()
+    match = re.search(r"TO \('([0-9-]{10})", expr or "")
+    return datetime.datetime.strptime(match.group(1), "%Y-%m-%d") if match else None
+
+
+def ensure_partitions(table, days_ahead=PARTITION_DAYS_AHEAD):
+    if not is_partitioned(table):
+        return
+    today = _day(datetime.datetime.utcnow())
+    with engine.begin() as conn:
+        # legacy 分区已经覆盖到上界之前，按天分区从上界开始，避免范围重叠
+        bound = _legacy_upper_bound(conn, table)
+        first = today if bound is None else max(today, bound)
+        for offset in range((today + datetime.timedelta(days=days_ahead) - first).days + 1):
+            start = first + datetime.timedelta(days=offset)
+            end = start + datetime.timedelta(days=1)
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {table}_p{start:%Y%m%d} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            ))
+
+
+def drop_expired_partitions(table, retention_days):
+    cutoff = _day(datetime.datetime.utcnow() - datetime.timedelta(days=retention_days))
+    with engine.begin() as conn:
+        children = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t"
+        ), {"t": table}).scalars().all()
+        dropped = 0
+        for name in children:
+            suffix = name.rsplit("_p", 1)[-1]
+            if not suffix.isdigit() or len(suffix) != 8:
+                continue
+            if datetime.datetime.strptime(suffix, "%Y%m%d") < cutoff:
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped += 1
+    return dropped
+
+
+# ✅ 非分区表（SQLite 或未迁移的 PostgreSQL）：按天分块删除过期数据，避免长事务
+def delete_expired_rows(table, retention_days):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    with engine.connect() as conn:
+        oldest = conn.execute(text(f'SELECT MIN("timestamp") FROM {table}')).scalar()
+    if oldest is None:
+        return 0
+    if isinstance(oldest, str):
+        oldest = datetime.datetime.fromisoformat(oldest)
+    deleted = 0
+    chunk_start = _day(oldest)
+    while chunk_start < cutoff:
+        chunk_end = min(chunk_start + datetime.timedelta(days=1), cutoff)
+        with session_scope() as session:
+            stmt = text(f'DELETE FROM {table} WHERE "timestamp" >= :a AND "timestamp" < :b').bindparams(
+                bindparam("a", type_=DateTime), bindparam("b", type_=DateTime)
+            )
+            deleted += session.execute(stmt, {"a": chunk_start, "b": chunk_end}).rowcount
+        chunk_start = chunk_end
+    return deleted
+
+
+def _apply_retention(table, retention_days):
+    if is_partitioned(table):
+        dropped = drop_expired_partitions(table, retention_days)
+        # 迁移前的 legacy 分区仍需按行清理
+        deleted = delete_expired_rows(f"{table}_legacy", retention_days)
+        return dropped, deleted
+    return 0, delete_expired_rows(table, retention_days)
+
+
+# ✅ 聚合：把原始分钟数据汇总成 OHLC 桶
+def _aggregate(rows, width):
+    """
+    rows: 按 (symbol, timestamp) 排序的 (symbol, timestamp, open, high, low, close, samples)
+    """
+    result = []
+    for (symbol, bucket), group in groupby(rows, key=lambda r: (r[0], _bucket(r[1], width))):
+        group = list(group)
+        result.append({
+            "symbol": symbol,
+            "timestamp": bucket,
+            "open": group[0][2],
+            "high": max(r[3] for r in group),
+            "low": min(r[4] for r in group),
+            "close": group[-1][5],
+            "samples": sum(r[6] for r in group),
+        })
+    return result
+
+
+def _upsert_rollups(model, rows):
+    with session_scope() as session:
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            stmt = dialect_insert(model).values(rows[i:i + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['symbol', 'timestamp'],
+                set_={col: stmt.excluded[col] for col in ("open", "high", "low", "close", "samples")},
+            )
+            session.execute(stmt)
+
+
+def _first_raw(session, raw_model, since):
+    return session.query(func.min(raw_model.timestamp)).filter(raw_model.timestamp >= since).scalar()
+
+
+def _rollup_window(raw_model, model, width, now):
+    """
+    本轮聚合的 [起点, 终点)：起点为已有聚合的最后一个桶（可能还没满，重新聚合），终点为其后下一条原始数据所在的桶
+    再往后 ROLLUP_MAX_BACKFILL_DAYS 天。按原始数据而不是固定时间推进，新部署或原始数据中断超过一天时
+    不会反复扫描同一段空窗口；没有原始数据时返回 None
+    """
+    with session_scope() as session:
+        latest = session.query(model.timestamp).order_by(model.timestamp.desc()).first()
+        floor = _bucket(now - datetime.timedelta(days=RAW_RETENTION_DAYS), width)
+        watermark = floor if latest is None else max(latest[0], floor)
+        first = _first_raw(session, raw_model, watermark)
+        if first is None:
+            return None
+        since = max(watermark, _bucket(first, width))
+        after = _first_raw(session, raw_model, since + datetime.timedelta(minutes=width))
+    start = since if after is None else _bucket(after, width)
+    return since, min(now, start + datetime.timedelta(days=ROLLUP_MAX_BACKFILL_DAYS))
+
+
+def rollup_table(table, now=None):
+    now = now or datetime.datetime.utcnow()
+    raw_model, column = RAW_TABLES[table]
+    (width_5m, model_5m, _), (width_1h, model_1h, _) = ROLLUPS[table]
+
+    window = _rollup_window(raw_model, model_5m, width_5m, now)
+    if window is None:
+        return 0, 0
+    since, until = window
+    value = getattr(raw_model, column)
+    with session_scope() as session:
+        raw = session.query(raw_model.symbol, raw_model.timestamp, value).filter(
+            raw_model.timestamp >= since, raw_model.timestamp < until
+        ).order_by(raw_model.symbol, raw_model.timestamp).all()
+    rows_5m = _aggregate(((s, ts, v, v, v, v, 1) for s, ts, v in raw), width_5m)
+    _upsert_rollups(model_5m, rows_5m)
+
+    # 1h 聚合由 5m 聚合再汇总
+    since_1h = _bucket(since, width_1h)
+    with session_scope() as session:
+        five = session.query(
+            model_5m.symbol, model_5m.timestamp, model_5m.open, model_5m.high,
+            model_5m.low, model_5m.close, model_5m.samples,
+        ).filter(
+            model_5m.timestamp >= since_1h, model_5m.timestamp < until
+        ).order_by(model_5m.symbol, model_5m.timestamp).all()
+    rows_1h = _aggregate(five, width_1h)
+    _upsert_rollups(model_1h, rows_1h)
+    return len(rows_5m), len(rows_1h)
+
+
+# ✅ 定时任务：聚合
+def run_rollups():
+    for table in RAW_TABLES:
+        try:
+            n5, n1h = rollup_table(table)
+            print(f"✅ {table} 聚合完成：5m {n5} 条，1h {n1h} 条")
+        except Exception as e:
+            print(f"❌ {table} 聚合失败:", e)
+
+
+# ✅ 定时任务：分区预建 + 过期数据清理
+def run_retention():
+    for table in RAW_TABLES:
+        try:
+            ensure_partitions(table)
+            dropped, deleted = _apply_retention(table, RAW_RETENTION_DAYS)
+            print(f"✅ {table} 保留策略执行完成：删除分区 {dropped} 个，删除行 {deleted} 条")
+        except Exception as e:
+            print(f"❌ {table} 保留策略执行失败:", e)
+    try:
+        delete_expired_rows(PriceData.__tablename__, RAW_RETENTION_DAYS)
+        delete_expired_rows(DerivedMetric.__tablename__, RAW_RETENTION_DAYS)
+        delete_expired_rows(FundingRate.__tablename__, FUNDING_RETENTION_DAYS)
+        for table, rollups in ROLLUPS.items():
+            for _, model, retention_days in rollups:
+                if retention_days is not None:
+                    delete_expired_rows(model.__tablename__, retention_days)
+    except Exception as e:
+        print("❌ 聚合表保留策略执行失败:", e)
+
+
+# ✅ 建表 + （可选）分区迁移 + 预建分区，由 init_db 调用
+def setup_storage():
+    create_tables()
+    if PARTITION_TABLES:
+        for table in RAW_TABLES:
+            migrate_to_partitioned(table)
+    for table in RAW_TABLES:
+        ensure_partitions(table)
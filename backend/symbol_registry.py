@@ -0,0 +1,188 @@
+# symbol_registry.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+from binance_fetcher import BinanceAPIError
+
+# exchangeInfo 有好几 MB，合约列表变化很慢：默认一小时重新校验一次
+SYMBOL_TTL = float(os.environ.get("SYMBOL_TTL", 3600))
+SYMBOL_CACHE_FILE = os.environ.get(
+    "SYMBOL_CACHE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.json")
+)
+EXCHANGE_INFO_PATH = "/fapi/v1/exchangeInfo"
+EXCHANGE_INFO_WEIGHT = 1
+
+
+def _contract(item):
+    """
+    只保留下游用得到的合约元数据
+    """
+    filters = {f.get("filterType"): f for f in item.get("filters", [])}
+    return {
+        "symbol": item["symbol"],
+        "pair": item.get("pair"),
+        "contractType": item.get("contractType"),
+        "baseAsset": item.get("baseAsset"),
+        "quoteAsset": item.get("quoteAsset"),
+        "status": item.get("status"),
+        "onboardDate": item.get("onboardDate"),
+        "pricePrecision": item.get("pricePrecision"),
+        "quantityPrecision": item.get("quantityPrecision"),
+        "tickSize": filters.get("PRICE_FILTER", {}).get("tickSize"),
+        "stepSize": filters.get("LOT_SIZE", {}).get("stepSize"),
+    }
+
+
+def _active(contract, quote="USDT"):
+    return (
+        contract["contractType"] == "PERPETUAL"
+        and contract["quoteAsset"] == quote
+        and contract["status"] == "TRADING"
+    )
+
+
+# ✅ 合约注册表：本地文件冷启动 + TTL / ETag 重新校验，合约上线 / 下架时通知订阅者
+class SymbolRegistry:
+    def __init__(self, path=SYMBOL_CACHE_FILE, ttl=SYMBOL_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._contracts = {}
+        self._etag = None
+        self._last_modified = None
+        self.checked_at = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._refresh_lock = None
+        self.stats = {"refreshes": 0, "not_modified": 0, "errors": 0, "added": 0, "removed": 0}
+
+    def subscribe(self, listener):
+        """
+        listener(added, removed)：两个参数都是 symbol 列表，只在活跃合约集合变化时调用
+        """
+        self._listeners.append(listener)
+        return listener
+
+    @property
+    def age(self):
+        return time.time() - self.checked_at if self.checked_at else None
+
+    def is_fresh(self):
+        return bool(self._contracts) and time.time() - self.checked_at <= self.ttl
+
+    def symbols(self, quote="USDT"):
+        with self._lock:
+            return [s for s, c in self._contracts.items() if _active(c, quote)]
+
+    def get(self, symbol):
+        return self._contracts.get(symbol)
+
+    def __len__(self):
+        return len(self._contracts)
+
+    # ✅ 冷启动：读取上次保存的合约列表，文件未过期时启动阶段完全不请求 exchangeInfo
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            print("❌ 读取合约缓存失败:", e)
+            return False
+        with self._lock:
+            self._contracts = {c["symbol"]: c for c in saved.get("contracts", [])}
+            self._etag = saved.get("etag")
+            self._last_modified = saved.get("lastModified")
+            self.checked_at = saved.get("checkedAt", 0.0)
+        print(f"✅ 已从本地缓存加载 {len(self._contracts)} 个合约")
+        return True
+
+    def _save(self):
+        with self._lock:
+            payload = {
+                "etag": self._etag,
+                "lastModified": self._last_modified,
+                "checkedAt": self.checked_at,
+                "contracts": list(self._contracts.values()),
+            }
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("❌ 保存合约缓存失败:", e)
+
+    def apply(self, items):
+        """
+        用 exchangeInfo 的 symbols 列表整体替换，返回 (新增, 下架) 的活跃 symbol 列表
+        """
+        contracts = {item["symbol"]: _contract(item) for item in items}
+        with self._lock:
+            before = {s for s, c in self._contracts.items() if _active(c)}
+            self._contracts = contracts
+        after = {s for s, c in contracts.items() if _active(c)}
+        added, removed = sorted(after - before), sorted(before - after)
+        if added or removed:
+            self.stats["added"] += len(added)
+            self.stats["removed"] += len(removed)
+            self._notify(added, removed)
+        return added, removed
+
+    def _apply_and_save(self, resp):
+        added, removed = self.apply(resp.json()["symbols"])
+        self._save()
+        return added, removed
+
+    def _notify(self, added, removed):
+        for listener in self._listeners:
+            try:
+                listener(added, removed)
+            except Exception as e:
+                print("❌ 合约变更通知失败:", e)
+
+    async def refresh(self, fetcher, force=False):
+        """
+        过期才重新校验；服务端返回 304 时只刷新校验时间，失败时继续使用旧列表
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if not force and self.is_fresh():
+                return False
+            headers = {}
+            if self._contracts:
+                if self._etag:
+                    headers["If-None-Match"] = self._etag
+                if self._last_modified:
+                    headers["If-Modified-Since"] = self._last_modified
+            try:
+                resp = await fetcher.request(EXCHANGE_INFO_PATH, weight=EXCHANGE_INFO_WEIGHT, headers=headers or None)
+            except BinanceAPIError as e:
+                self.stats["errors"] += 1
+                print("❌ 合约列表刷新失败，继续使用缓存:", e)
+                return False
+            self.checked_at = time.time()
+            # 解析几 MB 的 exchangeInfo 和写缓存文件都放到线程池，不阻塞抓取所在的事件循环（ASGI 模式下就是服务器的循环）
+            loop = asyncio.get_running_loop()
+            if resp.status_code == 304:
+                self.stats["not_modified"] += 1
+                await loop.run_in_executor(None, self._save)
+                return False
+            self._etag = resp.headers.get("ETag")
+            self._last_modified = resp.headers.get("Last-Modified")
+            added, removed = await loop.run_in_executor(None, self._apply_and_save, resp)
+            self.stats["refreshes"] += 1
+            if added or removed:
+                print(f"✅ 合约列表已更新：新增 {len(added)} 个，下架 {len(removed)} 个")
+            return True
+
+    async def get_symbols(self, fetcher, quote="USDT"):
+        await self.refresh(fetcher)
+        return self.symbols(quote)
+
+
+symbol_registry = SymbolRegistry()
@@ -0,0 +1,210 @@
+# write_behind.py
+
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from db import engine, session_scope, dialect_insert, Price, OpenInterest, PriceData, DerivedMetric, FundingRate
+from metrics import registry, write_flush_seconds, write_rows_total
+
+# 攒够这么多行或者距上次落库超过这么多秒就写一次
+WRITE_BATCH_ROWS = int(os.environ.get("WRITE_BATCH_ROWS", 5000))
+WRITE_FLUSH_SECONDS = float(os.environ.get("WRITE_FLUSH_SECONDS", 2.0))
+# 队列按批次计数，超过上限时丢弃新批次，保证生产者永不阻塞
+WRITE_QUEUE_MAX = int(os.environ.get("WRITE_QUEUE_MAX", 1000))
+
+# 目标表 -> (模型, 冲突列, 冲突时更新的列)；冲突列为 None 表示直接追加
+TARGETS = {
+    "price": (Price, ("symbol", "timestamp"), ("price",)),
+    "open_interest": (OpenInterest, ("symbol", "timestamp"), ("open_interest", "change_pct")),
+    "price_data": (PriceData, None, None),
+    "derived_metrics": (DerivedMetric, ("symbol", "timestamp"), (
+        "open_interest_notional", "mark_price", "index_price", "basis", "funding_rate",
+        "notional_zscore", "basis_zscore", "funding_zscore",
+    )),
+    "funding_rate": (FundingRate, ("symbol", "timestamp"), ("funding_rate",)),
+}
+
+
+def _columns(model):
+    return [c.name for c in model.__table__.columns if not (c.primary_key and c.autoincrement is True)]
+
+
+# ✅ PostgreSQL：COPY 到临时表，再一次性 INSERT ... ON CONFLICT 合并到目标表
+def copy_rows(model, conflict, update, rows):
+    table = model.__tablename__
+    columns = [c for c in _columns(model) if any(c in row for row in rows)]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([
+            "" if row.get(c) is None else (row[c].isoformat(sep=" ") if hasattr(row[c], "isoformat") else row[c])
+            for c in columns
+        ])
+    buf.seek(0)
+
+    col_list = ", ".join(f'"{c}"' for c in columns)
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        if conflict is None:
+            cur.copy_expert(f"COPY {table} ({col_list}) FROM STDIN WITH (FORMAT csv)", buf)
+        else:
+            staging = f"{table}_staging"
+            cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+            cur.copy_expert(f"COPY {staging} ({col_list}) FROM STDIN WITH (FORMAT csv)", buf)
+            conflict_list = ", ".join(f'"{c}"' for c in conflict)
+            set_list = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in update if c in columns)
+            action = f"DO UPDATE SET {set_list}" if set_list else "DO NOTHING"
+            cur.execute(
+                f"INSERT INTO {table} ({col_list}) "
+                f"SELECT {col_list} FROM {staging} "
+                f"ON CONFLICT ({conflict_list}) {action}"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ✅ 其他数据库（SQLite）：executemany
+def executemany_rows(model, conflict, update, rows):
+    with session_scope() as session:
+        stmt = dialect_insert(model)
+        if conflict is not None:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(conflict),
+                set_={c: stmt.excluded[c] for c in update},
+            )
+        session.execute(stmt, rows)
+
+
+# 同一批里可能有重复主键（ON CONFLICT 不允许同一语句更新同一行两次），只保留最后出现的一条
+def _dedupe(conflict, rows):
+    if conflict is None:
+        return rows
+    latest = {}
+    for row in rows:
+        latest[tuple(row[c] for c in conflict)] = row
+    return list(latest.values())
+
+
+# ✅ 同步写入一批行：落库线程和基准测试共用
+def write_rows(target, rows):
+    model, conflict, update = TARGETS[target]
+    rows = _dedupe(conflict, rows)
+    write = copy_rows if engine.dialect.name == "postgresql" else executemany_rows
+    write(model, conflict, update, rows)
+    return len(rows)
+
+
+# ✅ 异步落库队列：生产者只负责入队，由单个写线程按行数 / 时间攒批后写入
+class WriteBehind:
+    def __init__(self, batch_rows=WRITE_BATCH_ROWS, flush_seconds=WRITE_FLUSH_SECONDS, queue_max=WRITE_QUEUE_MAX):
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {
+            "rows_enqueued": 0,
+            "rows_written": 0,
+            "rows_dropped": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "last_flush_seconds": 0.0,
+            "last_flush_rows": 0,
+            "rows_per_second": 0.0,
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, target, rows):
+        """
+        非阻塞：队列满时丢弃这一批并计数
+        """
+        if target not in TARGETS:
+            raise ValueError(f"未知的落库目标: {target}")
+        if not rows:
+            return True
+        self.start()
+        try:
+            self._queue.put_nowait((target, list(rows)))
+            self.stats["rows_enqueued"] += len(rows)
+            return True
+        except queue.Full:
+            self.stats["rows_dropped"] += len(rows)
+            write_rows_total.inc(len(rows), target=target, outcome="dropped")
+            print(f"❌ 落库队列已满，丢弃 {target} {len(rows)} 行")
+            return False
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def snapshot_stats(self):
+        return dict(self.stats, queue_depth=self.queue_depth)
+
+    def _run(self):
+        pending = {}
+        pending_rows = 0
+        deadline = time.time() + self.flush_seconds
+        while True:
+            timeout = max(deadline - time.time(), 0)
+            try:
+                target, rows = self._queue.get(timeout=timeout)
+                if target is None:
+                    self._flush(pending)
+                    return
+                pending.setdefault(target, []).extend(rows)
+                pending_rows += len(rows)
+            except queue.Empty:
+                pass
+            if pending_rows >= self.batch_rows or time.time() >= deadline:
+                self._flush(pending)
+                pending = {}
+                pending_rows = 0
+                deadline = time.time() + self.flush_seconds
+
+    def _flush(self, pending):
+        for target, rows in pending.items():
+            start = time.time()
+            try:
+                written = write_rows(target, rows)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                write_rows_total.inc(len(rows), target=target, outcome="error")
+                print(f"❌ 批量写入 {target} 失败（{len(rows)} 行）:", e)
+                continue
+            elapsed = time.time() - start
+            write_flush_seconds.observe(elapsed, target=target)
+            write_rows_total.inc(written, target=target, outcome="written")
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += written
+            self.stats["last_flush_seconds"] = round(elapsed, 4)
+            self.stats["last_flush_rows"] = written
+            rate = written / elapsed if elapsed > 0 else 0.0
+            # 写入速率做指数平滑
+            self.stats["rows_per_second"] = round(0.8 * self.stats["rows_per_second"] + 0.2 * rate, 1)
+
+    def stop(self, timeout=10):
+        """
+        进程退出前把队列里剩余的数据写完
+        """
+        if not self._thread or not self._thread.is_alive():
+            return
+        self._queue.put((None, None), timeout=timeout)
+        self._thread.join(timeout)
+
+
+write_behind = WriteBehind()
+registry.gauge("write_queue_depth", "异步落库队列中等待写入的批次数", callback=lambda: write_behind.queue_depth)
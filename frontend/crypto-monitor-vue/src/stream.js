@@ -0,0 +1,53 @@
+// src/stream.js
+import API from './api'
+
+// ✅ 全局共享一个 EventSource，所有组件按事件名订阅后端推送
+let source = null
+const handlers = {}
+const fallbacks = new Set()
+let fallbackTimer = null
+
+const startFallback = () => {
+  if (fallbackTimer || fallbacks.size === 0) return
+  // SSE 不可用时退回 30 秒轮询
+  fallbackTimer = setInterval(() => fallbacks.forEach(fn => fn()), 30000)
+}
+
+const stopFallback = () => {
+  clearInterval(fallbackTimer)
+  fallbackTimer = null
+}
+
+const listen = (event) => {
+  source.addEventListener(event, (e) => {
+    const payload = JSON.parse(e.data)
+    ;(handlers[event] || []).forEach(fn => fn(payload))
+  })
+}
+
+const connect = () => {
+  if (typeof EventSource === 'undefined') {
+    startFallback()
+    return
+  }
+  source = new EventSource(`${API.defaults.baseURL}/api/stream`)
+  source.onopen = stopFallback
+  source.onerror = startFallback
+  // 落后太多被服务端踢掉时，重新连接拿最新快照
+  source.addEventListener('evicted', () => {
+    source.close()
+    source = null
+    connect()
+  })
+  Object.keys(handlers).forEach(listen)
+}
+
+export function subscribe(event, handler, fallback) {
+  if (!handlers[event]) {
+    handlers[event] = []
+    if (source) listen(event)
+  }
+  handlers[event].push(handler)
+  if (fallback) fallbacks.add(fallback)
+  if (!source) connect()
+}